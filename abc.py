@@ -3,6 +3,13 @@ from abc import ABC, abstractmethod
 from redbot.core import Config
 from redbot.core.bot import Red
 
+from .cache import EmbedCache
+from .dispatcher import MenuDispatcher
+from .locks import UserLocks
+from .migrations import MigrationRunner
+from .spawns import SpawnAccumulator
+from .trades import TradeBook
+
 
 class MixinMeta(ABC):
     """Base class for well behaved type hint detection with composite class.
@@ -14,8 +21,13 @@ class MixinMeta(ABC):
         self.bot: Red
         self.datapath: str
         self.spawnedpokemon: dict
-        self.maybe_spawn: dict
+        self.spawnaccumulator: SpawnAccumulator
         self.guildcache: dict
+        self.migrations: MigrationRunner
+        self.userlocks: UserLocks
+        self.trades: TradeBook
+        self.dispatcher: MenuDispatcher
+        self.embedcache: EmbedCache
 
     @abstractmethod
     async def is_global(self):
@@ -29,6 +41,30 @@ class MixinMeta(ABC):
     def pokemon_choose(self):
         raise NotImplementedError
 
+    @abstractmethod
+    def install_catalog(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def start_spawn_loop(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    def stop_spawn_loop(self):
+        raise NotImplementedError
+
     @abstractmethod
     def get_name(self):
         raise NotImplementedError
+
+    @abstractmethod
+    async def fetch_slot(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def count_pokemon(self):
+        raise NotImplementedError
+
+    @abstractmethod
+    async def release_pokemon(self):
+        raise NotImplementedError
@@ -0,0 +1,437 @@
+"""Load harness for the cog's hot paths.
+
+Runs the real cog against in-process stand-ins for the bot, guilds, channels,
+members, messages and Config, with a throwaway SQLite database. Nothing is
+sent over the network. From the directory containing the cog::
+
+    python -m fakemoncord.bench --rate 200 --duration 30 --guilds 20 --users 2000
+
+Reports handler latency, event loop lag, database queries per message and
+the achieved throughput.
+"""
+
+import argparse
+import asyncio
+import copy
+import itertools
+import random
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+from unittest import mock
+
+import discord
+import tabulate
+
+from . import fakemoncord as cogmodule
+from .catalog import Pokemon
+from .functions import pokemon_values
+from .statements import INSERT_POKEMON
+
+_ids = itertools.count(10**17)
+
+
+class _ValueContext:
+    def __init__(self, value: "_Value"):
+        self.value = value
+        self.raw = None
+
+    def __await__(self):
+        return self._get().__await__()
+
+    async def _get(self):
+        return copy.deepcopy(self.value.get())
+
+    async def __aenter__(self):
+        self.raw = copy.deepcopy(self.value.get())
+        return self.raw
+
+    async def __aexit__(self, *exc):
+        await self.value.set(self.raw)
+
+
+class _Value:
+    def __init__(self, group: "_Group", key: str):
+        self.group = group
+        self.key = key
+
+    def get(self):
+        return self.group.data.get(self.key, self.group.defaults[self.key])
+
+    def __call__(self):
+        return _ValueContext(self)
+
+    async def set(self, value):
+        self.group.data[self.key] = copy.deepcopy(value)
+
+    async def clear(self):
+        self.group.data.pop(self.key, None)
+
+
+class _Group:
+    def __init__(self, data: dict, defaults: dict):
+        self.data = data
+        self.defaults = defaults
+
+    def __getattr__(self, key):
+        if key not in self.defaults:
+            raise AttributeError(key)
+        return _Value(self, key)
+
+    async def all(self):
+        return copy.deepcopy({**self.defaults, **self.data})
+
+
+class FakeConfig:
+    """The subset of Red's Config the cog uses, kept in memory."""
+
+    def __init__(self):
+        self._defaults: Dict[str, dict] = {}
+        self._data: Dict[str, Dict[object, dict]] = {}
+        self.calls = 0
+
+    @classmethod
+    def get_conf(cls, *args, **kwargs):
+        return cls()
+
+    def _register(self, scope: str, values: dict):
+        self._defaults[scope] = values
+        self._data.setdefault(scope, {})
+
+    def register_global(self, **values):
+        self._register("global", values)
+
+    def register_guild(self, **values):
+        self._register("guild", values)
+
+    def register_user(self, **values):
+        self._register("user", values)
+
+    def register_member(self, **values):
+        self._register("member", values)
+
+    def register_channel(self, **values):
+        self._register("channel", values)
+
+    def _group(self, scope: str, key) -> _Group:
+        self.calls += 1
+        return _Group(self._data[scope].setdefault(key, {}), self._defaults[scope])
+
+    def __getattr__(self, key):
+        if key.startswith("_"):
+            raise AttributeError(key)
+        return getattr(self._group("global", None), key)
+
+    def guild(self, guild):
+        return self._group("guild", guild.id)
+
+    def user(self, user):
+        return self._group("user", user.id)
+
+    def user_from_id(self, user_id: int):
+        return self._group("user", user_id)
+
+    def member(self, member):
+        return self._group("member", (member.guild.id, member.id))
+
+    def channel(self, channel):
+        return self._group("channel", channel.id)
+
+    def channel_from_id(self, channel_id: int):
+        return self._group("channel", channel_id)
+
+    async def _all(self, scope: str):
+        self.calls += 1
+        defaults = self._defaults[scope]
+        return {
+            key: copy.deepcopy({**defaults, **data}) for key, data in self._data[scope].items()
+        }
+
+    async def all_users(self):
+        return await self._all("user")
+
+    async def all_guilds(self):
+        return await self._all("guild")
+
+    async def all_channels(self):
+        return await self._all("channel")
+
+
+class FakeBot:
+    def __init__(self):
+        self.loop = asyncio.get_event_loop()
+        self._guilds: Dict[int, "FakeGuild"] = {}
+
+    @property
+    def guilds(self) -> List["FakeGuild"]:
+        return list(self._guilds.values())
+
+    async def wait_until_ready(self):
+        return
+
+    def get_guild(self, guild_id: int):
+        return self._guilds.get(guild_id)
+
+    async def get_valid_prefixes(self, guild=None):
+        await asyncio.sleep(0)
+        return ["!"]
+
+    async def get_embed_color(self, location):
+        await asyncio.sleep(0)
+        return discord.Colour.red()
+
+
+class FakeGuild:
+    def __init__(self, channels: int):
+        self.id = next(_ids)
+        self.channels = [FakeChannel(self) for _ in range(channels)]
+        self.members: List["FakeMember"] = []
+
+    def get_channel(self, channel_id: int):
+        return next((x for x in self.channels if x.id == channel_id), None)
+
+    def get_member(self, user_id: int):
+        return next((x for x in self.members if x.id == user_id), None)
+
+    def __str__(self):
+        return f"guild-{self.id}"
+
+
+class FakeMessage:
+    def __init__(self, channel, author=None, embeds=()):
+        self.id = next(_ids)
+        self.channel = channel
+        self.guild = channel.guild
+        self.author = author
+        self.embeds = list(embeds)
+
+
+class FakeChannel:
+    def __init__(self, guild: FakeGuild):
+        self.id = next(_ids)
+        self.guild = guild
+        self.sent = 0
+
+    async def send(self, content=None, *, embed=None, file=None, **kwargs):
+        self.sent += 1
+        embeds = []
+        if embed is not None:
+            embed = embed.copy()
+            if file is not None and embed.image.url == f"attachment://{file.filename}":
+                # Discord serves the attachment from its CDN, mimic the rewritten URL.
+                embed.set_image(url=f"https://cdn.invalid/attachments/{self.id}/{file.filename}")
+            embeds.append(embed)
+        return FakeMessage(self, embeds=embeds)
+
+    def __str__(self):
+        return f"channel-{self.id}"
+
+
+class FakeMember:
+    bot = False
+
+    def __init__(self, guild: FakeGuild):
+        self.id = next(_ids)
+        self.guild = guild
+        self.display_name = f"trainer-{self.id}"
+        self.mention = f"<@{self.id}>"
+        guild.members.append(self)
+
+
+class FakeContext:
+    clean_prefix = "!"
+
+    def __init__(self, author: FakeMember, channel: FakeChannel):
+        self.author = author
+        self.channel = channel
+        self.guild = channel.guild
+        self.message = FakeMessage(channel, author)
+
+    async def send(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.queries: Dict[str, int] = {}
+
+    async def time(self, name: str, coro):
+        start = time.perf_counter()
+        try:
+            await coro
+        finally:
+            self.latencies.setdefault(name, []).append(time.perf_counter() - start)
+
+    def count_queries(self, cursor):
+        # fetch_one and fetch_val go through fetch_all, count each query once at that layer.
+        for method in ("fetch_all", "execute", "execute_many"):
+            setattr(cursor, method, self._counted(method, getattr(cursor, method)))
+
+    def _counted(self, name: str, func):
+        async def wrapper(*args, **kwargs):
+            self.queries[name] = self.queries.get(name, 0) + 1
+            return await func(*args, **kwargs)
+
+        return wrapper
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def measure_lag(samples: List[float], interval: float = 0.01):
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - start - interval)
+
+
+async def seed(cog, users: List[FakeMember], collection: int):
+    """Give every trainer a starter flag and `collection` Pokémon."""
+    for user in users:
+        await cog.config.user(user).has_starter.set(True)
+        rows = [
+            pokemon_values(
+                Pokemon(cog.pokemon_choose(), level=random.randint(1, 100)),
+                user_id=user.id,
+                message_id=next(_ids),
+            )
+            for _ in range(collection)
+        ]
+        async with cog.cursor.transaction():
+            await cog.cursor.execute_many(query=INSERT_POKEMON, values=rows)
+
+
+async def run(args) -> dict:
+    random.seed(args.seed)
+    tmp = tempfile.TemporaryDirectory()
+    bot = FakeBot()
+    with mock.patch.object(cogmodule, "Config", FakeConfig), mock.patch.object(
+        cogmodule, "cog_data_path", lambda *_args, **_kwargs: Path(tmp.name)
+    ):
+        cog = cogmodule.Fakemoncord(bot)
+    guilds = [FakeGuild(args.channels) for _ in range(args.guilds)]
+    for guild in guilds:
+        bot._guilds[guild.id] = guild
+        await cog.config.guild(guild).toggle.set(True)
+    await cog.initalize()
+    users = [FakeMember(random.choice(guilds)) for _ in range(args.users)]
+    await seed(cog, users, args.collection)
+
+    recorder = Recorder()
+    recorder.count_queries(cog.cursor)
+    config_calls = cog.config.calls
+    lag: List[float] = []
+    lag_task = asyncio.ensure_future(measure_lag(lag))
+    tasks = set()
+
+    async def handle(user: FakeMember):
+        channel = random.choice(user.guild.channels)
+        message = FakeMessage(channel, user)
+        await recorder.time("on_message", cog.on_message_without_command(message))
+        spawned = cog.spawns.get(channel.id)
+        if spawned is None:
+            return
+        if random.random() < args.hint_rate:
+            ctx = FakeContext(user, channel)
+            await cog.cog_before_invoke(ctx)
+            await recorder.time("fhint", cog.fhint.callback(cog, ctx))
+        if random.random() < args.catch_rate:
+            ctx = FakeContext(user, channel)
+            await cog.cog_before_invoke(ctx)
+            await recorder.time("fc", cog.fc.callback(cog, ctx, pokemon=spawned.name))
+
+    total = int(args.rate * args.duration)
+    start = time.perf_counter()
+    for i in range(total):
+        delay = start + i / args.rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        task = asyncio.ensure_future(handle(random.choice(users)))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks)
+    await cog.flush_xp()
+    elapsed = time.perf_counter() - start
+
+    lag_task.cancel()
+    cog.stop_spawn_loop()
+    cog.xp_flush_task.cancel()
+    cog.spawn_table_task.cancel()
+    await cog.close()
+    tmp.cleanup()
+    return {
+        "messages": total,
+        "elapsed": elapsed,
+        "latencies": recorder.latencies,
+        "queries": recorder.queries,
+        "config_calls": cog.config.calls - config_calls,
+        "lag": lag,
+        "spawns": sum(channel.sent for guild in guilds for channel in guild.channels),
+    }
+
+
+def report(result: dict) -> str:
+    ms = 1000
+    rows = [
+        [
+            name,
+            len(values),
+            f"{percentile(values, 50) * ms:.2f}",
+            f"{percentile(values, 99) * ms:.2f}",
+            f"{max(values) * ms:.2f}",
+        ]
+        for name, values in sorted(result["latencies"].items())
+    ]
+    lag = result["lag"]
+    rows.append(
+        [
+            "loop lag",
+            len(lag),
+            f"{percentile(lag, 50) * ms:.2f}",
+            f"{percentile(lag, 99) * ms:.2f}",
+            f"{max(lag, default=0) * ms:.2f}",
+        ]
+    )
+    messages = result["messages"]
+    queries = sum(result["queries"].values())
+    summary = [
+        ["Messages", messages],
+        ["Throughput (msg/s)", f"{messages / result['elapsed']:.1f}"],
+        ["Channel sends", result["spawns"]],
+        ["DB queries / message", f"{queries / messages:.3f}"],
+        ["Config calls / message", f"{result['config_calls'] / messages:.3f}"],
+        *[[f"  {name}", count] for name, count in sorted(result["queries"].items())],
+    ]
+    return "\n\n".join(
+        (
+            tabulate.tabulate(rows, headers=["Handler", "Calls", "p50 ms", "p99 ms", "Max ms"]),
+            tabulate.tabulate(summary),
+        )
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fakemoncord load harness")
+    parser.add_argument("--rate", type=float, default=200, help="Messages per second")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds to run for")
+    parser.add_argument("--guilds", type=int, default=10)
+    parser.add_argument("--channels", type=int, default=3, help="Channels per guild")
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--collection", type=int, default=100, help="Pokémon per trainer")
+    parser.add_argument("--catch-rate", type=float, default=0.5)
+    parser.add_argument("--hint-rate", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    result = asyncio.run(run(args))
+    print(report(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+
+import discord
+from redbot.core import Config
+
+log = logging.getLogger("red.flare.fakemoncord.cache")
+
+
+class _CacheEntry:
+    __slots__ = ("data", "seen")
+
+    def __init__(self, data: dict):
+        self.data = data
+        self.seen = time.monotonic()
+
+
+class UserCache:
+    """Lazily loaded, size bounded cache of trainer settings.
+
+    Entries are loaded from Config on first use, patched in place when a
+    setting changes and evicted once idle or when the cache is full."""
+
+    def __init__(self, config: Config, *, maxsize: int = 10000, idle_timeout: int = 3600):
+        self.config = config
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self._entries: "OrderedDict[int, _CacheEntry]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, user_id: int):
+        return user_id in self._entries
+
+    def get(self, user_id: int) -> Optional[dict]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        entry.seen = time.monotonic()
+        self._entries.move_to_end(user_id)
+        return entry.data
+
+    async def load(self, user_id: int) -> dict:
+        data = self.get(user_id)
+        if data is not None:
+            return data
+        data = await self.config.user_from_id(user_id).all()
+        existing = self.get(user_id)
+        if existing is not None:  # Loaded by someone else while we were waiting
+            return existing
+        self._entries[user_id] = _CacheEntry(data)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return data
+
+    def update(self, user_id: int, **values):
+        """Patch a cached entry, uncached users are loaded fresh on their next use."""
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            entry.data.update(values)
+
+    def evict_idle(self):
+        cutoff = time.monotonic() - self.idle_timeout
+        while self._entries:
+            user_id, entry = next(iter(self._entries.items()))
+            if entry.seen > cutoff:
+                break
+            del self._entries[user_id]
+
+    def clear(self):
+        self._entries.clear()
+
+
+class EmbedCache:
+    """Rendered parts of Pokémon embeds, keyed by row, row version and locale.
+
+    Any update of a row bumps its version, so an outdated entry is never
+    hit again and simply ages out of the LRU."""
+
+    def __init__(self, *, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[Hashable, Tuple[str, str, Optional[str]]]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Tuple[str, str, Optional[str]]]:
+        parts = self._entries.get(key)
+        if parts is not None:
+            self._entries.move_to_end(key)
+        return parts
+
+    def set(self, key: Hashable, parts: Tuple[str, str, Optional[str]]):
+        self._entries[key] = parts
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class SpawnCache:
+    """In-memory pieces of a spawn message so posting one needs no disk or config reads.
+
+    Holds the bytes of recently spawned images, the localized embed text per
+    species, each guild's prefix and embed colour for `presentation_ttl`
+    seconds, and the CDN URL of an image once Discord hosts it so later
+    spawns of that species skip the upload for `upload_ttl` seconds."""
+
+    def __init__(
+        self,
+        datapath: str,
+        *,
+        max_images: int = 256,
+        presentation_ttl: int = 300,
+        upload_ttl: int = 3600,
+    ):
+        self.datapath = datapath
+        self.max_images = max_images
+        self.presentation_ttl = presentation_ttl
+        self.upload_ttl = upload_ttl
+        self._images: "OrderedDict[str, bytes]" = OrderedDict()
+        self.templates: Dict[Hashable, Tuple[str, str, str]] = {}
+        self._presentation: Dict[int, Tuple[float, str, discord.Colour]] = {}
+        self._uploads: Dict[Hashable, Tuple[float, str, int]] = {}
+        self._upload_messages: Dict[int, Hashable] = {}
+
+    def image(self, name: str) -> bytes:
+        data = self._images.get(name)
+        if data is not None:
+            self._images.move_to_end(name)
+            return data
+        with open(f"{self.datapath}/pokemon/{name}.png", "rb") as f:
+            data = f.read()
+        self._images[name] = data
+        while len(self._images) > self.max_images:
+            self._images.popitem(last=False)
+        return data
+
+    def presentation(self, guild_id: int) -> Optional[Tuple[str, discord.Colour]]:
+        entry = self._presentation.get(guild_id)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1], entry[2]
+
+    def set_presentation(self, guild_id: int, prefix: str, colour: discord.Colour):
+        self._presentation[guild_id] = (
+            time.monotonic() + self.presentation_ttl,
+            prefix,
+            colour,
+        )
+
+    def clear_presentation(self):
+        self._presentation.clear()
+
+    def upload(self, key: Hashable) -> Optional[str]:
+        """The hosted image URL of a species, if one is still fresh."""
+        entry = self._uploads.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            self._forget_upload(key)
+            return None
+        return entry[1]
+
+    def remember_upload(self, key: Hashable, url: str, message_id: int):
+        self._forget_upload(key)
+        self._uploads[key] = (time.monotonic() + self.upload_ttl, url, message_id)
+        self._upload_messages[message_id] = key
+
+    def message_deleted(self, message_id: int):
+        """Drop a hosted image once the message it was uploaded with is gone."""
+        key = self._upload_messages.get(message_id)
+        if key is not None:
+            self._forget_upload(key)
+
+    def _forget_upload(self, key: Hashable):
+        entry = self._uploads.pop(key, None)
+        if entry is not None:
+            self._upload_messages.pop(entry[2], None)
+
+    def clear(self):
+        self._images.clear()
+        self.templates.clear()
+        self._presentation.clear()
+        self._uploads.clear()
+        self._upload_messages.clear()
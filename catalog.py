@@ -0,0 +1,496 @@
+import hashlib
+import json
+import logging
+import mmap
+import os
+import pickle
+import sys
+import unicodedata
+from numbers import Real
+from typing import Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+from .functions import GENDER_CODES, IV_BITS, STAT_BITS, STATS, random_ivs, unpack_stats
+
+log = logging.getLogger("red.flare.fakemoncord.catalog")
+
+# Bump whenever the layout of the compiled catalog changes.
+CATALOG_VERSION = 3
+# Species files, merged in this order.
+SPECIES_SOURCES = (
+    "pokedex.json",
+    "shiny.json",
+    "legendary.json",
+    "mythical.json",
+    "galarian.json",
+    "hisuian.json",
+    "alolan.json",
+    "megas.json",
+)
+CATALOG_SOURCES = (
+    *SPECIES_SOURCES,
+    "evolve.json",
+    "genders.json",
+    "starters.json",
+    "url.json",
+)
+
+SpeciesKey = Tuple[int, Optional[str], Optional[str]]
+
+# Languages a species can be named in, `Species.names` follows this order.
+LANGUAGES = ("english", "french", "chinese", "japanese")
+# Trainer locale setting -> index into `Species.names`.
+LOCALES = {"en": 0, "fr": 1, "tw": 2, "cn": 2, "jp": 3}
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if value else None
+
+
+def normalize_answer(text: str) -> str:
+    """Fold case and Unicode compatibility forms and drop punctuation and extra spaces."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = "".join(c for c in text if not unicodedata.category(c).startswith("P"))
+    return " ".join(text.split())
+
+
+def _answers(names: Iterable[Optional[str]]) -> FrozenSet[str]:
+    """Every normalized spelling that catches a species, Latin names also without accents."""
+    answers = set()
+    for name in names:
+        if not name:
+            continue
+        answer = normalize_answer(name)
+        answers.add(answer)
+        plain = "".join(
+            c for c in unicodedata.normalize("NFD", answer) if not unicodedata.combining(c)
+        )
+        if plain.isascii():
+            answers.add(plain)
+    answers.discard("")
+    return frozenset(answers)
+
+
+class Species:
+    """An immutable catalog entry.
+
+    A single instance exists per species and is shared by reference by every
+    Pokémon of it, anything that differs between two Pokémon lives on `Pokemon`.
+    `display` holds the name shown for each language, English where a name is
+    missing, and `answers` the normalized spellings `fc` accepts."""
+
+    __slots__ = (
+        "id",
+        "names",
+        "types",
+        "stats",
+        "spawnchance",
+        "variant",
+        "alias",
+        "url",
+        "key",
+        "display",
+        "answers",
+    )
+
+    def __init__(
+        self,
+        id: int,
+        names: Sequence[Optional[str]],
+        *,
+        types: Sequence[str] = (),
+        stats: Sequence[int] = (0,) * len(STATS),
+        spawnchance: float = 0,
+        variant: str = None,
+        alias: str = None,
+        url: str = None,
+    ):
+        variant = _intern(variant)
+        alias = alias or None
+        names = tuple(names)
+        for attr, value in (
+            ("id", id),
+            ("names", names),
+            ("types", tuple(sys.intern(x) for x in types)),
+            ("stats", tuple(stats)),
+            ("spawnchance", spawnchance),
+            ("variant", variant),
+            ("alias", alias),
+            ("url", url),
+            ("key", (id, variant, alias)),
+            (
+                "display",
+                tuple(
+                    names[i] if i < len(names) and names[i] else names[0]
+                    for i in range(len(LANGUAGES))
+                ),
+            ),
+            ("answers", _answers((*names, alias))),
+        ):
+            object.__setattr__(self, attr, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __getstate__(self):
+        # Keep the derived fields, so loading the cached catalog skips the normalization.
+        return tuple(getattr(self, attr) for attr in self.__slots__)
+
+    def __setstate__(self, state):
+        for attr, value in zip(self.__slots__, state):
+            object.__setattr__(self, attr, value)
+
+    def __repr__(self):
+        return f"<Species id={self.id} name={self.name!r} variant={self.variant!r}>"
+
+    @classmethod
+    def from_dict(cls, data: dict, *, url: str = None) -> "Species":
+        """Build a species from its entry in the bundled JSON files."""
+        stats = data.get("stats", {})
+        return cls(
+            data["id"],
+            [data["name"].get(language) for language in LANGUAGES],
+            types=data.get("type", ()),
+            stats=[int(stats.get(stat, 0)) for stat in STATS],
+            spawnchance=data.get("spawnchance", 0),
+            variant=data.get("variant"),
+            alias=data.get("alias"),
+            url=url,
+        )
+
+    @classmethod
+    def unknown(cls, species_id: int, variant: str = None, alias: str = None) -> "Species":
+        """Placeholder for stored Pokémon whose species is no longer in the catalog."""
+        return cls(species_id, ["Unknown"], variant=variant, alias=alias)
+
+    @property
+    def name(self) -> str:
+        return self.names[0]
+
+    @property
+    def languages(self) -> Tuple[str, ...]:
+        return tuple(language for language, name in zip(LANGUAGES, self.names) if name is not None)
+
+    @property
+    def image_name(self) -> str:
+        """The file name, without extension, of the species' bundled image."""
+        name = self.alias if self.variant and self.alias else self.name
+        return name.replace(":", "")
+
+    def localized(self, locale: str) -> str:
+        """The species' name for a trainer locale, falling back to English."""
+        return self.display[LOCALES.get(locale, 0)]
+
+
+class Pokemon:
+    """A caught Pokémon, its shared species plus the state that is unique to it.
+
+    `message_id` and `slot` identify the stored row, they are unset for a
+    Pokémon that hasn't been saved yet. `version` counts the row's updates."""
+
+    __slots__ = (
+        "species",
+        "level",
+        "xp",
+        "gender",
+        "nickname",
+        "ivs",
+        "stats",
+        "message_id",
+        "slot",
+        "version",
+    )
+
+    def __init__(
+        self,
+        species: Species,
+        *,
+        level: int = 1,
+        xp: int = 0,
+        gender: str = "N/A",
+        nickname: str = None,
+        ivs: Tuple[int, ...] = None,
+        stats: Tuple[int, ...] = None,
+        message_id: int = None,
+        slot: int = None,
+        version: int = 0,
+    ):
+        self.species = species
+        self.level = level
+        self.xp = xp
+        self.gender = gender
+        self.nickname = nickname
+        self.ivs = ivs if ivs is not None else random_ivs()
+        self.stats = stats if stats is not None else species.stats
+        self.message_id = message_id
+        self.slot = slot
+        self.version = version
+
+    def __repr__(self):
+        return f"<Pokemon species={self.species!r} level={self.level} slot={self.slot}>"
+
+    @classmethod
+    def from_row(cls, row, species: Species) -> "Pokemon":
+        """Build a Pokémon from a database row and the species it references."""
+        return cls(
+            species,
+            level=row["level"],
+            xp=row["xp"],
+            gender=GENDER_CODES[row["gender"]],
+            nickname=row["nickname"],
+            ivs=unpack_stats(row["ivs"], IV_BITS),
+            stats=unpack_stats(row["stats"], STAT_BITS),
+            message_id=row["message_id"],
+            slot=row["position"],
+            version=row["version"],
+        )
+
+    def to_dict(self) -> dict:
+        species = self.species
+        return {
+            "id": species.id,
+            "name": species.name,
+            "variant": species.variant,
+            "alias": species.alias,
+            "type": list(species.types),
+            "level": self.level,
+            "xp": self.xp,
+            "gender": self.gender,
+            "nickname": self.nickname,
+            "ivs": dict(zip(STATS, self.ivs)),
+            "stats": dict(zip(STATS, self.stats)),
+            "message_id": self.message_id,
+            "slot": self.slot,
+        }
+
+
+class SpeciesIndex:
+    """Lookup tables over the species catalog, built once when the catalog loads.
+
+    Where several entries share a key the first one in catalog order wins,
+    which keeps the regular form ahead of its variants."""
+
+    def __init__(self, pokemondata: Iterable[Species], starters: Sequence[Sequence[str]] = ()):
+        self.by_key: Dict[SpeciesKey, Species] = {}
+        self.by_id: Dict[int, List[Species]] = {}
+        self.by_name: Dict[Tuple[str, Optional[str]], Species] = {}
+        # Normalized answer -> species, aliases take precedence over names.
+        self.by_answer: Dict[str, Species] = {}
+        pokemondata = list(pokemondata)
+        for species in pokemondata:
+            self.by_key.setdefault(species.key, species)
+            self.by_id.setdefault(species.id, []).append(species)
+            self.by_name.setdefault((species.name, species.variant), species)
+            if species.alias:
+                for answer in _answers((species.alias,)):
+                    self.by_answer.setdefault(answer, species)
+        for species in pokemondata:
+            for answer in species.answers:
+                self.by_answer.setdefault(answer, species)
+        # Starter choices per generation, from the English names in starters.json.
+        self.generations: List[Tuple[Species, ...]] = []
+        missing = []
+        for names in starters:
+            generation = tuple(
+                self.by_name[(name, None)] for name in names if (name, None) in self.by_name
+            )
+            missing.extend(name for name in names if (name, None) not in self.by_name)
+            if generation:
+                self.generations.append(generation)
+        if missing:
+            log.warning("Starter Pokémon missing from the catalog: %s", ", ".join(missing))
+        self.starters: Dict[str, Species] = {
+            species.name.lower(): species
+            for generation in self.generations
+            for species in generation
+        }
+
+    def get(self, species_id: int, variant: str = None, alias: str = None) -> Optional[Species]:
+        species = self.by_key.get((species_id, variant, alias))
+        if species is None:
+            species = self.by_key.get((species_id, variant, None))
+        return species
+
+    def evolution(self, english: str, variant: str = None) -> Optional[Species]:
+        """The species a Pokémon evolves into, keeping its variant."""
+        return self.by_name.get((english, variant or None))
+
+    def find(self, name: str) -> Optional[Species]:
+        """Resolve an alias or a name in any language to a species."""
+        return self.by_answer.get(normalize_answer(name))
+
+
+DexEntry = Tuple[int, str]
+
+
+class Pokedex:
+    """Pokédex page skeletons, one entry per species id in dex order.
+
+    Pages only hold the species id and its field label, they are built the
+    first time a locale is shown and shared by every trainer using it. Caught
+    counts are overlaid when a page renders."""
+
+    def __init__(self, index: SpeciesIndex, per_page: int = 20):
+        self.per_page = per_page
+        self._species = [forms[0] for _, forms in sorted(index.by_id.items())]
+        self._pages: Dict[str, Tuple[Tuple[DexEntry, ...], ...]] = {}
+
+    def __len__(self):
+        return len(self._species)
+
+    def pages(self, locale: str) -> Tuple[Tuple[DexEntry, ...], ...]:
+        if locale not in LOCALES:
+            locale = "en"
+        pages = self._pages.get(locale)
+        if pages is None:
+            entries = [
+                (species.id, f"{species.localized(locale)} #{str(species.id).zfill(3)}")
+                for species in self._species
+            ]
+            pages = self._pages[locale] = tuple(
+                tuple(entries[i : i + self.per_page])
+                for i in range(0, len(entries), self.per_page)
+            )
+        return pages
+
+
+class Catalog:
+    """The merged contents of the bundled data files."""
+
+    __slots__ = ("species", "genders", "evolutions", "starters", "problems")
+
+    def __init__(
+        self,
+        species: Tuple[Species, ...],
+        genders: Dict[str, int],
+        evolutions: Dict[str, dict],
+        starters: List[List[str]],
+        problems: List[str],
+    ):
+        self.species = species
+        self.genders = genders
+        self.evolutions = evolutions
+        self.starters = starters
+        self.problems = problems
+
+
+def source_fingerprint(datapath: str) -> str:
+    """Identifies the current state of the source files without reading them."""
+    digest = hashlib.sha1(str(CATALOG_VERSION).encode())
+    for name in CATALOG_SOURCES:
+        stat = os.stat(os.path.join(datapath, name))
+        digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode())
+    return digest.hexdigest()
+
+
+def _validate(pokemon, source: str) -> Optional[str]:
+    if not isinstance(pokemon, dict):
+        return f"{source}: entry is not an object"
+    if not isinstance(pokemon.get("id"), int):
+        return f"{source}: entry without an integer id"
+    name = pokemon.get("name")
+    if not isinstance(name, dict) or not isinstance(name.get("english"), str):
+        return f"{source}: #{pokemon['id']} has no English name"
+    english = name["english"]
+    if not isinstance(pokemon.get("type"), list):
+        return f"{source}: {english} has no type list"
+    stats = pokemon.get("stats")
+    if not isinstance(stats, dict) or any(not isinstance(stats.get(stat), Real) for stat in STATS):
+        return f"{source}: {english} is missing stats"
+    if not isinstance(pokemon.get("spawnchance"), Real) or pokemon["spawnchance"] < 0:
+        return f"{source}: {english} has an invalid spawn chance"
+    return None
+
+
+def _species_url(pokemon: dict, urls: dict) -> Optional[str]:
+    english = pokemon["name"]["english"]
+    name = (pokemon.get("alias") or english) if pokemon.get("variant") else english
+    if "shiny" in name.lower():
+        return None
+    link = urls.get(name)
+    if isinstance(link, list):
+        link = link[0]
+    return link
+
+
+def build_catalog(datapath: str) -> Catalog:
+    """Merge and validate the JSON sources, invalid entries are skipped and reported."""
+
+    def read(name: str):
+        with open(os.path.join(datapath, name), encoding="utf-8") as f:
+            return json.load(f)
+
+    urls = read("url.json")
+    species = []
+    problems = []
+    seen = set()
+    for source in SPECIES_SOURCES:
+        for pokemon in read(source):
+            problem = _validate(pokemon, source)
+            if problem is not None:
+                problems.append(problem)
+                continue
+            entry = Species.from_dict(pokemon, url=_species_url(pokemon, urls))
+            if entry.key in seen:
+                problems.append(f"{source}: {entry.name} duplicates an earlier entry")
+                continue
+            seen.add(entry.key)
+            species.append(entry)
+    starters = read("starters.json")
+    if not isinstance(starters, list) or not all(
+        isinstance(names, list) and all(isinstance(name, str) for name in names)
+        for names in starters
+    ):
+        problems.append("starters.json: expected a list of generations of English names")
+        starters = []
+    return Catalog(tuple(species), read("genders.json"), read("evolve.json"), starters, problems)
+
+
+def write_catalog(catalog: Catalog, path: str, fingerprint: str):
+    """Atomically replace the compiled catalog at `path`."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump((CATALOG_VERSION, fingerprint, catalog), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+
+
+def rebuild_catalog(datapath: str, path: str) -> Catalog:
+    fingerprint = source_fingerprint(datapath)
+    catalog = build_catalog(datapath)
+    try:
+        write_catalog(catalog, path, fingerprint)
+    except OSError as exc:
+        log.warning("Couldn't write the compiled catalog to %s", path, exc_info=exc)
+    if catalog.problems:
+        log.warning(
+            "The species catalog has %s problem(s), first: %s",
+            len(catalog.problems),
+            catalog.problems[0],
+        )
+    return catalog
+
+
+def load_catalog(datapath: str, path: str) -> Catalog:
+    """Load the compiled catalog, rebuilding it from the sources when it is stale.
+
+    The artifact is memory-mapped and unpickled in one go, it is only ever
+    written by `write_catalog` into the cog's own data directory."""
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            version, fingerprint, catalog = pickle.loads(data)
+        if version == CATALOG_VERSION and fingerprint == source_fingerprint(datapath):
+            return catalog
+        log.info("Compiled catalog is stale, rebuilding it from the bundled data.")
+    except FileNotFoundError:
+        log.info("Compiling the species catalog.")
+    except Exception as exc:
+        log.warning("Couldn't read the compiled catalog, rebuilding it.", exc_info=exc)
+    return rebuild_catalog(datapath, path)
@@ -1,26 +1,51 @@
 import argparse
+import re
+from typing import Optional, Tuple
 
 from redbot.core.commands import BadArgument, Converter
 
+RANGE_RE = re.compile(r"^(?:(?P<op><=|>=|<|>|=)?(?P<low>\d+)(?:-(?P<high>\d+)|(?P<plus>\+))?)$")
+
 
 class NoExitParser(argparse.ArgumentParser):
     def error(self, message):
         raise BadArgument()
 
 
+def parse_range(argument: str) -> Optional[Tuple[int, int]]:
+    """Parse `50`, `50-60`, `>=150`, `<10` or `150+` into an inclusive range."""
+    argument = argument.replace(" ", "")
+    if not argument:
+        return None
+    match = RANGE_RE.match(argument)
+    if match is None:
+        raise BadArgument(f"`{argument}` is not a valid number or range.")
+    low = int(match["low"])
+    if match["high"] is not None:
+        return min(low, int(match["high"])), max(low, int(match["high"]))
+    if match["plus"] or match["op"] == ">=":
+        return low, None
+    if match["op"] == ">":
+        return low + 1, None
+    if match["op"] == "<=":
+        return None, low
+    if match["op"] == "<":
+        return None, low - 1
+    return low, low
+
+
 class Args(Converter):
     async def convert(self, ctx, argument):
         argument = argument.replace("—", "--")
         parser = NoExitParser(description="Fakemoncord Search", add_help=False)
 
-        pokemon = parser.add_mutually_exclusive_group()
-        pokemon.add_argument("--name", "--n", nargs="*", dest="names", default=[])
-        pokemon.add_argument("--level", "--l", nargs="*", dest="level", type=int, default=0)
-        pokemon.add_argument("--id", "--i", nargs="*", dest="id", type=int, default=0)
-        pokemon.add_argument("--variant", "--v", nargs="*", dest="variant", default=[])
-        pokemon.add_argument("--gender", "--g", nargs="*", dest="gender", default=[])
-        pokemon.add_argument("--iv", nargs="*", dest="iv", type=int, default=0)
-        pokemon.add_argument("--type", "--t", nargs="*", dest="type", default=[])
+        parser.add_argument("--name", "--n", nargs="*", dest="names", default=[])
+        parser.add_argument("--level", "--l", nargs="*", dest="level", default=[])
+        parser.add_argument("--id", "--i", nargs="*", dest="id", default=[])
+        parser.add_argument("--variant", "--v", nargs="*", dest="variant", default=[])
+        parser.add_argument("--gender", "--g", nargs="*", dest="gender", default=[])
+        parser.add_argument("--iv", nargs="*", dest="iv", default=[])
+        parser.add_argument("--type", "--t", nargs="*", dest="type", default=[])
 
         try:
             vals = vars(parser.parse_args(argument.split(" ")))
@@ -46,4 +71,7 @@ class Args(Converter):
         vals["variant"] = " ".join(vals["variant"])
         vals["gender"] = " ".join(vals["gender"])
         vals["type"] = " ".join(vals["type"])
+        vals["level"] = parse_range(" ".join(vals["level"]))
+        vals["id"] = parse_range(" ".join(vals["id"]))
+        vals["iv"] = parse_range(" ".join(vals["iv"]))
         return vals
@@ -1,4 +1,3 @@
-import json
 import pprint
 from typing import Optional
 
@@ -9,7 +8,10 @@ from redbot.core.i18n import Translator
 from redbot.core.utils.chat_formatting import *
 
 from .abc import MixinMeta
-from .pokemixin import poke
+from .catalog import Pokemon, rebuild_catalog
+from .functions import pokemon_values
+from .migrations import rebuild_trainer_stats, reconcile_dex_counts
+from .pokemixin import collection_ready, poke
 from .statements import *
 
 _ = Translator("Fakemoncord", __file__)
@@ -23,41 +25,92 @@ class Dev(MixinMeta):
     async def dev(self, ctx):
         """Fakemoncord Development Commands"""
 
+    @dev.command(name="fcatalog")
+    async def dev_catalog(self, ctx):
+        """Rebuild the compiled species catalog from the bundled data"""
+        async with ctx.typing():
+            catalog = await self.bot.loop.run_in_executor(
+                self._executor, rebuild_catalog, self.datapath, self.catalogpath
+            )
+            self.install_catalog(catalog)
+        msg = f"Catalog rebuilt with {len(catalog.species)} Pokémon."
+        if catalog.problems:
+            msg += f" {len(catalog.problems)} entries need attention:\n"
+            msg += "\n".join(catalog.problems)
+        for page in pagify(msg):
+            await ctx.send(page)
+
+    @dev.command(name="fmigrations")
+    async def dev_migrations(self, ctx):
+        """Show the progress of the storage migrations"""
+        rows = []
+        for progress in self.migrations.progress.values():
+            done = str(progress.processed)
+            if progress.total:
+                done += f"/{progress.total} ({progress.processed / progress.total:.0%})"
+            rows.append(
+                [
+                    progress.migration.version,
+                    progress.migration.name,
+                    progress.state,
+                    done,
+                    progress.checkpoint,
+                ]
+            )
+        msg = tabulate.tabulate(
+            rows, headers=["#", "Migration", "State", "Processed", "Checkpoint"]
+        )
+        errors = [
+            f"{progress.migration.version}: {progress.error}"
+            for progress in self.migrations.progress.values()
+            if progress.error
+        ]
+        if errors:
+            msg += "\n\n" + "\n".join(errors)
+        for page in pagify(msg):
+            await ctx.send(box(page))
+
+    @dev.command(name="fdexreconcile")
+    @collection_ready()
+    async def dev_dex_reconcile(self, ctx):
+        """Rebuild every Pokédex from the Pokémon trainers currently own"""
+        async with ctx.typing():
+            processed = await reconcile_dex_counts(self.cursor)
+        await ctx.send(f"Rebuilt the Pokédex counts of {processed} trainers.")
+
+    @dev.command(name="fleaderboards")
+    @collection_ready()
+    async def dev_leaderboards(self, ctx):
+        """Rebuild the leaderboard stats from the stored Pokémon"""
+        async with ctx.typing():
+            processed = await rebuild_trainer_stats(self.cursor)
+        await ctx.send(f"Rebuilt the leaderboard stats of {processed} trainers.")
+
     @dev.command(name="fspawn")
     async def dev_spawn(self, ctx, *pokemon):
         """Spawn a Pokémon by name or random"""
         pokemon = " ".join(pokemon).strip().lower()
-        if pokemon is "":
+        if pokemon == "":
             await self.spawn_pokemon(ctx.channel)
             return
-        else:
-            for i, pokemondata in enumerate(self.pokemondata):
-                name = (
-                    pokemondata.get("alias").lower()
-                    if pokemondata.get("alias")
-                    else pokemondata["name"]["english"].lower()
-                )
-                if name == pokemon:
-                    await self.spawn_pokemon(ctx.channel, pokemon=self.pokemondata[i])
-                    return
+        species = self.species.find(pokemon)
+        if species is not None:
+            await self.spawn_pokemon(ctx.channel, pokemon=species)
+            return
         await ctx.send("No Pokémon found.")
 
-    async def get_pokemon(self, ctx, user: discord.Member, pokeid: int) -> list:
+    async def get_pokemon(self, ctx, user: discord.Member, pokeid: int) -> Optional[Pokemon]:
         """Returns Pokémon from user list if exists"""
         if pokeid <= 0:
             return await ctx.send("The ID must be greater than 0!")
         async with ctx.typing():
-            result = await self.cursor.fetch_all(query=SELECT_POKEMON, values={"user_id": user.id})
-        pokemons = [None]
-        for data in result:
-            pokemons.append([json.loads(data[0]), data[1]])
-        if not pokemons:
-            return await ctx.send("You don't have any Pokémon, trainer!")
-        if pokeid >= len(pokemons):
+            pokemon = await self.fetch_slot(user.id, pokeid)
+        if pokemon is None:
             return await ctx.send("There's no Pokémon at that slot.")
-        return pokemons[pokeid]
+        return pokemon
 
     @dev.command(name="fivs")
+    @collection_ready()
     async def dev_ivs(
         self,
         ctx,
@@ -73,28 +126,19 @@ class Dev(MixinMeta):
         """Manually set a Pokémon's IVs"""
         if user is None:
             user = ctx.author
-        pokemon = await self.get_pokemon(ctx, user, pokeid)
-        if not isinstance(pokemon, list):
-            return
-        pokemon[0]["ivs"] = {
-            "HP": hp,
-            "Attack": attack,
-            "Defence": defence,
-            "Sp. Atk": spatk,
-            "Sp. Def": spdef,
-            "Speed": speed,
-        }
-        await self.cursor.execute(
-            query=UPDATE_POKEMON,
-            values={
-                "user_id": user.id,
-                "message_id": pokemon[1],
-                "pokemon": json.dumps(pokemon[0]),
-            },
-        )
+        async with self.userlocks(user.id):
+            pokemon = await self.get_pokemon(ctx, user, pokeid)
+            if not isinstance(pokemon, Pokemon):
+                return
+            pokemon.ivs = (hp, attack, defence, spatk, spdef, speed)
+            await self.cursor.execute(
+                query=UPDATE_POKEMON,
+                values=pokemon_values(pokemon, user_id=user.id, message_id=pokemon.message_id),
+            )
         await ctx.tick()
 
     @dev.command(name="fstats")
+    @collection_ready()
     async def dev_stats(
         self,
         ctx,
@@ -110,44 +154,32 @@ class Dev(MixinMeta):
         """Manually set a Pokémon's stats"""
         if user is None:
             user = ctx.author
-        pokemon = await self.get_pokemon(ctx, user, pokeid)
-        if not isinstance(pokemon, list):
-            return
-        pokemon[0]["stats"] = {
-            "HP": hp,
-            "Attack": attack,
-            "Defence": defence,
-            "Sp. Atk": spatk,
-            "Sp. Def": spdef,
-            "Speed": speed,
-        }
-        await self.cursor.execute(
-            query=UPDATE_POKEMON,
-            values={
-                "user_id": user.id,
-                "message_id": pokemon[1],
-                "pokemon": json.dumps(pokemon[0]),
-            },
-        )
+        async with self.userlocks(user.id):
+            pokemon = await self.get_pokemon(ctx, user, pokeid)
+            if not isinstance(pokemon, Pokemon):
+                return
+            pokemon.stats = (hp, attack, defence, spatk, spdef, speed)
+            await self.cursor.execute(
+                query=UPDATE_POKEMON,
+                values=pokemon_values(pokemon, user_id=user.id, message_id=pokemon.message_id),
+            )
         await ctx.tick()
 
     @dev.command(name="flevel")
+    @collection_ready()
     async def dev_lvl(self, ctx, user: Optional[discord.Member], pokeid: int, lvl: int):
         """Manually set a Pokémon's level"""
         if user is None:
             user = ctx.author
-        pokemon = await self.get_pokemon(ctx, user, pokeid)
-        if not isinstance(pokemon, list):
-            return
-        pokemon[0]["level"] = lvl
-        await self.cursor.execute(
-            query=UPDATE_POKEMON,
-            values={
-                "user_id": user.id,
-                "message_id": pokemon[1],
-                "pokemon": json.dumps(pokemon[0]),
-            },
-        )
+        async with self.userlocks(user.id):
+            pokemon = await self.get_pokemon(ctx, user, pokeid)
+            if not isinstance(pokemon, Pokemon):
+                return
+            pokemon.level = lvl
+            await self.cursor.execute(
+                query=UPDATE_POKEMON,
+                values=pokemon_values(pokemon, user_id=user.id, message_id=pokemon.message_id),
+            )
         await ctx.tick()
 
     @dev.command(name="freveal")
@@ -156,48 +188,42 @@ class Dev(MixinMeta):
         if user is None:
             user = ctx.author
         pokemon = await self.get_pokemon(ctx, user, pokeid)
-        if not isinstance(pokemon, list):
+        if not isinstance(pokemon, Pokemon):
             return
-        await ctx.send(content=pprint.pformat(pokemon[0]))
+        await ctx.send(content=pprint.pformat(pokemon.to_dict()))
 
     @dev.command(name="fstrip")
+    @collection_ready()
     async def dev_strip(self, ctx, user: discord.Member, id: int):
         """Forcably removes a Pokémon from user"""
         if id <= 0:
             return await ctx.send("The ID must be greater than 0!")
-        async with ctx.typing():
-            result = await self.cursor.fetch_all(query=SELECT_POKEMON, values={"user_id": user.id})
-        pokemons = [None]
-        for data in result:
-            pokemons.append([json.loads(data[0]), data[1]])
-        if not pokemons:
-            return await ctx.send(f"{user.display_name} don't have any Pokémon!")
-        if id >= len(pokemons):
-            return await ctx.send("There's no Pokémon at that slot.")
-        pokemon = pokemons[id]
-        msg = ""
-        userconf = await self.user_is_global(user)
-        pokeid = await userconf.pokeid()
-        if id < pokeid:
-            msg += _(
-                "\nTheir default Pokémon may have changed. I have tried to account for this change."
-            )
-            await userconf.pokeid.set(pokeid - 1)
-        elif id == pokeid:
-            msg += _(
-                "\nYou have released their selected Pokémon. I have reset their selected pokemon to their first Pokémon."
-            )
-            await userconf.pokeid.set(1)
-        if len(pokemons) == 2:  # it was their last pokemon, resets starter
-            await userconf.has_starter.set(False)
-            msg = _(
-                f"\n{user.display_name} has no Pokémon left. I have granted them another chance to pick a starter."
-            )
-        await self.cursor.execute(
-            query="DELETE FROM users where message_id = :message_id",
-            values={"message_id": pokemon[1]},
-        )
-        name = self.get_name(pokemon[0]["name"], user)
+        async with ctx.typing(), self.userlocks(user.id):
+            pokemon = await self.fetch_slot(user.id, id)
+            if pokemon is None:
+                return await ctx.send("There's no Pokémon at that slot.")
+            msg = ""
+            userconf = await self.user_is_global(user)
+            pokeid = await userconf.pokeid()
+            if id < pokeid:
+                msg += _(
+                    "\nTheir default Pokémon may have changed. I have tried to account for this change."
+                )
+                await userconf.pokeid.set(pokeid - 1)
+                self.usercache.update(user.id, pokeid=pokeid - 1)
+            elif id == pokeid:
+                msg += _(
+                    "\nYou have released their selected Pokémon. I have reset their selected pokemon to their first Pokémon."
+                )
+                await userconf.pokeid.set(1)
+                self.usercache.update(user.id, pokeid=1)
+            if await self.count_pokemon(user.id) == 1:  # it was their last pokemon, resets starter
+                await userconf.has_starter.set(False)
+                msg = _(
+                    f"\n{user.display_name} has no Pokémon left. I have granted them another chance to pick a starter."
+                )
+            await self.release_pokemon(user.id, pokemon.message_id)
+        name = self.get_name(pokemon.species, user)
         await ctx.send(
             _(f"{user.display_name}'s {name} has been freed.{msg}").format(name=name, msg=msg)
         )
@@ -0,0 +1,121 @@
+import asyncio
+import heapq
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import discord
+
+
+class MenuDispatcher:
+    """Routes reaction and reply events to the open menus.
+
+    Menus are keyed by their message id and jump-to-page prompts by their
+    channel and trainer, so an event costs one dict lookup however many
+    menus are open. Idle timeouts share a single heap and a single timer,
+    touching a menu pushes a new deadline and the outdated ones are skipped
+    when they reach the top."""
+
+    def __init__(self):
+        self._menus: Dict[int, Tuple[Any, asyncio.Future]] = {}
+        self._deadlines: Dict[int, float] = {}
+        self._heap: List[Tuple[float, int]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._timer_at: Optional[float] = None
+        self._replies: Dict[Tuple[int, int], Tuple[Callable, asyncio.Future]] = {}
+
+    def __len__(self):
+        return len(self._menus)
+
+    def attach(self, menu) -> asyncio.Future:
+        """Start routing a menu's reactions, the future resolves to True once it idles out."""
+        closed = asyncio.get_running_loop().create_future()
+        self._menus[menu.message.id] = (menu, closed)
+        self.touch(menu.message.id)
+        return closed
+
+    def detach(self, menu):
+        message_id = menu.message.id
+        entry = self._menus.get(message_id)
+        if entry is not None and entry[0] is menu:
+            del self._menus[message_id]
+            self._deadlines.pop(message_id, None)
+
+    def touch(self, message_id: int):
+        """Restart a menu's idle timeout."""
+        menu, _ = self._menus[message_id]
+        if menu.timeout is None:
+            return
+        deadline = asyncio.get_running_loop().time() + menu.timeout
+        self._deadlines[message_id] = deadline
+        heapq.heappush(self._heap, (deadline, message_id))
+        self._arm()
+
+    def _arm(self):
+        if not self._heap:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = self._timer_at = None
+            return
+        deadline = self._heap[0][0]
+        if self._timer is not None and self._timer_at <= deadline:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_at(deadline, self._expire)
+        self._timer_at = deadline
+
+    def _expire(self):
+        self._timer = self._timer_at = None
+        now = asyncio.get_running_loop().time()
+        while self._heap and self._heap[0][0] <= now:
+            deadline, message_id = heapq.heappop(self._heap)
+            if self._deadlines.get(message_id) != deadline:
+                continue  # Touched again since, or already closed
+            del self._deadlines[message_id]
+            _, closed = self._menus[message_id]
+            if not closed.done():
+                closed.set_result(True)
+        self._arm()
+
+    def dispatch_reaction(self, payload: discord.RawReactionActionEvent):
+        entry = self._menus.get(payload.message_id)
+        if entry is None:
+            return
+        menu, closed = entry
+        if closed.done() or not menu.reaction_check(payload):
+            return
+        self.touch(payload.message_id)
+        asyncio.create_task(menu.update(payload))
+
+    async def wait_for_reply(
+        self, channel_id: int, user_id: int, check: Callable, timeout: float
+    ) -> discord.Message:
+        """Wait for the next message from a trainer in a channel that passes `check`."""
+        key = (channel_id, user_id)
+        reply = asyncio.get_running_loop().create_future()
+        self._replies[key] = (check, reply)
+        try:
+            return await asyncio.wait_for(reply, timeout)
+        finally:
+            if self._replies.get(key, (None, None))[1] is reply:
+                del self._replies[key]
+
+    def dispatch_message(self, message: discord.Message):
+        entry = self._replies.get((message.channel.id, message.author.id))
+        if entry is None:
+            return
+        check, reply = entry
+        if not reply.done() and check(message):
+            reply.set_result(message)
+
+    def close(self):
+        """Time out every open menu so they clean up after themselves."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = self._timer_at = None
+        self._heap.clear()
+        self._deadlines.clear()
+        for _, closed in self._menus.values():
+            if not closed.done():
+                closed.set_result(True)
+        for _, reply in self._replies.values():
+            reply.cancel()
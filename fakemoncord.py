@@ -1,36 +1,54 @@
 import asyncio
 import concurrent.futures
-import datetime
-import json
+import io
 import logging
 import random
-import string
+import time
 from abc import ABC
+from typing import Optional, Tuple
 
 import apsw
 import discord
-from databases import Database
+import tabulate
 from redbot.core import Config, commands
 from redbot.core.data_manager import bundled_data_path, cog_data_path
-from redbot.core.i18n import Translator, cog_i18n
-from redbot.core.utils.chat_formatting import escape, humanize_list
-
+from redbot.core.i18n import Translator, cog_i18n, get_locale
+from redbot.core.utils.chat_formatting import box, escape, humanize_list
+
+from .cache import EmbedCache, SpawnCache, UserCache
+from .catalog import (
+    Catalog,
+    Pokedex,
+    Pokemon,
+    Species,
+    SpeciesIndex,
+    load_catalog,
+    normalize_answer,
+)
 from .dev import Dev
+from .dispatcher import MenuDispatcher
+from .functions import GENDERS, STATS, pokemon_values
 from .general import GeneralMixin
-from .pokemixin import PokeMixin
+from .leaderboard import LeaderboardMixin
+from .locks import UserLocks
+from .migrations import MigrationRunner
+from .pokemixin import PokeMixin, collection_ready
+from .sampler import AliasSampler
+from .scheduler import SpawnScheduler
 from .settings import SettingsMixin
+from .spawns import SpawnAccumulator, SpawnTable
 from .statements import *
+from .storage import Storage
+from .trades import TradeBook
 from .trading import TradeMixin
+from .xp import ExperienceBuffer
 
 log = logging.getLogger("red.flare.fakemoncord")
 
-PUNCT = string.punctuation + "’"
 _ = Translator("Fakemoncord", __file__)
-GENDERS = [
-    "Male \N{MALE SIGN}\N{VARIATION SELECTOR-16}",
-    "Female \N{FEMALE SIGN}\N{VARIATION SELECTOR-16}",
-]
-_MIGRATION_VERSION = 9
+XP_FLUSH_INTERVAL = 5
+SPAWN_FLUSH_INTERVAL = 5
+AUTO_SPAWN_INTERVAL = 2400
 
 
 class CompositeMetaClass(type(commands.Cog), type(ABC)):
@@ -44,6 +62,7 @@ class Fakemoncord(
     TradeMixin,
     SettingsMixin,
     GeneralMixin,
+    LeaderboardMixin,
     PokeMixin,
     commands.Cog,
     metaclass=CompositeMetaClass,
@@ -53,6 +72,9 @@ class Fakemoncord(
     __version__ = "0.0.1-alpha-22"
     __author__ = "flare"
 
+    async def cog_before_invoke(self, ctx):
+        await self.usercache.load(ctx.author.id)
+
     def format_help_for_context(self, ctx):
         """Thanks Sinbad."""
         pre_processed = super().format_help_for_context(ctx)
@@ -91,155 +113,195 @@ class Fakemoncord(
         self.config.register_member(**defaults_user)
         self.config.register_channel(pokemon=None)
         self.datapath = f"{bundled_data_path(self)}"
-        self.maybe_spawn = {}
+        self.catalogpath = f"{cog_data_path(self)}/catalog.pickle"
+        self.spawnaccumulator = SpawnAccumulator()
         self.guildcache = {}
-        self.usercache = {}
+        self.usercache = UserCache(self.config)
+        self.userlocks = UserLocks()
+        self.spawncache = SpawnCache(self.datapath)
+        self.embedcache = EmbedCache()
         self.spawnchance = []
-        self.cursor = Database(f"sqlite:///{cog_data_path(self)}/pokemon.db")
         self._executor = concurrent.futures.ThreadPoolExecutor(1)
+        self.cursor = Storage(f"{cog_data_path(self)}/pokemon.db", executor=self._executor)
         self.bg_loop_task = None
+        self.spawnscheduler = SpawnScheduler(self.auto_spawn, interval=AUTO_SPAWN_INTERVAL)
+        self.xpbuffer = ExperienceBuffer()
+        self._xp_lock = asyncio.Lock()
+        self._xp_wakeup = asyncio.Event()
+        self.xp_flush_task = None
+        self.spawns = SpawnTable()
+        self.spawn_table_task = None
+        self.migrations = MigrationRunner(self)
+        self.trades = TradeBook()
+        self.dispatcher = MenuDispatcher()
 
     def cog_unload(self):
-        self._executor.shutdown()
-        if self.bg_loop_task:
-            self.bg_loop_task.cancel()
+        self.stop_spawn_loop()
+        self.migrations.stop()
+        self.trades.clear()
+        self.dispatcher.close()
+        if self.xp_flush_task:
+            self.xp_flush_task.cancel()
+        if self.spawn_table_task:
+            self.spawn_table_task.cancel()
+        self.bot.loop.create_task(self.close())
+
+    async def close(self):
+        await self.flush_xp()
+        await self.flush_spawns()
+        await self.cursor.disconnect()
+        self._executor.shutdown(wait=False)
 
     async def initalize(self):
         await self.cursor.connect()
-        await self.cursor.execute(PRAGMA_journal_mode)
-        await self.cursor.execute(PRAGMA_wal_autocheckpoint)
-        await self.cursor.execute(PRAGMA_read_uncommitted)
-        await self.cursor.execute(POKECORD_CREATE_POKECORD_TABLE)
-        with open(f"{self.datapath}/pokedex.json", encoding="utf-8") as f:
-            pdata = json.load(f)
-        with open(f"{self.datapath}/evolve.json", encoding="utf-8") as f:
-            self.evolvedata = json.load(f)
-        with open(f"{self.datapath}/genders.json", encoding="utf-8") as f:
-            self.genderdata = json.load(f)
-        with open(f"{self.datapath}/shiny.json", encoding="utf-8") as f:
-            sdata = json.load(f)
-        with open(f"{self.datapath}/legendary.json", encoding="utf-8") as f:
-            ldata = json.load(f)
-        with open(f"{self.datapath}/mythical.json", encoding="utf-8") as f:
-            mdata = json.load(f)
-        with open(f"{self.datapath}/galarian.json", encoding="utf-8") as f:
-            gdata = json.load(f)
-        with open(f"{self.datapath}/hisuian.json", encoding="utf-8") as f:
-            gdata = json.load(f)
-        with open(f"{self.datapath}/alolan.json", encoding="utf-8") as f:
-            adata = json.load(f)
-        with open(f"{self.datapath}/megas.json", encoding="utf-8") as f:
-            megadata = json.load(f)
-        self.pokemondata = pdata + sdata + ldata + mdata + gdata + adata + megadata
-        with open(f"{self.datapath}/url.json", encoding="utf-8") as f:
-            url = json.load(f)
-        for pokemon in self.pokemondata:
-            name = (
-                pokemon["name"]["english"]
-                if not pokemon.get("variant")
-                else pokemon.get("alias")
-                if pokemon.get("alias")
-                else pokemon["name"]["english"]
-            )
-            if "shiny" in name.lower():
-                continue
-            link = url[name]
-            if isinstance(link, list):
-                link = link[0]
-            pokemon["url"] = link
-
-        self.spawnchances = [x["spawnchance"] for x in self.pokemondata]
-        self.pokemonlist = {
-            pokemon["id"]: {
-                "name": pokemon["name"],
-                "amount": 0,
-                "id": f"#{str(pokemon['id']).zfill(3)}",
-            }
-            for pokemon in sorted((self.pokemondata), key=lambda x: x["id"])
-        }
-        if await self.config.migration() < _MIGRATION_VERSION:
-            self.usercache = await self.config.all_users()
-            for user in self.usercache:
-                await self.config.user_from_id(user).pokeids.clear()
-                result = await self.cursor.fetch_all(
-                    query=SELECT_POKEMON,
-                    values={"user_id": user},
-                )
-                async with self.config.user_from_id(user).pokeids() as pokeids:
-                    for data in result:
-                        poke = json.loads(data[0])
-                        if str(poke["id"]) not in pokeids:
-
-                            pokeids[str(poke["id"])] = 1
-                        else:
-                            pokeids[str(poke["id"])] += 1
-
-                        if not poke.get("gender", False):
-                            if isinstance(poke["name"], str):
-                                poke["gender"] = self.gender_choose(poke["name"])
-                            else:
-                                poke["gender"] = self.gender_choose(poke["name"]["english"])
-
-                        if not poke.get("ivs", False):
-                            poke["ivs"] = {
-                                "HP": random.randint(0, 31),
-                                "Attack": random.randint(0, 31),
-                                "Defence": random.randint(0, 31),
-                                "Sp. Atk": random.randint(0, 31),
-                                "Sp. Def": random.randint(0, 31),
-                                "Speed": random.randint(0, 31),
-                            }
-
-                        await self.cursor.execute(
-                            query=UPDATE_POKEMON,
-                            values={
-                                "user_id": user,
-                                "message_id": data[1],
-                                "pokemon": json.dumps(poke),
-                            },
-                        )
-                await self.config.migration.set(_MIGRATION_VERSION)
-            log.info("Fakemoncord Migration complete.")
+        await self.cursor.execute(POKECORD_CREATE_POKEMON_TABLE)
+        await self.cursor.execute(POKECORD_CREATE_POKEMON_USER_INDEX)
+        await self.cursor.execute(CREATE_DEX_COUNTS_TABLE)
+        await self.cursor.execute(CREATE_TRAINER_STATS_TABLE)
+        await self.cursor.execute(CREATE_GUILD_STATS_TABLE)
+        await self.cursor.execute(CREATE_TRADE_OFFERS_TABLE)
+        for statement in (
+            *CREATE_LEADERBOARD_INDEXES,
+            *CREATE_TRAINER_STATS_TRIGGERS,
+            *CREATE_GUILD_STATS_TRIGGERS,
+        ):
+            await self.cursor.execute(statement)
+        catalog = await self.bot.loop.run_in_executor(
+            self._executor, load_catalog, self.datapath, self.catalogpath
+        )
+        self.install_catalog(catalog)
+
+        await self.migrations.load()
+        await self.migrations.run()
 
         await self.update_guild_cache()
         await self.update_spawn_chance()
-        await self.update_user_cache()
+        await self.restore_spawns()
+        await self.restore_trades()
+        self.xp_flush_task = self.bot.loop.create_task(self.xp_flush_loop())
+        self.spawn_table_task = self.bot.loop.create_task(self.spawn_table_loop())
         if await self.config.spawnloop():
-            self.bg_loop_task = self.bot.loop.create_task(self.random_spawn())
+            self.start_spawn_loop()
+        self.migrations.start()
+
+    def install_catalog(self, catalog: Catalog):
+        """Swap in a loaded catalog and everything derived from it."""
+        self.evolvedata = catalog.evolutions
+        self.genderdata = catalog.genders
+        self.pokemondata = catalog.species
+        self.build_spawn_sampler()
+        self.species = SpeciesIndex(self.pokemondata, catalog.starters)
+        self.spawncache.clear()
+        self.embedcache.clear()
+        self.pokedex = Pokedex(self.species)
+
+    def normalize_legacy_pokemon(self, poke: dict) -> Pokemon:
+        """Fill the fields older versions of the cog didn't store."""
+        english = poke["name"] if isinstance(poke["name"], str) else poke["name"]["english"]
+        species_id = poke.get("id")
+        if not species_id:
+            species = self.species.find(english)
+            species_id = species.id if species is not None else 0
+        species = self.get_species(
+            species_id, poke.get("variant") or None, poke.get("alias") or None
+        )
+        ivs = poke.get("ivs")
+        stats = poke.get("stats")
+        return Pokemon(
+            species,
+            level=poke.get("level", 1),
+            xp=poke.get("xp", 0),
+            gender=poke.get("gender") or self.gender_choose(english),
+            nickname=poke.get("nickname"),
+            ivs=tuple(ivs.get(stat, 0) for stat in STATS) if ivs else None,
+            stats=tuple(int(stats.get(stat, 0)) for stat in STATS) if stats else None,
+        )
+
+    def get_species(self, species_id: int, variant: str = None, alias: str = None) -> Species:
+        species = self.species.get(species_id, variant, alias)
+        if species is None:
+            return Species.unknown(species_id, variant, alias)
+        return species
+
+    def decode_pokemon(self, row) -> Pokemon:
+        species = self.get_species(row["species_id"], row["variant"], row["alias"])
+        return Pokemon.from_row(row, species)
+
+    async def fetch_slot(self, user_id: int, slot: int) -> Optional[Pokemon]:
+        """Returns the Pokémon at a trainer's slot, if any."""
+        data = await self.cursor.fetch_one(
+            query=SELECT_POKEMON_SLOT, values={"user_id": user_id, "position": slot}
+        )
+        if data is None:
+            return None
+        return self.decode_pokemon(data)
+
+    async def count_pokemon(self, user_id: int) -> int:
+        return await self.cursor.fetch_val(query=SELECT_POKEMON_COUNT, values={"user_id": user_id})
+
+    async def release_pokemon(self, user_id: int, message_id: int) -> Optional[int]:
+        """Removes a Pokémon and closes the gap it leaves in the trainer's slots.
+
+        Returns the slot it was in, None if the trainer doesn't own it anymore."""
+        async with self.cursor.transaction():
+            slot = await self.cursor.fetch_val(
+                query=SELECT_POKEMON_POSITION,
+                values={"user_id": user_id, "message_id": message_id},
+            )
+            if slot is None:
+                return None
+            await self.cursor.execute(query=DELETE_POKEMON, values={"message_id": message_id})
+            await self.cursor.execute(
+                query=SHIFT_POKEMON_SLOTS, values={"user_id": user_id, "position": slot}
+            )
+        return slot
 
     async def random_spawn(self):
         await self.bot.wait_until_ready()
         log.debug("Starting loop for random spawns.")
-        while True:
-            try:
-                for guild in self.guildcache:
-                    if (
-                        self.guildcache[guild]["toggle"]
-                        and self.guildcache[guild]["activechannels"]
-                    ):
-                        if random.randint(1, 2) == 2:
-                            continue
-                        _guild = self.bot.get_guild(int(guild))
-                        if _guild is None:
-                            continue
-                        channel = _guild.get_channel(
-                            int(random.choice(self.guildcache[guild]["activechannels"]))
-                        )
-                        if channel is None:
-                            continue
-                        await self.spawn_pokemon(channel)
-                await asyncio.sleep(2400)
-            except Exception as exc:
-                log.error("Exception in Pokémon auto spawning: ", exc_info=exc)
+        self.sync_spawn_schedule()
+        await self.spawnscheduler.run()
+
+    def start_spawn_loop(self):
+        if self.bg_loop_task is None or self.bg_loop_task.done():
+            self.bg_loop_task = self.bot.loop.create_task(self.random_spawn())
+
+    def stop_spawn_loop(self):
+        if self.bg_loop_task:
+            self.bg_loop_task.cancel()
+            self.bg_loop_task = None
+        self.spawnscheduler.stop()
+
+    def sync_spawn_schedule(self):
+        """Schedule every guild that is toggled on and has active channels."""
+        self.spawnscheduler.sync(
+            guild
+            for guild, data in self.guildcache.items()
+            if data["toggle"] and data["activechannels"]
+        )
+
+    async def auto_spawn(self, guild):
+        guildcache = self.guildcache.get(guild)
+        if guildcache is None or not guildcache["toggle"] or not guildcache["activechannels"]:
+            return
+        if random.randint(1, 2) == 2:
+            return
+        _guild = self.bot.get_guild(int(guild))
+        if _guild is None:
+            return
+        channel = _guild.get_channel(int(random.choice(guildcache["activechannels"])))
+        if channel is None:
+            return
+        await self.spawn_pokemon(channel)
 
     async def update_guild_cache(self):
         self.guildcache = await self.config.all_guilds()
-
-    async def update_user_cache(self):
-        self.usercache = await self.config.all_users()  # TODO: Support guild
+        if self.bg_loop_task is not None:
+            self.sync_spawn_schedule()
 
     async def update_spawn_chance(self):
         self.spawnchance = await self.config.spawnchance()
+        self.spawnaccumulator.spawnchance = self.spawnchance
 
     async def is_global(self, guild):
         toggle = await self.config.isglobal()
@@ -253,8 +315,14 @@ class Fakemoncord(
             return self.config.user(user)
         return self.config.member(user)
 
+    def build_spawn_sampler(self):
+        """(Re)build the spawn sampler, it is swapped in as a whole once complete."""
+        self.spawnsampler = AliasSampler(
+            self.pokemondata, [x.spawnchance for x in self.pokemondata]
+        )
+
     def pokemon_choose(self):
-        return random.choices(self.pokemondata, weights=self.spawnchances, k=1)[0]
+        return self.spawnsampler.choice()
 
     def gender_choose(self, name):
         poke = self.genderdata.get(name, None)
@@ -265,33 +333,14 @@ class Fakemoncord(
         weights = [1 - (poke / 8), poke / 8]
         return random.choices(GENDERS, weights=weights)[0]
 
-    def get_name(self, names, user):
-        if isinstance(names, str):
-            return names
+    def get_name(self, species: Species, user):
         userconf = self.usercache.get(user.id)
         if userconf is None:
-            return names["english"]
-        localnames = {
-            "en": names["english"],
-            "fr": names["french"],
-            "tw": names["chinese"],
-            "jp": names["japanese"],
-        }
-        return (
-            localnames[self.usercache[user.id]["locale"]]
-            if localnames[self.usercache[user.id]["locale"]] is not None
-            else localnames["en"]
-        )
-
-    def get_pokemon_name(self, pokemon: dict) -> set:
-        """function returns all name for specified Pokémon"""
-        return {
-            pokemon["name"][name].lower()
-            for name in pokemon["name"]
-            if pokemon["name"][name] is not None
-        }
+            return species.name
+        return species.localized(userconf["locale"])
 
     @commands.command()
+    @collection_ready()
     async def fstarter(self, ctx, pokemon: str = None):
         """Choose your starter Pokémon!"""
         conf = await self.user_is_global(ctx.author)
@@ -301,88 +350,48 @@ class Fakemoncord(
             msg = _(
                 "Hey there trainer! Welcome to Fakemoncord. This is a ported plugin version of Fakemoncord adopted for use on Red.\n"
                 "In order to get catchin' you must pick one of the starter Pokémon as listed below.\n"
-                "**Generation 1**\nBulbasaur, Charmander and Squirtle\n"
-                "**Generation 2**\nChikorita, Cyndaquil, Totodile\n"
-                "**Generation 3**\nTreecko, Torchic, Mudkip\n"
-                "**Generation 4**\nTurtwig, Chimchar, Piplup\n"
-                "**Generation 5**\nSnivy, Tepig, Oshawott\n"
-                "**Generation 6**\nChespin, Fennekin, Froakie\n"
-                "**Generation 7**\nRowlet, Litten, Popplio\n"
-                "**Generation 8**\nGrookey, Scorbunny, Sobble\n"
             )
+            for number, generation in enumerate(self.species.generations, start=1):
+                msg += _("**Generation {number}**\n").format(number=number)
+                msg += humanize_list([self.get_name(x, ctx.author) for x in generation]) + "\n"
             msg += _("\nTo pick a Pokémon, type {prefix}starter <Pokémon>").format(
                 prefix=ctx.clean_prefix
             )
             await ctx.send(msg)
             return
-        starter_pokemon = {
-            "bulbasaur": self.pokemondata[0],
-            "charmander": self.pokemondata[3],
-            "squirtle": self.pokemondata[6],
-            "chikorita": self.pokemondata[146],
-            "cyndaquil": self.pokemondata[149],
-            "totodile": self.pokemondata[152],
-            "treecko": self.pokemondata[240],
-            "torchic": self.pokemondata[243],
-            "mudkip": self.pokemondata[246],
-            "turtwig": self.pokemondata[365],
-            "chimchar": self.pokemondata[368],
-            "piplup": self.pokemondata[371],
-            "snivy": self.pokemondata[458],
-            "tepig": self.pokemondata[461],
-            "oshawott": self.pokemondata[464],
-            "chespin": self.pokemondata[601],
-            "fennekin": self.pokemondata[604],
-            "froakie": self.pokemondata[607],
-            "rowlet": self.pokemondata[668],
-            "litten": self.pokemondata[671],
-            "popplio": self.pokemondata[674],
-            "grookey": self.pokemondata[740],
-            "scorbunny": self.pokemondata[743],
-            "sobble": self.pokemondata[746],
-        }
-
-        for starter in starter_pokemon.values():
-            if pokemon.lower() in self.get_pokemon_name(starter):
-                break
-
-        else:
+        starter = self.species.find(pokemon)
+        if starter is None or self.species.starters.get(starter.name.lower()) is not starter:
             return await ctx.send(_("That's not a valid starter Pokémon, trainer!"))
 
+        starter = Pokemon(starter, gender=self.gender_choose(starter.name))
+        async with self.userlocks(ctx.author.id):
+            if await conf.has_starter():
+                return await ctx.send(_("You've already claimed your starter Pokémon!"))
+            async with self.cursor.transaction():
+                await self.cursor.execute(
+                    query=INSERT_POKEMON,
+                    values=pokemon_values(
+                        starter, user_id=ctx.author.id, message_id=ctx.message.id
+                    ),
+                )
+                if ctx.guild is not None:
+                    await self.cursor.execute(
+                        query=ADD_GUILD_TRAINER,
+                        values={"guild_id": ctx.guild.id, "user_id": ctx.author.id},
+                    )
+            await conf.has_starter.set(True)
+            self.usercache.update(ctx.author.id, has_starter=True)
         await ctx.send(
             _("You've chosen {pokemon} as your starter Pokémon!").format(pokemon=pokemon.title())
         )
 
-        # starter dict
-        starter["level"] = 1
-        starter["xp"] = 0
-        starter["ivs"] = {
-            "HP": random.randint(0, 31),
-            "Attack": random.randint(0, 31),
-            "Defence": random.randint(0, 31),
-            "Sp. Atk": random.randint(0, 31),
-            "Sp. Def": random.randint(0, 31),
-            "Speed": random.randint(0, 31),
-        }
-        starter["gender"] = self.gender_choose(starter["name"]["english"])
-
-        await self.cursor.execute(
-            query=INSERT_POKEMON,
-            values={
-                "user_id": ctx.author.id,
-                "message_id": ctx.message.id,
-                "pokemon": json.dumps(starter),
-            },
-        )
-        await conf.has_starter.set(True)
-
     @commands.command()
     @commands.cooldown(1, 30, commands.BucketType.member)
     async def fhint(self, ctx):
         """Get a hint on the Pokémon!"""
-        pokemonspawn = await self.config.channel(ctx.channel).pokemon()
+        pokemonspawn = self.spawns.get(ctx.channel.id)
         if pokemonspawn is not None:
-            name = self.get_name(pokemonspawn["name"], ctx.author)
+            name = self.get_name(pokemonspawn, ctx.author)
             inds = [i for i, _ in enumerate(name)]
             if len(name) > 6:
                 amount = len(name) - random.randint(2, 4)
@@ -406,6 +415,7 @@ class Fakemoncord(
         await ctx.send(_("No Pokémon is ready to be caught."))
 
     @commands.command()
+    @collection_ready()
     async def fc(self, ctx, *, pokemon: str):
         """Catch a Pokemon!"""
         conf = await self.user_is_global(ctx.author)
@@ -415,24 +425,16 @@ class Fakemoncord(
                     "You haven't chosen a starter Pokémon yet, check out `{prefix}starter` for more information."
                 ).format(prefix=ctx.clean_prefix)
             )
-        pokemonspawn = await self.config.channel(ctx.channel).pokemon()
+        pokemonspawn = self.spawns.get(ctx.channel.id)
         if pokemonspawn is not None:
-            names = self.get_pokemon_name(pokemonspawn)
-            names.add(
-                pokemonspawn["name"]["english"].translate(str.maketrans("", "", PUNCT)).lower()
-            )
-            if pokemonspawn.get("alias"):
-                names.add(pokemonspawn["alias"].lower())
-            if pokemon.lower() not in names:
+            if normalize_answer(pokemon) not in pokemonspawn.answers:
                 return await ctx.send(_("That's not the correct Pokémon"))
-            if await self.config.channel(ctx.channel).pokemon() is not None:
-                await self.config.channel(ctx.channel).pokemon.clear()
-            else:
+            if not self.spawns.claim(ctx.channel.id, pokemonspawn):
                 await ctx.send("No Pokémon is ready to be caught.")
                 return
             lvl = random.randint(1, 13)
-            pokename = self.get_name(pokemonspawn["name"], ctx.author)
-            variant = f'{pokemonspawn.get("variant")} ' if pokemonspawn.get("variant") else ""
+            pokename = self.get_name(pokemonspawn, ctx.author)
+            variant = f"{pokemonspawn.variant} " if pokemonspawn.variant else ""
             msg = _(
                 "Congratulations {user}! You've caught a level {lvl} {variant}{pokename}!"
             ).format(
@@ -442,46 +444,66 @@ class Fakemoncord(
                 pokename=pokename,
             )
 
-            async with conf.pokeids() as poke:
-                if str(pokemonspawn["id"]) not in poke:
-                    msg += _("\n{pokename} has been added to the Pokédex.").format(
-                        pokename=pokename
-                    )
-
-                    poke[str(pokemonspawn["id"])] = 1
-                else:
-                    poke[str(pokemonspawn["id"])] += 1
-            pokemonspawn["level"] = lvl
-            pokemonspawn["xp"] = 0
-            pokemonspawn["gender"] = self.gender_choose(pokemonspawn["name"]["english"])
-            pokemonspawn["ivs"] = {
-                "HP": random.randint(0, 31),
-                "Attack": random.randint(0, 31),
-                "Defence": random.randint(0, 31),
-                "Sp. Atk": random.randint(0, 31),
-                "Sp. Def": random.randint(0, 31),
-                "Speed": random.randint(0, 31),
-            }
-            await self.cursor.execute(
-                query=INSERT_POKEMON,
-                values={
-                    "user_id": ctx.author.id,
-                    "message_id": ctx.message.id,
-                    "pokemon": json.dumps(pokemonspawn),
-                },
-            )
+            caught = Pokemon(pokemonspawn, level=lvl, gender=self.gender_choose(pokemonspawn.name))
+            dex = {"user_id": ctx.author.id, "species_id": pokemonspawn.id}
+            async with self.userlocks(ctx.author.id), self.cursor.transaction():
+                await self.cursor.execute(
+                    query=INSERT_POKEMON,
+                    values=pokemon_values(
+                        caught, user_id=ctx.author.id, message_id=ctx.message.id
+                    ),
+                )
+                await self.cursor.execute(query=INCREMENT_DEX_COUNT, values={**dex, "amount": 1})
+                await self.cursor.execute(
+                    query=ADD_GUILD_TRAINER,
+                    values={"guild_id": ctx.guild.id, "user_id": ctx.author.id},
+                )
+                amount = await self.cursor.fetch_val(query=SELECT_DEX_COUNT, values=dex)
+            if amount == 1:
+                msg += _("\n{pokename} has been added to the Pokédex.").format(pokename=pokename)
             await ctx.send(msg)
             return
         await ctx.send(_("No Pokémon is ready to be caught."))
 
-    def spawn_chance(self, guildid):
-        return self.maybe_spawn[guildid]["amount"] > self.maybe_spawn[guildid]["spawnchance"]
+    @commands.Cog.listener()
+    async def on_command_completion(self, ctx):
+        name = ctx.command.qualified_name
+        if name.startswith("set ") and ("prefix" in name or "colo" in name):
+            self.spawncache.clear_presentation()
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_add(self, payload):
+        self.dispatcher.dispatch_reaction(payload)
+
+    @commands.Cog.listener()
+    async def on_raw_reaction_remove(self, payload):
+        self.dispatcher.dispatch_reaction(payload)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member):
+        await self.cursor.execute(
+            query=DELETE_GUILD_TRAINER, values={"guild_id": member.guild.id, "user_id": member.id}
+        )
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        await self.cursor.execute(query=DELETE_GUILD_STATS, values={"guild_id": guild.id})
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload):
+        self.spawncache.message_deleted(payload.message_id)
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload):
+        for message_id in payload.message_ids:
+            self.spawncache.message_deleted(message_id)
 
     # async def get_hash(self, pokemon):
     #     return (await self.config.hashes()).get(pokemon, None)
 
     @commands.Cog.listener()
     async def on_message_without_command(self, message):
+        self.dispatcher.dispatch_message(message)
         if not message.guild:
             return
         if message.author.bot:
@@ -491,32 +513,15 @@ class Fakemoncord(
             return
         if not guildcache["toggle"]:
             return
-        await self.exp_gain(message.channel, message.author)
+        self.exp_gain(message.channel, message.author)
         if guildcache["whitelist"]:
             if message.channel.id not in guildcache["whitelist"]:
                 return
         elif guildcache["blacklist"]:
             if message.channel.id in guildcache["blacklist"]:
                 return
-        if message.guild.id not in self.maybe_spawn:
-            self.maybe_spawn[message.guild.id] = {
-                "amount": 1,
-                "spawnchance": random.randint(self.spawnchance[0], self.spawnchance[1]),
-                "time": datetime.datetime.utcnow().timestamp(),
-                "author": message.author.id,
-            }  # TODO: big value
-        if (
-            self.maybe_spawn[message.guild.id]["author"] == message.author.id
-        ):  # stop spamming to spawn
-            if (
-                datetime.datetime.utcnow().timestamp() - self.maybe_spawn[message.guild.id]["time"]
-            ) < 5:
-                return
-        self.maybe_spawn[message.guild.id]["amount"] += 1
-        should_spawn = self.spawn_chance(message.guild.id)
-        if not should_spawn:
+        if not self.spawnaccumulator.add(message.guild.id, message.author.id):
             return
-        del self.maybe_spawn[message.guild.id]
         if not guildcache["activechannels"]:
             channel = message.channel
         else:
@@ -528,199 +533,263 @@ class Fakemoncord(
     async def spawn_pokemon(self, channel, *, pokemon=None):
         if pokemon is None:
             pokemon = self.pokemon_choose()
-        prefixes = await self.bot.get_valid_prefixes(guild=channel.guild)
+        prefix, colour = await self.spawn_presentation(channel)
+        title, description, footer = self.spawn_template(pokemon)
         embed = discord.Embed(
-            title=_("‌‌A wild Pokémon has аppeаred!"),
-            description=_(
-                "Guess the Pokémon аnd type {prefix}catch <Pokémon> to cаtch it!"
-            ).format(prefix=prefixes[0]),
-            color=await self.bot.get_embed_color(channel),
-        )
-        log.debug(f"{pokemon['name']['english']} has spawned in {channel} on {channel.guild}")
-        _file = discord.File(
-            self.datapath
-            + f'/pokemon/{pokemon["name"]["english"] if not pokemon.get("variant") else pokemon.get("alias") if pokemon.get("alias") else pokemon["name"]["english"]}.png'.replace(
-                ":", ""
-            ),
-            filename="pokemonspawn.png",
+            title=title, description=description.format(prefix=prefix), color=colour
         )
-        embed.set_image(url="attachment://pokemonspawn.png")
-        embed.set_footer(
-            text=_("Supports: {languages}").format(
-                languages=humanize_list(
-                    list(
-                        [
-                            x.title()
-                            for x in pokemon["name"].keys()
-                            if pokemon["name"][x] is not None
-                        ]
-                    )
+        embed.set_footer(text=footer)
+        log.debug(f"{pokemon.name} has spawned in {channel} on {channel.guild}")
+        url = self.spawncache.upload(pokemon.key)
+        if url is not None:
+            embed.set_image(url=url)
+            await channel.send(embed=embed)
+        else:
+            _file = discord.File(
+                io.BytesIO(self.spawncache.image(pokemon.image_name)),
+                filename="pokemonspawn.png",
+            )
+            embed.set_image(url="attachment://pokemonspawn.png")
+            message = await channel.send(embed=embed, file=_file)
+            if message.embeds and str(message.embeds[0].image.url).startswith("https://"):
+                self.spawncache.remember_upload(
+                    pokemon.key, str(message.embeds[0].image.url), message.id
                 )
+        self.spawns.put(channel.id, pokemon)
+
+    async def spawn_presentation(self, channel) -> Tuple[str, discord.Colour]:
+        """The channel's guild prefix and embed colour, cached for a few minutes."""
+        cached = self.spawncache.presentation(channel.guild.id)
+        if cached is not None:
+            return cached
+        prefixes = await self.bot.get_valid_prefixes(guild=channel.guild)
+        colour = await self.bot.get_embed_color(channel)
+        self.spawncache.set_presentation(channel.guild.id, prefixes[0], colour)
+        return prefixes[0], colour
+
+    def spawn_template(self, pokemon: Species) -> Tuple[str, str, str]:
+        """The localized title, description and footer of a spawn embed."""
+        key = (pokemon.key, get_locale())
+        template = self.spawncache.templates.get(key)
+        if template is None:
+            template = self.spawncache.templates[key] = (
+                _("‌‌A wild Pokémon has аppeаred!"),
+                _("Guess the Pokémon аnd type {prefix}catch <Pokémon> to cаtch it!"),
+                _("Supports: {languages}").format(
+                    languages=humanize_list([x.title() for x in pokemon.languages])
+                ),
             )
-        )
-        await channel.send(embed=embed, file=_file)
-        await self.config.channel(channel).pokemon.set(pokemon)
+        return template
+
+    async def restore_spawns(self):
+        """Load the spawns persisted by `flush_spawns` into the spawn table."""
+        for channel_id, data in (await self.config.all_channels()).items():
+            data = data.get("pokemon")
+            if data is None:
+                continue
+            expires = None
+            if isinstance(data, dict):  # Spawned before species were stored by key
+                species = self.get_species(
+                    data["id"], data.get("variant") or None, data.get("alias") or None
+                )
+            else:
+                species = self.get_species(*data[:3])
+                if len(data) > 3:
+                    expires = data[3]
+            self.spawns.put(int(channel_id), species, expires, persist=False)
+        self.spawns.expire()
+
+    async def spawn_table_loop(self):
+        while True:
+            await asyncio.sleep(SPAWN_FLUSH_INTERVAL)
+            try:
+                self.spawns.expire()
+                self.spawnaccumulator.evict_idle()
+                await self.flush_spawns()
+            except Exception as exc:
+                log.error("Exception in Pokémon spawn persistence: ", exc_info=exc)
+
+    async def flush_spawns(self):
+        """Write the spawn table's changes behind to Config."""
+        for channel_id, spawn in self.spawns.pending_writes().items():
+            value = self.config.channel_from_id(channel_id).pokemon
+            if spawn is None:
+                await value.clear()
+            else:
+                await value.set([*spawn.species.key, spawn.expires])
 
     def calc_xp(self, lvl):
         return 25 * lvl
 
-    async def exp_gain(self, channel, user):
-        # conf = await self.user_is_global(user) # TODO: guild based
-        userconf = self.usercache.get(user.id)
-        if userconf is None:
-            return
-        if datetime.datetime.utcnow().timestamp() - userconf["timestamp"] < 10:
+    def exp_gain(self, channel, user):
+        """Queue an experience tick for the user, this never awaits."""
+        if self.migrations.importing:
             return
-        self.usercache[user.id][
-            "timestamp"
-        ] = datetime.datetime.utcnow().timestamp()  # Try remove a race condition
-        await self.config.user(user).timestamp.set(
-            datetime.datetime.utcnow().timestamp()
-        )  # TODO: guild based
-        await self.update_user_cache()
-        result = await self.cursor.fetch_all(query=SELECT_POKEMON, values={"user_id": user.id})
-        pokemons = []
-        for data in result:
-            pokemons.append([json.loads(data[0]), data[1]])
-        if not pokemons:
+        # The trainer's settings are only needed when the tick is applied, flush_xp loads them.
+        if not self.xpbuffer.add(user, channel, time.monotonic()):
             return
-        index = userconf["pokeid"] - 1
-        pokemon = None
-        if userconf["pokeid"] > len(pokemons):
-            index = 0
-        if pokemons[index][0]["level"] < 100:
-            pokemon = pokemons[index][0]
-            msg_id = pokemons[index][1]
-        else:
-            for i, poke in enumerate(pokemons):
-                if poke[0]["level"] < 100:
-                    pokemon = poke[0]
-                    msg_id = poke[1]
-                    break
-        if pokemon is None:
-            return  # No Pokémon available to lvl up
-        xp = random.randint(5, 25) + (pokemon["level"] // 2)
-        pokemon["xp"] += xp
-        embed = None
-        if pokemon["xp"] >= self.calc_xp(pokemon["level"]):
-            pokemon["level"] += 1
-            pokemon["xp"] = 0
-            if isinstance(pokemon["name"], str):
-                pokename = pokemon["name"]
-            else:
-                pokename = pokemon["name"]["english"]
-            evolve = self.evolvedata.get(pokename)
-            name = (
-                self.get_name(pokemon["name"], user)
-                if pokemon.get("nickname") is None
-                else f'"{pokemon.get("nickname")}"'
-            )
-            if evolve is not None and (pokemon["level"] >= int(evolve["level"])):
-                lvl = pokemon["level"]
-                nick = pokemon.get("nickname")
-                ivs = pokemon["ivs"]
-                gender = pokemon.get("gender")
-                if gender is None:
-                    gender = self.gender_choose(pokemon["name"]["english"])
-                if ivs is None:
-                    ivs = {
-                        "HP": random.randint(0, 31),
-                        "Attack": random.randint(0, 31),
-                        "Defence": random.randint(0, 31),
-                        "Sp. Atk": random.randint(0, 31),
-                        "Sp. Def": random.randint(0, 31),
-                        "Speed": random.randint(0, 31),
-                    }
-                stats = pokemon["stats"]
-                if pokemon.get("variant", None) is not None:
-                    pokemon = next(
-                        (
-                            item
-                            for item in self.pokemondata
-                            if (item["name"]["english"] == evolve["evolution"])
-                            and item.get("variant", "") == pokemon.get("variant", "")
-                        ),
-                        None,
+        if self.xpbuffer.full:
+            self._xp_wakeup.set()
+
+    async def xp_flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._xp_wakeup.wait(), timeout=XP_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            self._xp_wakeup.clear()
+            try:
+                await asyncio.shield(self.flush_xp())
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                log.error("Exception in Pokémon experience flushing: ", exc_info=exc)
+
+    async def flush_xp(self):
+        """Apply queued experience and persist it in a single transaction."""
+        async with self._xp_lock:
+            pending = self.xpbuffer.drain(time.monotonic())
+            if not pending:
+                return
+            # Hold every trainer with queued experience, so no command changes a Pokémon
+            # between it being read here and written back.
+            async with self.userlocks.many(*pending):
+                updates = []
+                announcements = []
+                evolutions = []
+                for user_id, entry in pending.items():
+                    userconf = await self.usercache.load(user_id)
+                    selected = await self.fetch_slot(
+                        user_id, userconf.get("pokeid", 1)
+                    ) or await self.fetch_slot(user_id, 1)
+                    if selected is None:
+                        continue
+                    if selected.level >= 100:
+                        data = await self.cursor.fetch_one(
+                            query=SELECT_LEVELABLE_POKEMON, values={"user_id": user_id}
+                        )
+                        if data is None:
+                            continue  # No Pokémon available to lvl up
+                        selected = self.decode_pokemon(data)
+                    pokemon = selected
+                    for _ in range(entry.ticks):
+                        if pokemon.level >= 100:
+                            break
+                        embed, evolved = await self.gain_xp(
+                            pokemon, entry.user, entry.channel, userconf
+                        )
+                        if embed is not None:
+                            announcements.append((entry.channel, embed))
+                        if evolved:
+                            evolutions.append((user_id, pokemon.species.id))
+                    updates.append(
+                        pokemon_values(pokemon, user_id=user_id, message_id=pokemon.message_id)
                     )
-                else:
-                    pokemon = next(
-                        (
-                            item
-                            for item in self.pokemondata
-                            if (item["name"]["english"] == evolve["evolution"])
-                        ),
-                        None,
-                    )  # Make better
-                if pokemon is None:
-                    # log.debug(
-                    #     f"Error occured trying to find {evolve['evolution']} for an evolution."
-                    # )
-                    return
-                if nick is not None:
-                    pokemon["nickname"] = nick
-                pokemon["xp"] = 0
-                pokemon["level"] = lvl
-                pokemon["ivs"] = ivs
-                pokemon["gender"] = gender
-                pokemon["stats"] = stats
-                if not userconf["silence"]:
+
+                if updates:
+                    async with self.cursor.transaction():
+                        await self.cursor.execute_many(query=UPDATE_POKEMON, values=updates)
+                        await self.cursor.execute_many(
+                            query=INCREMENT_DEX_COUNT,
+                            values=[
+                                {"user_id": user_id, "species_id": species_id, "amount": 1}
+                                for user_id, species_id in evolutions
+                            ],
+                        )
+                        await self.cursor.execute_many(
+                            query=ADD_GUILD_TRAINER,
+                            values=[
+                                {"guild_id": entry.channel.guild.id, "user_id": user_id}
+                                for user_id, entry in pending.items()
+                            ],
+                        )
+            self.usercache.evict_idle()
+
+        for channel, embed in announcements:
+            channel = self.levelup_channel(channel)
+            if channel is not None:
+                await channel.send(embed=embed)
+
+    def levelup_channel(self, channel):
+        guildcache = self.guildcache.get(channel.guild.id, {})
+        if not guildcache.get("levelup_messages"):
+            return None
+        if channel.id in guildcache["activechannels"] or not guildcache["activechannels"]:
+            return channel
+        return None
+
+    async def gain_xp(self, pokemon, user, channel, userconf):
+        """Apply one experience tick in place, returns an optional embed and whether it evolved."""
+        xp = random.randint(5, 25) + (pokemon.level // 2)
+        pokemon.xp += xp
+        if pokemon.xp < self.calc_xp(pokemon.level):
+            return None, False
+        embed = None
+        pokemon.level += 1
+        pokemon.xp = 0
+        evolve = self.evolvedata.get(pokemon.species.name)
+        name = (
+            self.get_name(pokemon.species, user)
+            if pokemon.nickname is None
+            else f'"{pokemon.nickname}"'
+        )
+        if evolve is not None and (pokemon.level >= int(evolve["level"])):
+            evolved = self.species.evolution(evolve["evolution"], pokemon.species.variant)
+            if evolved is not None:
+                # Level, IVs, gender, nickname and stats are kept, only the species changes.
+                pokemon.species = evolved
+                if not userconf.get("silence"):
                     embed = discord.Embed(
                         title=_("Congratulations {user}!").format(user=user.display_name),
                         description=_("Your {name} has evolved into {evolvename}!").format(
-                            name=name, evolvename=self.get_name(pokemon["name"], user)
+                            name=name, evolvename=self.get_name(evolved, user)
                         ),
                         color=await self.bot.get_embed_color(channel),
                     )
-                log.debug(f"{name} has evolved into {pokemon['name']} for {user}.")
-                async with self.config.user(user).pokeids() as poke:
-                    if str(pokemon["id"]) not in poke:
-                        poke[str(pokemon["id"])] = 1
-                    else:
-                        poke[str(pokemon["id"])] += 1
-            else:
-                log.debug(f"{pokemon['name']} levelled up for {user}")
-                for stat in pokemon["stats"]:
-                    pokemon["stats"][stat] = int(pokemon["stats"][stat]) + random.randint(1, 3)
-                if not userconf["silence"]:
-                    embed = discord.Embed(
-                        title=_("Congratulations {user}!").format(user=user.display_name),
-                        description=_("Your {name} has levelled up to level {level}!").format(
-                            name=name, level=pokemon["level"]
-                        ),
-                        color=await self.bot.get_embed_color(channel),
-                    )
-            if embed is not None:
-                if (
-                    self.guildcache[channel.guild.id].get("levelup_messages")
-                    and channel.id in self.guildcache[channel.guild.id]["activechannels"]
-                ):
-                    channel = channel
-                elif (
-                    self.guildcache[channel.guild.id].get("levelup_messages")
-                    and not self.guildcache[channel.guild.id]["activechannels"]
-                ):
-                    channel = channel
-                else:
-                    channel = None
-                if channel is not None:
-                    await channel.send(embed=embed)
-        # data = (user.id, msg_id, json.dumps(pokemon))
-        await self.cursor.execute(
-            query=UPDATE_POKEMON,
-            values={"user_id": user.id, "message_id": msg_id, "pokemon": json.dumps(pokemon)},
-        )
-        # task = functools.partial(self.safe_write, UPDATE_POKEMON, data)
-        # await self.bot.loop.run_in_executor(self._executor, task)
+                log.debug(f"{name} has evolved into {evolved.name} for {user}.")
+                return embed, True
+            # The evolution is missing from the catalog, level up as normal instead.
+            log.debug(f"Could not find {evolve['evolution']} to evolve {name} into.")
+        log.debug(f"{pokemon.species.name} levelled up for {user}")
+        pokemon.stats = tuple(stat + random.randint(1, 3) for stat in pokemon.stats)
+        if not userconf.get("silence"):
+            embed = discord.Embed(
+                title=_("Congratulations {user}!").format(user=user.display_name),
+                description=_("Your {name} has levelled up to level {level}!").format(
+                    name=name, level=pokemon.level
+                ),
+                color=await self.bot.get_embed_color(channel),
+            )
+        return embed, False
 
     @commands.command(hidden=True)
     async def fpokesim(self, ctx, amount: int = 1000000):
-        """Sim Pokémon spawning - This is blocking."""
-        a = {}
-        for _ in range(amount):
-            pokemon = self.pokemon_choose()
-            variant = pokemon.get("variant", "Normal")
-            if variant not in a:
-                a[variant] = 1
-            else:
-                a[variant] += 1
-        await ctx.send(a)
+        """Sim Pokémon spawning.
+
+        Compares the spawns per variant against the configured spawn chances."""
+        sampler = self.spawnsampler
+        total = sum(sampler.weights)
+        expected = {}
+        for pokemon, weight in zip(sampler.items, sampler.weights):
+            variant = pokemon.variant or "Normal"
+            expected[variant] = expected.get(variant, 0) + weight / total * amount
+        async with ctx.typing():
+            a = await self.bot.loop.run_in_executor(
+                None, sampler.count, amount, lambda pokemon: pokemon.variant or "Normal"
+            )
+        await ctx.send(
+            box(
+                tabulate.tabulate(
+                    [
+                        [
+                            variant,
+                            a.get(variant, 0),
+                            round(value),
+                            f"{(a.get(variant, 0) - value) / amount:+.4%}",
+                        ]
+                        for variant, value in expected.items()
+                    ],
+                    headers=["Variant", "Spawned", "Expected", "Deviation"],
+                )
+            )
+        )
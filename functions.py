@@ -1,10 +1,58 @@
+import random
+from typing import Optional, Sequence, Tuple
+
 import discord
 import tabulate
-from redbot.core.i18n import Translator
+from redbot.core.i18n import Translator, get_locale
 from redbot.core.utils.chat_formatting import box
 
 _ = Translator("Fakemoncord", __file__)
 
+STATS = ("HP", "Attack", "Defence", "Sp. Atk", "Sp. Def", "Speed")
+GENDERS = [
+    "Male \N{MALE SIGN}\N{VARIATION SELECTOR-16}",
+    "Female \N{FEMALE SIGN}\N{VARIATION SELECTOR-16}",
+]
+# Stored gender codes, the index is what is written to the database.
+GENDER_CODES = ["N/A", *GENDERS, "Genderless"]
+IV_BITS = 5
+STAT_BITS = 10
+
+
+def pack_stats(values: Sequence[int], bits: int) -> int:
+    """Pack the six stat values, in `STATS` order, into a single integer, `bits` per stat."""
+    mask = (1 << bits) - 1
+    packed = 0
+    for i, value in enumerate(values):
+        packed |= min(max(int(value), 0), mask) << (i * bits)
+    return packed
+
+
+def unpack_stats(packed: int, bits: int) -> Tuple[int, ...]:
+    mask = (1 << bits) - 1
+    return tuple((packed >> (i * bits)) & mask for i in range(len(STATS)))
+
+
+def random_ivs() -> Tuple[int, ...]:
+    return tuple(random.randint(0, 31) for _ in STATS)
+
+
+def pokemon_values(pokemon, **values) -> dict:
+    """Typed column values for a Pokémon, extra values are merged in."""
+    species = pokemon.species
+    return {
+        "species_id": species.id or 0,
+        "variant": species.variant,
+        "alias": species.alias,
+        "level": pokemon.level,
+        "xp": pokemon.xp,
+        "gender": GENDER_CODES.index(pokemon.gender) if pokemon.gender in GENDER_CODES else 0,
+        "nickname": pokemon.nickname,
+        "ivs": pack_stats(pokemon.ivs, IV_BITS),
+        "stats": pack_stats(pokemon.stats, STAT_BITS),
+        **values,
+    }
+
 
 def chunks(l, n):
     """Yield successive n-sized chunks from l."""
@@ -12,68 +60,90 @@ def chunks(l, n):
         yield l[i : i + n]
 
 
-async def poke_embed(cog, ctx, pokemon, *, file=False, menu=None):
-    stats = pokemon["stats"]
-    ivs = pokemon["ivs"]
+def render_pokemon(cog, user, pokemon) -> Tuple[str, str, Optional[str]]:
+    """The title, description and thumbnail URL of a Pokémon's embed.
+
+    Saved Pokémon are rendered once per row version and locale, paging back
+    over them or showing them again reuses the stats table and text."""
+    userconf = cog.usercache.get(user.id)
+    key = (
+        pokemon.message_id,
+        pokemon.version,
+        userconf["locale"] if userconf is not None else None,
+        get_locale(),
+    )
+    if pokemon.message_id is not None:
+        parts = cog.embedcache.get(key)
+        if parts is not None:
+            return parts
+    species = pokemon.species
+    stats = pokemon.stats
+    ivs = pokemon.ivs
     pokestats = tabulate.tabulate(
         [
-            [_("HP"), stats["HP"], ivs["HP"]],
-            [_("Attack"), stats["Attack"], ivs["Attack"]],
-            [_("Defence"), stats["Defence"], ivs["Defence"]],
-            [_("Sp. Atk"), stats["Sp. Atk"], ivs["Sp. Atk"]],
-            [_("Sp. Def"), stats["Sp. Def"], ivs["Sp. Def"]],
-            [_("Speed"), stats["Speed"], ivs["Speed"]],
+            [_("HP"), stats[0], ivs[0]],
+            [_("Attack"), stats[1], ivs[1]],
+            [_("Defence"), stats[2], ivs[2]],
+            [_("Sp. Atk"), stats[3], ivs[3]],
+            [_("Sp. Def"), stats[4], ivs[4]],
+            [_("Speed"), stats[5], ivs[5]],
         ],
         headers=[_("Stats"), _("Value"), _("IV")],
     )
-    nick = pokemon.get("nickname")
+    nick = pokemon.nickname
     alias = _("**Nickname**: {nick}\n").format(nick=nick) if nick is not None else ""
     variant = (
-        _("**Variant**: {variant}\n").format(variant=pokemon.get("variant"))
-        if pokemon.get("variant")
-        else ""
+        _("**Variant**: {variant}\n").format(variant=species.variant) if species.variant else ""
     )
-    types = ", ".join(pokemon["type"])
+    types = ", ".join(species.types)
     desc = _(
         "**ID**: {id}\n{alias}**Level**: {level}\n**Type**: {type}\n**Gender**: {gender}\n**XP**: {xp}/{totalxp}\n{variant}{stats}"
     ).format(
-        id=f"#{pokemon.get('id')}" if pokemon.get("id") else "0",
+        id=f"#{species.id}" if species.id else "0",
         alias=alias,
-        level=pokemon["level"],
+        level=pokemon.level,
         type=types,
-        gender=pokemon.get("gender", "N/A"),
+        gender=pokemon.gender,
         variant=variant,
-        xp=pokemon["xp"],
-        totalxp=cog.calc_xp(pokemon["level"]),
+        xp=pokemon.xp,
+        totalxp=cog.calc_xp(pokemon.level),
         stats=box(pokestats, lang="prolog"),
     )
-    embed = discord.Embed(
-        title=cog.get_name(pokemon["name"], ctx.author)
-        if not pokemon.get("alias", False)
-        else pokemon.get("alias"),
-        description=desc,
+    thumbnail = None
+    if species.id:
+        thumbnail = (
+            f"https://assets.pokemon.com/assets/cms2/img/pokedex/detail/{str(species.id).zfill(3)}.png"
+            if not species.url
+            else species.url
+        )
+    parts = (
+        cog.get_name(species, user) if not species.alias else species.alias,
+        desc,
+        thumbnail,
     )
-    embed.set_footer(text=_("Pokémon ID: {number}").format(number=pokemon["sid"]))
+    if pokemon.message_id is not None:
+        cog.embedcache.set(key, parts)
+    return parts
+
+
+async def poke_embed(cog, ctx, pokemon, *, file=False, menu=None):
+    species = pokemon.species
+    title, desc, thumbnail = render_pokemon(cog, ctx.author, pokemon)
+    embed = discord.Embed(title=title, description=desc)
+    embed.set_footer(text=_("Pokémon ID: {number}").format(number=pokemon.slot))
     if file:
         _file = discord.File(
-            cog.datapath
-            + f'/pokemon/{pokemon["name"]["english"] if not pokemon.get("variant") else pokemon.get("alias") if pokemon.get("alias") else pokemon["name"]["english"]}.png'.replace(
-                ":", ""
-            ),
+            f"{cog.datapath}/pokemon/{species.image_name}.png",
             filename="pokemonspawn.png",
         )
         embed.set_thumbnail(url="attachment://pokemonspawn.png")
         return embed, _file
     else:
-        if pokemon.get("id"):
-            embed.set_thumbnail(
-                url=f"https://assets.pokemon.com/assets/cms2/img/pokedex/detail/{str(pokemon['id']).zfill(3)}.png"
-                if not pokemon.get("url")
-                else pokemon.get("url")
-            )
+        if thumbnail is not None:
+            embed.set_thumbnail(url=thumbnail)
         embed.set_footer(
             text=_("Pokémon ID: {number}/{amount}").format(
-                number=pokemon["sid"], amount=menu.get_max_pages()
+                number=pokemon.slot, amount=menu.get_max_pages()
             )
         )
         return embed
@@ -1,6 +1,5 @@
 import asyncio
-import copy
-import json
+from typing import Union
 
 import discord
 import tabulate
@@ -11,9 +10,10 @@ from redbot.core.utils.predicates import MessagePredicate
 
 from .abc import MixinMeta
 from .converters import Args
-from .functions import chunks, poke_embed
-from .menus import GenericMenu, PokedexFormat, PokeList, PokeListMenu, SearchFormat
-from .pokemixin import poke
+from .functions import poke_embed, pokemon_values
+from .menus import GenericMenu, PokedexFormat, PokeList, PokeListMenu, SearchSource
+from .pokemixin import collection_ready, poke
+from .search import PokemonSearch
 from .statements import *
 
 _ = Translator("Fakemoncord", __file__)
@@ -35,13 +35,8 @@ class GeneralMixin(MixinMeta):
             )
         user = user or ctx.author
         async with ctx.typing():
-            result = await self.cursor.fetch_all(query=SELECT_POKEMON, values={"user_id": user.id})
-        pokemons = []
-        for i, data in enumerate(result, start=1):
-            poke = json.loads(data[0])
-            poke["sid"] = i
-            pokemons.append(poke)
-        if not pokemons:
+            count = await self.count_pokemon(user.id)
+        if not count:
             return await ctx.send(_("You don't have any pokémon, go get catching trainer!"))
         _id = await conf.pokeid()
         await ctx.send(
@@ -49,7 +44,7 @@ class GeneralMixin(MixinMeta):
             delete_after=5,
         )
         await PokeListMenu(
-            source=PokeList(pokemons),
+            source=PokeList(self, user.id, count),
             cog=self,
             ctx=ctx,
             user=user,
@@ -58,6 +53,7 @@ class GeneralMixin(MixinMeta):
 
     @commands.max_concurrency(1, commands.BucketType.user)
     @poke.command()
+    @collection_ready()
     async def fnick(self, ctx, id: int, *, nickname: str):
         """Set a Pokémon's nickname.
 
@@ -77,39 +73,31 @@ class GeneralMixin(MixinMeta):
                 "The nickname you have specified is too big. It must be under 40 characters."
             )
             return
-        async with ctx.typing():
-            result = await self.cursor.fetch_all(
-                query=SELECT_POKEMON, values={"user_id": ctx.author.id}
-            )
-        pokemons = [None]
-        for data in result:
-            pokemons.append([json.loads(data[0]), data[1]])
-        if not pokemons:
-            return await ctx.send(_("You don't have any Pokémon, trainer!"))
-        if id > len(pokemons):
+        async with ctx.typing(), self.userlocks(ctx.author.id):
+            pokemon = await self.fetch_slot(ctx.author.id, id)
+            if pokemon is not None:
+                pokemon.nickname = nickname
+                await self.cursor.execute(
+                    query=UPDATE_POKEMON,
+                    values=pokemon_values(
+                        pokemon, user_id=ctx.author.id, message_id=pokemon.message_id
+                    ),
+                )
+        if pokemon is None:
             return await ctx.send(
                 _(
                     "You don't have a Pokémon at that slot.\nID refers to the position within your Pokémon listing.\nThis is found at the bottom of the Pokémon on `[p]list`"
                 )
             )
-        pokemon = pokemons[id]
-        pokemon[0]["nickname"] = nickname
-        await self.cursor.execute(
-            query=UPDATE_POKEMON,
-            values={
-                "user_id": ctx.author.id,
-                "message_id": pokemon[1],
-                "pokemon": json.dumps(pokemon[0]),
-            },
-        )
         await ctx.send(
             _("Your {pokemon} has been nicknamed `{nickname}`").format(
-                pokemon=self.get_name(pokemon[0]["name"], ctx.author), nickname=nickname
+                pokemon=self.get_name(pokemon.species, ctx.author), nickname=nickname
             )
         )
 
     @commands.max_concurrency(1, commands.BucketType.user)
     @poke.command(aliases=["free"])
+    @collection_ready()
     async def frelease(self, ctx, id: int):
         """Release a Pokémon."""
         conf = await self.user_is_global(ctx.author)
@@ -122,24 +110,15 @@ class GeneralMixin(MixinMeta):
         if id <= 0:
             return await ctx.send(_("The ID must be greater than 0!"))
         async with ctx.typing():
-            result = await self.cursor.fetch_all(
-                query=SELECT_POKEMON,
-                values={"user_id": ctx.author.id},
-            )
-        pokemons = [None]
-        for data in result:
-            pokemons.append([json.loads(data[0]), data[1]])
-        if not pokemons:
-            return await ctx.send(_("You don't have any Pokémon, trainer!"))
-        if id >= len(pokemons):
+            pokemon = await self.fetch_slot(ctx.author.id, id)
+        if pokemon is None:
             return await ctx.send(
                 _(
                     "You don't have a Pokémon at that slot.\nID refers to the position within your Pokémon listing.\nThis is found at the bottom of the Pokémon on `[p]list`"
                 )
             )
-        pokemon = pokemons[id]
-        name = self.get_name(pokemon[0]["name"], ctx.author)
-        if len(pokemons) == 2:
+        name = self.get_name(pokemon.species, ctx.author)
+        if await self.count_pokemon(ctx.author.id) == 1:
             return await ctx.send(
                 _(
                     f"**{name}** is the last Pokémon you've got. You cannot release it to the wilds."
@@ -159,22 +138,25 @@ class GeneralMixin(MixinMeta):
 
         if pred.result:
             msg = ""
-            userconf = await self.user_is_global(ctx.author)
-            pokeid = await userconf.pokeid()
-            if id < pokeid:
-                msg += _(
-                    "\nYour default Pokémon may have changed. I have tried to account for this change."
-                )
-                await userconf.pokeid.set(pokeid - 1)
-            elif id == pokeid:
-                msg += _(
-                    "\nYou have released your selected Pokémon. I have reset your selected Pokémon to your first Pokémon."
-                )
-                await userconf.pokeid.set(1)
-            await self.cursor.execute(
-                query="DELETE FROM users where message_id = :message_id",
-                values={"message_id": pokemon[1]},
-            )
+            async with self.userlocks(ctx.author.id):
+                # Its slot may have moved while we waited for the answer.
+                id = await self.release_pokemon(ctx.author.id, pokemon.message_id)
+                if id is None:
+                    return await ctx.send(_("You don't have that Pokémon anymore."))
+                userconf = await self.user_is_global(ctx.author)
+                pokeid = await userconf.pokeid()
+                if id < pokeid:
+                    msg += _(
+                        "\nYour default Pokémon may have changed. I have tried to account for this change."
+                    )
+                    await userconf.pokeid.set(pokeid - 1)
+                    self.usercache.update(ctx.author.id, pokeid=pokeid - 1)
+                elif id == pokeid:
+                    msg += _(
+                        "\nYou have released your selected Pokémon. I have reset your selected Pokémon to your first Pokémon."
+                    )
+                    await userconf.pokeid.set(1)
+                    self.usercache.update(ctx.author.id, pokeid=1)
             await ctx.send(_("Your {name} has been freed.{msg}").format(name=name, msg=msg))
         else:
             await ctx.send(_("Operation cancelled."))
@@ -182,6 +164,7 @@ class GeneralMixin(MixinMeta):
     @commands.max_concurrency(1, commands.BucketType.user)
     @commands.command(usage="id_or_latest")
     @commands.guild_only()
+    @collection_ready()
     async def fselect(self, ctx, _id: Union[int, str]):
         """Select your default Pokémon."""
         conf = await self.user_is_global(ctx.author)
@@ -192,24 +175,16 @@ class GeneralMixin(MixinMeta):
                 ).format(prefix=ctx.clean_prefix)
             )
         async with ctx.typing():
-            result = await self.cursor.fetch_all(
-                query="""SELECT Pokémon, message_id from users where user_id = :user_id""",
-                values={"user_id": ctx.author.id},
-            )
-            pokemons = [None]
-            for data in result:
-                pokemons.append([json.loads(data[0]), data[1]])
-            if not pokemons:
-                return await ctx.send(_("You don't have any Pokémon to select."))
             if isinstance(_id, str):
                 if _id == "latest":
-                    _id = len(pokemons) - 1
+                    _id = await self.count_pokemon(ctx.author.id)
                 else:
                     await ctx.send(
                         _("Unidentified keyword, the only supported action is `latest` as of now.")
                     )
                     return
-            if _id < 1 or _id > len(pokemons) - 1:
+            pokemon = await self.fetch_slot(ctx.author.id, _id)
+            if pokemon is None:
                 return await ctx.send(
                     _(
                         "You've specified an invalid ID.\nID refers to the position within your Pokémon listing.\nThis is found at the bottom of the Pokémon on `[p]list`"
@@ -217,30 +192,28 @@ class GeneralMixin(MixinMeta):
                 )
             await ctx.send(
                 _("You have selected {pokemon} as your default Pokémon.").format(
-                    pokemon=self.get_name(pokemons[_id][0]["name"], ctx.author)
+                    pokemon=self.get_name(pokemon.species, ctx.author)
                 )
             )
         conf = await self.user_is_global(ctx.author)
         await conf.pokeid.set(_id)
-        await self.update_user_cache()
+        self.usercache.update(ctx.author.id, pokeid=_id)
 
     @commands.command()
     @commands.max_concurrency(1, commands.BucketType.user)
     async def fdex(self, ctx):
         """Check your caught Pokémon!"""
         async with ctx.typing():
-            pokemons = await self.config.user(ctx.author).pokeids()
-            pokemonlist = copy.deepcopy(self.pokemonlist)
-            for i, pokemon in enumerate(pokemonlist, start=1):
-                if str(pokemon) in pokemons:
-                    pokemonlist[i]["amount"] = pokemons[str(pokemon)]
-            a = [value for value in pokemonlist.items()]
-            chunked = [item for item in chunks(a, 20)]
+            total = await self.cursor.fetch_val(
+                query=SELECT_DEX_TOTAL, values={"user_id": ctx.author.id}
+            )
+            userconf = self.usercache.get(ctx.author.id)
+            locale = userconf["locale"] if userconf is not None else "en"
             await GenericMenu(
-                source=PokedexFormat(chunked),
+                source=PokedexFormat(self.pokedex.pages(locale), ctx.author.id, total),
                 delete_message_after=False,
                 cog=self,
-                len_poke=len(pokemonlist),
+                len_poke=len(self.pokedex),
             ).start(
                 ctx=ctx,
                 wait=False,
@@ -258,54 +231,22 @@ class GeneralMixin(MixinMeta):
             `--type`   | `--t` - Search Pokémon by type.
             `--gender` | `--g` - Search by gender.
             `--iv` | - Search by total IV.
+
+        Filters can be combined, all of them have to match.
+        Level, ID and IV accept a number or a range such as `50-60`, `>=150` or `150+`.
         """
         async with ctx.typing():
-            result = await self.cursor.fetch_all(
-                query="""SELECT Pokémon, message_id from users where user_id = :user_id""",
-                values={"user_id": ctx.author.id},
-            )
-            if not result:
-                await ctx.send(_("You don't have any Pokémon, trainer!"))
-            pokemons = [None]
-            for data in result:
-                pokemons.append([json.loads(data[0]), data[1]])
-            correct = ""
-            for i, poke in enumerate(pokemons[1:], 1):
-                name = self.get_name(poke[0]["name"], ctx.author)
-                poke_str = _(
-                    "{pokemon} **|** Level: {level} **|** ID: {id} **|** Index: {index}\n"
-                ).format(pokemon=name, level=poke[0]["level"], id=poke[0]["id"], index=i)
-                if args["names"]:
-                    if name.lower() == args["names"].lower():
-                        correct += poke_str
-                elif args["level"]:
-                    if poke[0]["level"] == args["level"][0]:
-                        correct += poke_str
-                elif args["id"]:
-                    if poke[0]["id"] == args["id"][0]:
-                        correct += poke_str
-                elif args["variant"]:
-                    if poke[0].get("variant", "None").lower() == args["variant"].lower():
-                        correct += poke_str
-                elif args["iv"]:
-                    if sum(poke[0]["ivs"].values()) == args["iv"][0]:
-                        correct += poke_str
-                elif args["gender"]:
-                    if (
-                        args["gender"].lower()
-                        == poke[0].get("gender", "No Gender").lower().split()[0]
-                    ):
-                        correct += poke_str
-                elif args["type"]:
-                    if args["type"].lower() in [x.lower() for x in poke[0]["type"]]:
-                        correct += poke_str
-
-            if not correct:
+            search = PokemonSearch(ctx.author.id, args, self.pokemondata)
+            count = await self.cursor.fetch_val(query=search.count_query(), values=search.values)
+            if not count:
+                if not await self.count_pokemon(ctx.author.id):
+                    await ctx.send(_("You don't have any Pokémon, trainer!"))
+                    return
                 await ctx.send("No Pokémon returned for that search.")
                 return
-            content = list(pagify(correct, page_length=1024))
             await GenericMenu(
-                source=SearchFormat(content),
+                source=SearchSource(self, search, count),
+                cog=self,
                 delete_message_after=False,
             ).start(ctx=ctx, wait=False)
 
@@ -321,26 +262,19 @@ class GeneralMixin(MixinMeta):
                 ).format(prefix=ctx.clean_prefix)
             )
         user = ctx.author
-        async with ctx.typing():
-            result = await self.cursor.fetch_all(query=SELECT_POKEMON, values={"user_id": user.id})
-        pokemons = []
-        for i, data in enumerate(result, start=1):
-            poke = json.loads(data[0])
-            poke["sid"] = i
-            pokemons.append(poke)
-        if not pokemons:
-            return await ctx.send(_("You don't have any Pokémon, go get catching trainer!"))
         _id = await conf.pokeid()
-        try:
-            pokemon = pokemons[_id - 1]
-        except IndexError:
+        async with ctx.typing():
+            result = await self.fetch_slot(user.id, _id)
+        if result is None:
+            if not await self.count_pokemon(user.id):
+                return await ctx.send(_("You don't have any Pokémon, go get catching trainer!"))
             await ctx.send(
                 _(
                     "An error occured trying to find your Pokémon at slot {slotnum}\nAs a result I have set your default Pokémon to 1."
                 ).format(slotnum=_id)
             )
             await conf.pokeid.set(1)
+            self.usercache.update(ctx.author.id, pokeid=1)
             return
-        else:
-            embed, _file = await poke_embed(self, ctx, pokemon, file=True)
-            await ctx.send(embed=embed, file=_file)
+        embed, _file = await poke_embed(self, ctx, result, file=True)
+        await ctx.send(embed=embed, file=_file)
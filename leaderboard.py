@@ -0,0 +1,102 @@
+import sys
+from typing import List, Tuple
+
+import tabulate
+from redbot.core import commands
+from redbot.core.i18n import Translator
+from redbot.core.utils.chat_formatting import *
+
+from .abc import MixinMeta
+from .statements import *
+
+_ = Translator("Fakemoncord", __file__)
+
+BOARDS = {
+    "caught": "caught",
+    "species": "species",
+    "dex": "species",
+    "iv": "best_iv",
+    "ivs": "best_iv",
+    "level": "best_level",
+    "lvl": "best_level",
+}
+LEADERBOARD_SIZE = 10
+# Ranks past this are not counted, the count walks the board's index.
+RANK_LIMIT = 1000
+
+
+class LeaderboardMixin(MixinMeta):
+    """Fakemoncord Leaderboards"""
+
+    async def top_trainers(self, column: str, guild=None) -> List[Tuple[int, int]]:
+        """The leading `(user_id, value)` pairs of a board, optionally only a server's members.
+
+        Reads the board's index in order, so a board costs the rows shown.
+        Server boards have their own index in `guild_stats`, rows of members
+        who left while the bot was offline are skipped."""
+        values = {"value": sys.maxsize, "user_id": 0, "limit": LEADERBOARD_SIZE}
+        if guild is None:
+            query = SELECT_LEADERBOARD.format(column=column)
+        else:
+            query = SELECT_GUILD_LEADERBOARD.format(column=column)
+            values["guild_id"] = guild.id
+        top = []
+        while len(top) < LEADERBOARD_SIZE:
+            result = await self.cursor.fetch_all(query=query, values=values)
+            for data in result:
+                if guild is None or guild.get_member(data[0]) is not None:
+                    top.append((data[0], data[1]))
+            if len(result) < values["limit"]:
+                break
+            values["user_id"], values["value"] = result[-1][0], result[-1][1]
+        return top[:LEADERBOARD_SIZE]
+
+    async def trainer_rank(self, column: str, user_id: int, guild=None) -> Tuple[int, int]:
+        """A trainer's `(value, rank)` on a board, the rank is 0 past `RANK_LIMIT`."""
+        value = await self.cursor.fetch_val(
+            query=SELECT_TRAINER_STAT.format(column=column), values={"user_id": user_id}
+        )
+        if not value:
+            return 0, 0
+        values = {"value": value, "limit": RANK_LIMIT}
+        if guild is None:
+            query = SELECT_LEADERBOARD_RANK.format(column=column)
+        else:
+            query = SELECT_GUILD_LEADERBOARD_RANK.format(column=column)
+            values["guild_id"] = guild.id
+        above = await self.cursor.fetch_val(query=query, values=values)
+        return value, (above + 1 if above < RANK_LIMIT else 0)
+
+    @commands.command(aliases=["flb"], usage="[caught|species|iv|level] [server|global]")
+    async def fleaderboard(self, ctx, board: str = "caught", scope: str = "server"):
+        """Show the top trainers.
+
+        Boards are the most Pokémon caught, the most species in the Pokédex,
+        the highest IV total and the highest level."""
+        column = BOARDS.get(board.lower())
+        if column is None:
+            return await ctx.send(
+                _("Valid leaderboards are {boards}.").format(
+                    boards=humanize_list(["caught", "species", "iv", "level"])
+                )
+            )
+        guild = ctx.guild if scope.lower() != "global" else None
+        async with ctx.typing():
+            top = await self.top_trainers(column, guild)
+            value, rank = await self.trainer_rank(column, ctx.author.id, guild)
+        if not top:
+            return await ctx.send(_("Nobody is on this leaderboard yet."))
+        rows = []
+        for rank, (user_id, value) in enumerate(top, start=1):
+            member = guild.get_member(user_id) if guild is not None else None
+            user = member or self.bot.get_user(user_id)
+            name = user.display_name if user is not None else str(user_id)
+            rows.append([rank, name, value])
+        msg = tabulate.tabulate(rows, headers=["#", _("Trainer"), board.lower()])
+        if rank:
+            msg += "\n\n" + _("Your rank is {rank} with {value}.").format(rank=rank, value=value)
+        elif value:
+            msg += "\n\n" + _("You are outside the top {limit} with {value}.").format(
+                limit=RANK_LIMIT, value=value
+            )
+        await ctx.send(box(msg))
@@ -0,0 +1,38 @@
+import asyncio
+import contextlib
+import weakref
+from typing import AsyncIterator
+
+
+class UserLocks:
+    """One lock per trainer, serializing every change to their collection.
+
+    Locks are created on first use and only weakly held here, the holder
+    and the tasks waiting on a lock keep it alive, so an idle trainer's
+    lock disappears by itself. Unrelated trainers never wait on each other.
+
+    Locks are not reentrant, so take them in the commands and loops that
+    change a collection, never in the helpers those call. Code that needs
+    several trainers must use `many`, which locks them in a fixed order so
+    two such callers can't deadlock."""
+
+    def __init__(self):
+        self._locks: "weakref.WeakValueDictionary[int, asyncio.Lock]" = (
+            weakref.WeakValueDictionary()
+        )
+
+    def __len__(self):
+        return len(self._locks)
+
+    def __call__(self, user_id: int) -> asyncio.Lock:
+        lock = self._locks.get(user_id)
+        if lock is None:
+            lock = self._locks[user_id] = asyncio.Lock()
+        return lock
+
+    @contextlib.asynccontextmanager
+    async def many(self, *user_ids: int) -> AsyncIterator[None]:
+        async with contextlib.AsyncExitStack() as stack:
+            for user_id in sorted(set(user_ids)):
+                await stack.enter_async_context(self(user_id))
+            yield
@@ -1,6 +1,6 @@
 import asyncio
 import contextlib
-from typing import Any, Dict, Iterable, List, Optional
+from typing import Any, Dict, List, Optional, Sequence
 
 import discord
 import tabulate
@@ -9,12 +9,48 @@ from redbot.core.i18n import Translator
 from redbot.core.utils.predicates import MessagePredicate
 from redbot.vendored.discord.ext import menus
 
-from .functions import poke_embed
+from .catalog import DexEntry, Pokemon
+from .functions import poke_embed, render_pokemon
+from .statements import SELECT_DEX_COUNTS, SELECT_POKEMON_PAGE
 
 _ = Translator("Fakemoncord", __file__)
 
 
-class PokeListMenu(menus.MenuPages, inherit_buttons=False):
+class DispatchedMenu(menus.MenuPages, inherit_buttons=False):
+    """A menu fed by the cog's MenuDispatcher instead of its own reaction listeners.
+
+    The vendored loop waits on every raw reaction with `reaction_check`, so
+    each open menu adds a check to every reaction the bot sees. This one
+    parks until the dispatcher idles it out or the menu is stopped, then
+    cleans up the same way."""
+
+    async def _internal_loop(self):
+        if self.cog is None:
+            return await super()._internal_loop()
+        timed_out = False
+        try:
+            timed_out = await self.cog.dispatcher.attach(self)
+        finally:
+            self.cog.dispatcher.detach(self)
+            self._event.set()
+            with contextlib.suppress(Exception):
+                await self.finalize(timed_out)
+            if not self.bot.is_closed():
+                with contextlib.suppress(Exception):
+                    await self._cleanup_message()
+
+    async def _cleanup_message(self):
+        if self.delete_message_after:
+            return await self.message.delete()
+        if self.clear_reactions_after:
+            if self._can_remove_reactions:
+                return await self.message.clear_reactions()
+            for button_emoji in self.buttons:
+                with contextlib.suppress(discord.HTTPException):
+                    await self.message.remove_reaction(button_emoji, self.ctx.me)
+
+
+class PokeListMenu(DispatchedMenu, inherit_buttons=False):
     def __init__(
         self,
         source: menus.PageSource,
@@ -67,8 +103,12 @@ class PokeListMenu(menus.MenuPages, inherit_buttons=False):
         async with self._search_lock:
             prompt = await self.ctx.send(_("Please select the Pokémon ID number to jump to."))
             try:
-                pred = MessagePredicate.valid_int(self.ctx)
-                msg = await self.bot.wait_for("message_without_command", check=pred, timeout=10.0)
+                msg = await self.cog.dispatcher.wait_for_reply(
+                    self.ctx.channel.id,
+                    self.ctx.author.id,
+                    MessagePredicate.valid_int(self.ctx),
+                    timeout=10.0,
+                )
                 jump_page = int(msg.content)
                 if jump_page > self._source.get_max_pages():
                     await self.ctx.send(
@@ -142,16 +182,83 @@ class PokeListMenu(menus.MenuPages, inherit_buttons=False):
         await self.ctx.invoke(command, _id=self.current_page + 1)
 
 
-class PokeList(menus.ListPageSource):
-    def __init__(self, entries: Iterable[str]):
-        super().__init__(entries, per_page=1)
+class PokeList(menus.PageSource):
+    """A trainer's Pokémon, one per page, fetched lazily around the page being shown.
+
+    Pages map directly onto slots, so each fetch is a keyset range over the
+    slot index and only a small window of rows is held at any time. While a
+    page is read the pages either side of it are rendered into the embed
+    cache, so flipping to them doesn't wait on tabulating."""
 
-    async def format_page(self, menu: PokeListMenu, pokemon: Dict) -> str:
+    def __init__(self, cog: commands.Cog, user_id: int, count: int, prefetch: int = 5):
+        self.cog = cog
+        self.user_id = user_id
+        self.prefetch = prefetch
+        self._max_pages = count
+        self._window: Dict[int, Any] = {}
+        self._prerender_task: Optional[asyncio.Task] = None
+
+    def is_paginating(self) -> bool:
+        return self._max_pages > 1
+
+    def get_max_pages(self) -> int:
+        return self._max_pages
+
+    async def _fetch_window(self, slot: int):
+        result = await self.cog.cursor.fetch_all(
+            query=SELECT_POKEMON_PAGE,
+            values={
+                "user_id": self.user_id,
+                "position": max(slot - self.prefetch, 1),
+                "limit": self.prefetch * 2 + 1,
+            },
+        )
+        self._window = {data["position"]: data for data in result}
+
+    async def get_page(self, page_number: int) -> Optional[Pokemon]:
+        """The Pokémon at a page, None once the trainer has none left."""
+        slot = page_number + 1
+        if slot not in self._window:
+            await self._fetch_window(slot)
+        if slot not in self._window:
+            # The collection shrunk while the menu was open, show the last Pokémon instead.
+            self._max_pages = await self.cog.count_pokemon(self.user_id)
+            slot = self._max_pages
+            if slot:
+                await self._fetch_window(slot)
+        data = self._window.get(slot)
+        return self.cog.decode_pokemon(data) if data is not None else None
+
+    async def prerender(self, menu: PokeListMenu, slot: int):
+        for neighbour in {slot % self._max_pages + 1, (slot - 2) % self._max_pages + 1}:
+            if neighbour == slot:
+                continue
+            data = self._window.get(neighbour)
+            if data is not None:
+                pokemon = self.cog.decode_pokemon(data)
+            else:
+                pokemon = await self.cog.fetch_slot(self.user_id, neighbour)
+                if pokemon is None:
+                    continue
+            render_pokemon(menu.cog, menu.ctx.author, pokemon)
+
+    async def format_page(self, menu: PokeListMenu, pokemon: Optional[Pokemon]) -> str:
+        if pokemon is None:
+            # Stopped from a task of its own, the jump prompt calling this is one of the
+            # tasks `stop` cancels.
+            asyncio.get_running_loop().create_task(menu.stop())
+            return _("There are no Pokémon left to list.")
         embed = await poke_embed(menu.cog, menu.ctx, pokemon, menu=self)
+        if self._prerender_task is not None:
+            self._prerender_task.cancel()
+        if self._max_pages > 1:
+            self._prerender_task = asyncio.get_running_loop().create_task(
+                self.prerender(menu, pokemon.slot)
+            )
         return embed
 
 
-class GenericMenu(menus.MenuPages, inherit_buttons=False):
+class GenericMenu(DispatchedMenu, inherit_buttons=False):
     def __init__(
         self,
         source: menus.PageSource,
@@ -260,52 +367,84 @@ class GenericMenu(menus.MenuPages, inherit_buttons=False):
         await self.show_page(self._source.get_max_pages() - 1)
 
 
-class SearchFormat(menus.ListPageSource):
-    def __init__(self, entries: Iterable[str]):
-        super().__init__(entries, per_page=1)
+class SearchSource(menus.PageSource):
+    """Search results fetched one page at a time with LIMIT/OFFSET."""
+
+    def __init__(self, cog: commands.Cog, search, count: int, per_page: int = 15):
+        self.cog = cog
+        self.search = search
+        self.per_page = per_page
+        pages, left_over = divmod(count, per_page)
+        if left_over:
+            pages += 1
+        self._max_pages = pages
+
+    def is_paginating(self) -> bool:
+        return self._max_pages > 1
+
+    def get_max_pages(self) -> int:
+        return self._max_pages
+
+    async def get_page(self, page_number: int) -> list:
+        return await self.cog.cursor.fetch_all(
+            query=self.search.page_query(),
+            values=self.search.page_values(self.per_page, page_number * self.per_page),
+        )
 
-    async def format_page(self, menu: GenericMenu, string: str) -> str:
+    async def format_page(self, menu: GenericMenu, rows: list) -> str:
+        description = ""
+        for data in rows:
+            pokemon = self.cog.decode_pokemon(data)
+            description += _(
+                "{pokemon} **|** Level: {level} **|** ID: {id} **|** Index: {index}\n"
+            ).format(
+                pokemon=self.cog.get_name(pokemon.species, menu.ctx.author),
+                level=pokemon.level,
+                id=pokemon.species.id,
+                index=data["position"],
+            )
         embed = discord.Embed(
             title="Pokémon Search",
             color=await menu.ctx.embed_color(),
-            description=string,
+            description=description,
         )
         embed.set_footer(
             text=_("Page {page}/{amount}").format(
-                page=menu.current_page + 1, amount=menu._source.get_max_pages()
+                page=menu.current_page + 1, amount=self.get_max_pages()
             )
         )
         return embed
 
 
 class PokedexFormat(menus.ListPageSource):
-    def __init__(self, entries: Iterable[str]):
-        super().__init__(entries, per_page=1)
+    def __init__(self, pages: Sequence[Sequence[DexEntry]], user_id: int, total: int):
+        super().__init__(pages, per_page=1)
+        self.user_id = user_id
+        self.total = total
 
-    async def format_page(self, menu: GenericMenu, item: List) -> str:
+    async def format_page(self, menu: GenericMenu, item: Sequence[DexEntry]) -> str:
         embed = discord.Embed(title=_("Pokédex"), color=await menu.ctx.embed_colour())
         embed.set_footer(
             text=_("Showing {page}-{lenpages} of {amount}.").format(
                 page=item[0][0], lenpages=item[-1][0], amount=menu.len_poke
             )
         )
-        for pokemon in item:
-            if pokemon[1]["amount"] > 0:
-                msg = _("{amount} caught! \N{WHITE HEAVY CHECK MARK}").format(
-                    amount=pokemon[1]["amount"]
-                )
+        caught = dict(
+            await menu.cog.cursor.fetch_all(
+                query=SELECT_DEX_COUNTS,
+                values={"user_id": self.user_id, "first": item[0][0], "last": item[-1][0]},
+            )
+        )
+        for species_id, label in item:
+            amount = caught.get(species_id, 0)
+            if amount > 0:
+                msg = _("{amount} caught! \N{WHITE HEAVY CHECK MARK}").format(amount=amount)
             else:
                 msg = _("Not caught yet! \N{CROSS MARK}")
-            embed.add_field(
-                name="{pokemonname} {pokemonid}".format(
-                    pokemonname=menu.cog.get_name(pokemon[1]["name"], menu.ctx.author),
-                    pokemonid=pokemon[1]["id"],
-                ),
-                value=msg,
-            )
+            embed.add_field(name=label, value=msg)
         if menu.current_page == 0:
             embed.description = _("You've caught {total} out of {amount} Pokémon.").format(
-                total=len(await menu.cog.config.user(menu.ctx.author).pokeids()),
+                total=self.total,
                 amount=menu.len_poke,
             )
         return embed
@@ -0,0 +1,338 @@
+import asyncio
+import json
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional, Sequence
+
+from .functions import pokemon_values
+from .statements import *
+
+log = logging.getLogger("red.flare.fakemoncord.migrations")
+
+# Config `migration` value of the last release that migrated inside `initalize`.
+LEGACY_CONFIG_MIGRATION = 9
+
+# Copy and number the legacy collections, the commands that write to them wait for these.
+COLLECTION_MIGRATIONS = (1, 2)
+ROW_BATCH = 500
+USER_BATCH = 100
+
+
+class MigrationProgress:
+    """How far a migration got, persisted in the `migrations` table.
+
+    `checkpoint` is the last row or user id a migration finished, steps
+    resume after it. `save` runs on whatever transaction is open, so a
+    batch and its checkpoint commit together."""
+
+    __slots__ = (
+        "migration",
+        "state",
+        "checkpoint",
+        "processed",
+        "total",
+        "started",
+        "finished",
+        "error",
+        "_cursor",
+    )
+
+    def __init__(self, migration: "Migration", cursor, checkpoint=0, processed=0, done=False):
+        self.migration = migration
+        self.state = "done" if done else "pending"
+        self.checkpoint = checkpoint
+        self.processed = processed
+        self.total: Optional[int] = None
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.error: Optional[str] = None
+        self._cursor = cursor
+
+    @property
+    def done(self) -> bool:
+        return self.state == "done"
+
+    async def save(self, checkpoint: int, processed: int = 0, *, done: bool = False):
+        self.checkpoint = checkpoint
+        self.processed += processed
+        await self._cursor.execute(
+            query=SAVE_MIGRATION,
+            values={
+                "version": self.migration.version,
+                "name": self.migration.name,
+                "checkpoint": checkpoint,
+                "processed": self.processed,
+                "done": int(done),
+            },
+        )
+
+
+class Migration:
+    __slots__ = ("version", "name", "func", "background")
+
+    def __init__(
+        self,
+        version: int,
+        name: str,
+        func: Callable[..., Awaitable],
+        *,
+        background: bool = False,
+    ):
+        self.version = version
+        self.name = name
+        self.func = func
+        self.background = background
+
+
+async def migrate_legacy_storage(cog, progress: MigrationProgress):
+    """Copy the JSON blobs of the legacy `users` table into the typed `pokemon` table.
+
+    Rows are copied keeping their rowid, so slot order is preserved."""
+    if await cog.cursor.fetch_val(SELECT_LEGACY_TABLE) is None:
+        return
+    progress.total = await cog.cursor.fetch_val(SELECT_LEGACY_COUNT)
+    while True:
+        result = await cog.cursor.fetch_all(
+            query=SELECT_LEGACY_POKEMON,
+            values={"last": progress.checkpoint, "limit": ROW_BATCH},
+        )
+        if not result:
+            break
+        rows = []
+        for data in result:
+            poke = json.loads(data[3])
+            rows.append(
+                pokemon_values(
+                    cog.normalize_legacy_pokemon(poke),
+                    id=data[0],
+                    user_id=data[1],
+                    message_id=data[2],
+                )
+            )
+        async with cog.cursor.transaction():
+            await cog.cursor.execute_many(query=MIGRATE_LEGACY_POKEMON, values=rows)
+            await progress.save(result[-1][0], len(result))
+
+
+async def migrate_slot_positions(cog, progress: MigrationProgress):
+    """Give every Pokémon a dense, per trainer slot position."""
+    progress.total = await cog.cursor.fetch_val(COUNT_POKEMON_OWNERS)
+    while True:
+        owners = await cog.cursor.fetch_all(
+            query=SELECT_POKEMON_OWNERS,
+            values={"after": progress.checkpoint, "limit": USER_BATCH},
+        )
+        if not owners:
+            break
+        result = await cog.cursor.fetch_all(
+            query=SELECT_POKEMON_IDS,
+            values={"first": owners[0][0], "last": owners[-1][0]},
+        )
+        positions = {}
+        values = []
+        for data in result:
+            position = positions[data[1]] = positions.get(data[1], 0) + 1
+            values.append({"id": data[0], "position": position})
+        async with cog.cursor.transaction():
+            await cog.cursor.execute_many(query=SET_POKEMON_POSITION, values=values)
+            await progress.save(owners[-1][0], len(owners))
+    await cog.cursor.execute(POKECORD_CREATE_POKEMON_SLOT_INDEX)
+
+
+async def create_search_indexes(cog, progress: MigrationProgress):
+    await cog.cursor.execute(POKECORD_CREATE_POKEMON_LEVEL_INDEX)
+    await cog.cursor.execute(POKECORD_CREATE_POKEMON_SPECIES_INDEX)
+    await cog.cursor.execute(POKECORD_CREATE_POKEMON_IV_INDEX)
+
+
+async def import_pokedex_counts(cog, progress: MigrationProgress):
+    """Move every trainer's `pokeids` from Config into the `dex_counts` table.
+
+    Counts are added, so catches made while this runs are kept. Releases
+    older than the last legacy migration left `pokeids` out of date, for
+    those the table is rebuilt from the trainers' collections instead."""
+    if await cog.config.migration() < LEGACY_CONFIG_MIGRATION:
+        await reconcile_dex_counts(cog.cursor, progress)
+        await cog.config.migration.set(LEGACY_CONFIG_MIGRATION)
+        return
+    users = {
+        user: data["pokeids"]
+        for user, data in (await cog.config.all_users()).items()
+        if user > progress.checkpoint and data.get("pokeids")
+    }
+    ordered = sorted(users)
+    progress.total = progress.processed + len(ordered)
+    for start in range(0, len(ordered), USER_BATCH):
+        batch = ordered[start : start + USER_BATCH]
+        values = [
+            {"user_id": user, "species_id": int(species_id), "amount": amount}
+            for user in batch
+            for species_id, amount in users[user].items()
+        ]
+        async with cog.cursor.transaction():
+            await cog.cursor.execute_many(query=INCREMENT_DEX_COUNT, values=values)
+            await progress.save(batch[-1], len(batch))
+
+
+async def owner_ranges(cursor, after: int = 0, batch: int = USER_BATCH):
+    """Yield `(first, last, trainers)` for consecutive ranges of trainers with any data."""
+    while True:
+        owners = await cursor.fetch_all(
+            query=SELECT_DEX_OWNERS, values={"after": after, "limit": batch}
+        )
+        if not owners:
+            return
+        after = owners[-1][0]
+        yield owners[0][0], after, len(owners)
+
+
+async def reconcile_dex_counts(cursor, progress: MigrationProgress = None) -> int:
+    """Rebuild `dex_counts` from the trainers' collections, one user range at a time.
+
+    Returns the number of trainers processed."""
+    processed = 0
+    after = progress.checkpoint if progress is not None else 0
+    async for first, last, trainers in owner_ranges(cursor, after):
+        values = {"first": first, "last": last}
+        async with cursor.transaction():
+            await cursor.execute(query=DELETE_DEX_COUNTS, values=values)
+            await cursor.execute(query=REBUILD_DEX_COUNTS, values=values)
+            if progress is not None:
+                await progress.save(last, trainers)
+        processed += trainers
+    return processed
+
+
+async def rebuild_trainer_stats(cursor, progress: MigrationProgress = None) -> int:
+    """Recompute the leaderboard stats, one user range per transaction.
+
+    The triggers keep maintaining ranges that are already done, so this
+    can run while trainers keep catching. Returns the number of trainers."""
+    processed = 0
+    after = progress.checkpoint if progress is not None else 0
+    async for first, last, trainers in owner_ranges(cursor, after):
+        values = {"first": first, "last": last}
+        async with cursor.transaction():
+            await cursor.execute(query=DELETE_TRAINER_STATS, values=values)
+            await cursor.execute(query=REBUILD_TRAINER_STATS, values=values)
+            if progress is not None:
+                await progress.save(last, trainers)
+        processed += trainers
+    return processed
+
+
+async def build_leaderboards(cog, progress: MigrationProgress):
+    await rebuild_trainer_stats(cog.cursor, progress)
+
+
+async def build_server_leaderboards(cog, progress: MigrationProgress):
+    """Put the trainers already in each server on its leaderboard, one server at a time."""
+    await cog.bot.wait_until_ready()
+    guilds = sorted(
+        (guild for guild in cog.bot.guilds if guild.id > progress.checkpoint),
+        key=lambda guild: guild.id,
+    )
+    progress.total = progress.processed + len(guilds)
+    for guild in guilds:
+        values = [
+            {"guild_id": guild.id, "user_id": member.id}
+            for member in guild.members
+            if not member.bot
+        ]
+        async with cog.cursor.transaction():
+            await cog.cursor.execute_many(query=ADD_GUILD_TRAINER, values=values)
+            await progress.save(guild.id, 1)
+
+
+async def add_pokemon_columns(cog, progress: MigrationProgress):
+    columns = [data[1] for data in await cog.cursor.fetch_all(PRAGMA_pokemon_table_info)]
+    if "position" not in columns:
+        await cog.cursor.execute(ALTER_POKEMON_ADD_POSITION)
+    if "version" not in columns:
+        await cog.cursor.execute(ALTER_POKEMON_ADD_VERSION)
+
+
+MIGRATIONS = (
+    Migration(1, "Legacy storage", migrate_legacy_storage, background=True),
+    Migration(2, "Slot positions", migrate_slot_positions, background=True),
+    Migration(3, "Search indexes", create_search_indexes),
+    Migration(5, "Pokédex table", import_pokedex_counts, background=True),
+    Migration(6, "Leaderboards", build_leaderboards, background=True),
+    Migration(7, "Slot and version columns", add_pokemon_columns),
+    Migration(8, "Server leaderboards", build_server_leaderboards, background=True),
+)
+
+
+class MigrationRunner:
+    """Applies the numbered migrations in order and tracks their progress.
+
+    Foreground migrations only change the schema the cog's queries rely on
+    and are awaited by `initalize`. Background ones rewrite data, they run
+    in a task while the cog serves traffic. Both resume from their last
+    checkpoint after a restart. Until the legacy collections are copied and
+    numbered `importing` is set, and only read paths are served."""
+
+    def __init__(self, cog, migrations: Sequence[Migration] = MIGRATIONS):
+        self.cog = cog
+        self.migrations = migrations
+        self.progress: Dict[int, MigrationProgress] = {}
+        self.task: Optional[asyncio.Task] = None
+
+    async def load(self):
+        cursor = self.cog.cursor
+        await cursor.execute(CREATE_MIGRATIONS_TABLE)
+        recorded = {data[0]: data for data in await cursor.fetch_all(SELECT_MIGRATIONS)}
+        for migration in self.migrations:
+            data = recorded.get(migration.version)
+            self.progress[migration.version] = (
+                MigrationProgress(migration, cursor, data[1], data[2], bool(data[3]))
+                if data is not None
+                else MigrationProgress(migration, cursor)
+            )
+
+    @property
+    def importing(self) -> bool:
+        """Whether the legacy collections are still being copied or numbered."""
+        return not self.progress or any(
+            not self.progress[version].done for version in COLLECTION_MIGRATIONS
+        )
+
+    @property
+    def pending(self) -> bool:
+        return not all(progress.done for progress in self.progress.values())
+
+    async def run(self, *, background: bool = False):
+        for migration in self.migrations:
+            progress = self.progress[migration.version]
+            if progress.done or migration.background != background:
+                continue
+            progress.state = "running"
+            progress.started = time.time()
+            progress.error = None
+            log.info("Running Fakemoncord migration %s: %s", migration.version, migration.name)
+            try:
+                await migration.func(self.cog, progress)
+                await progress.save(progress.checkpoint, done=True)
+            except asyncio.CancelledError:
+                progress.state = "paused"
+                raise
+            except Exception as exc:
+                progress.state = "failed"
+                progress.error = f"{type(exc).__name__}: {exc}"
+                log.exception("Fakemoncord migration %s failed", migration.version)
+                if not background:
+                    raise
+                return
+            progress.state = "done"
+            progress.finished = time.time()
+            log.info("Fakemoncord migration %s complete.", migration.version)
+
+    def start(self):
+        """Run the background migrations in a task."""
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self.run(background=True))
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
@@ -1,4 +1,7 @@
 from redbot.core import commands
+from redbot.core.i18n import Translator
+
+_ = Translator("Fakemoncord", __file__)
 
 
 @commands.group(name="poke")
@@ -12,3 +15,16 @@ class PokeMixin:
     """This is mostly here to easily mess with things..."""
 
     c = poke
+
+
+def collection_ready():
+    """Hold back commands that change a collection while the legacy ones are being imported."""
+
+    async def predicate(ctx: commands.Context) -> bool:
+        if ctx.cog.migrations.importing:
+            raise commands.UserFeedbackCheckFailure(
+                _("Fakemoncord is still importing Pokémon, try again in a few minutes.")
+            )
+        return True
+
+    return commands.check(predicate)
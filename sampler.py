@@ -0,0 +1,65 @@
+import random
+from collections import Counter
+from typing import Callable, List, Sequence
+
+
+class AliasSampler:
+    """Weighted sampling in constant time using Vose's alias method.
+
+    The tables are built once, a sampler is never mutated afterwards so a
+    replacement can simply be swapped in when the weights change."""
+
+    __slots__ = ("items", "weights", "_prob", "_alias", "_random")
+
+    def __init__(self, items: Sequence, weights: Sequence[float], rng: random.Random = None):
+        if len(items) != len(weights):
+            raise ValueError("items and weights must be the same length")
+        if not items:
+            raise ValueError("cannot sample from an empty population")
+        if any(weight < 0 for weight in weights):
+            raise ValueError("weights must not be negative")
+        total = sum(weights)
+        if total <= 0:
+            raise ValueError("total of weights must be greater than zero")
+
+        amount = len(items)
+        scaled = [weight * amount / total for weight in weights]
+        prob = [1.0] * amount
+        alias = list(range(amount))
+        small = [i for i, weight in enumerate(scaled) if weight < 1]
+        large = [i for i, weight in enumerate(scaled) if weight >= 1]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            prob[less] = scaled[less]
+            alias[less] = more
+            scaled[more] = scaled[more] + scaled[less] - 1
+            (small if scaled[more] < 1 else large).append(more)
+        # Whatever is left over is only off by float rounding and always keeps its own column.
+
+        self.items = tuple(items)
+        self.weights = tuple(weights)
+        self._prob = prob
+        self._alias = alias
+        self._random = (rng or random).random
+
+    def __len__(self):
+        return len(self.items)
+
+    def choice(self):
+        roll = self._random() * len(self._prob)
+        column = int(roll)
+        if roll - column < self._prob[column]:
+            return self.items[column]
+        return self.items[self._alias[column]]
+
+    def sample(self, k: int) -> List:
+        """Draw `k` items with replacement."""
+        return [self.choice() for _ in range(k)]
+
+    def count(self, k: int, key: Callable = None, chunk: int = 10000) -> Counter:
+        """Draw `k` items and count them, or their `key`, without holding every draw."""
+        counts = Counter()
+        for start in range(0, k, chunk):
+            drawn = self.sample(min(chunk, k - start))
+            counts.update(drawn if key is None else map(key, drawn))
+        return counts
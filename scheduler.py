@@ -0,0 +1,112 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Set, Tuple
+
+log = logging.getLogger("red.flare.fakemoncord.scheduler")
+
+
+class SpawnScheduler:
+    """Calls `callback(guild_id)` once per `interval` for every scheduled guild.
+
+    A guild's first run lands at a random point of the interval and every
+    following one is jittered, so runs trickle out instead of arriving in one
+    burst. Due guilds sit in a timer heap, at most `max_concurrency`
+    callbacks run at once and a slow guild only holds up its own slot.
+    Guilds can be added and removed while the scheduler runs."""
+
+    def __init__(
+        self,
+        callback: Callable[[int], Awaitable],
+        *,
+        interval: float = 2400,
+        jitter: float = 0.1,
+        max_concurrency: int = 5,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.callback = callback
+        self.interval = interval
+        self.jitter = jitter
+        self._clock = clock
+        self._heap: List[Tuple[float, int, int]] = []
+        self._scheduled: Dict[int, int] = {}
+        self._generation = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._running: Set[asyncio.Task] = set()
+
+    def __len__(self):
+        return len(self._scheduled)
+
+    def __contains__(self, guild_id: int):
+        return guild_id in self._scheduled
+
+    def _push(self, guild_id: int, due: float):
+        generation = self._scheduled[guild_id] = next(self._generation)
+        heapq.heappush(self._heap, (due, generation, guild_id))
+
+    def add(self, guild_id: int):
+        if guild_id in self._scheduled:
+            return
+        self._push(guild_id, self._clock() + random.uniform(0, self.interval))
+        self._wakeup.set()
+
+    def remove(self, guild_id: int):
+        # The heap entry is skipped once it comes due.
+        self._scheduled.pop(guild_id, None)
+
+    def sync(self, guild_ids: Iterable[int]):
+        """Schedule exactly `guild_ids`, keeping the timing of guilds already scheduled."""
+        wanted = set(guild_ids)
+        for guild_id in self._scheduled.keys() - wanted:
+            self.remove(guild_id)
+        for guild_id in wanted:
+            self.add(guild_id)
+
+    async def run(self):
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+            due, generation, guild_id = self._heap[0]
+            now = self._clock()
+            if due > now:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=due - now)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            heapq.heappop(self._heap)
+            if self._scheduled.get(guild_id) != generation:
+                continue  # Removed or rescheduled since
+            next_due = due + self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+            if next_due < now:  # Fell a whole interval behind, spread out again
+                next_due = now + random.uniform(0, self.interval)
+            self._push(guild_id, next_due)
+            await self._semaphore.acquire()
+            task = asyncio.ensure_future(self._run_one(guild_id))
+            self._running.add(task)
+            # Done callbacks also run for a task cancelled before it started, so the permit
+            # can't be lost the way a `finally` in the coroutine would lose it.
+            task.add_done_callback(self._finished)
+
+    async def _run_one(self, guild_id: int):
+        try:
+            await self.callback(guild_id)
+        except Exception as exc:
+            log.error("Exception in scheduled spawn for guild %s", guild_id, exc_info=exc)
+
+    def _finished(self, task: asyncio.Task):
+        self._running.discard(task)
+        self._semaphore.release()
+
+    def stop(self):
+        """Cancel running callbacks and forget every scheduled guild."""
+        for task in self._running:
+            task.cancel()
+        self._heap.clear()
+        self._scheduled.clear()
@@ -0,0 +1,97 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .catalog import Species, normalize_answer
+from .functions import GENDER_CODES
+from .statements import IV_TOTAL
+
+
+class PokemonSearch:
+    """Compiles the output of the `Args` converter into a parameterised query.
+
+    Every provided filter is ANDed together. Catalog based filters (name and
+    type) are resolved to species keys up front so SQLite only ever compares
+    indexed integer columns."""
+
+    def __init__(self, user_id: int, args: dict, pokemondata: Iterable[Species]):
+        self.clauses: List[str] = ["user_id = :user_id"]
+        self.values: Dict[str, object] = {"user_id": user_id}
+        pokemondata = list(pokemondata)
+
+        if args["names"]:
+            name = normalize_answer(args["names"])
+            self._add_species(pokemondata, lambda x: name in x.answers)
+        if args["type"]:
+            _type = args["type"].lower()
+            self._add_species(pokemondata, lambda x: _type in {t.lower() for t in x.types})
+        if args["variant"]:
+            if args["variant"].lower() == "none":
+                self.clauses.append("variant IS NULL")
+            else:
+                self._add("variant = {} COLLATE NOCASE", args["variant"])
+        if args["gender"]:
+            gender = args["gender"].lower()
+            codes = [i for i, x in enumerate(GENDER_CODES) if x.lower().split()[0] == gender]
+            self._add_in("gender", codes)
+        self._add_range("level", args["level"])
+        self._add_range("species_id", args["id"])
+        self._add_range(IV_TOTAL, args["iv"])
+
+    def _param(self, value) -> str:
+        key = f"p{len(self.values)}"
+        self.values[key] = value
+        return f":{key}"
+
+    def _add(self, clause: str, *values):
+        self.clauses.append(clause.format(*(self._param(value) for value in values)))
+
+    def _add_in(self, column: str, values: Iterable):
+        params = [self._param(value) for value in values]
+        if not params:
+            self.clauses.append("0")
+            return
+        self.clauses.append(f"{column} IN ({', '.join(params)})")
+
+    def _add_range(self, column: str, bounds: Optional[Tuple[Optional[int], Optional[int]]]):
+        if bounds is None:
+            return
+        low, high = bounds
+        if low is not None and low == high:
+            self._add(f"{column} = {{}}", low)
+            return
+        if low is not None:
+            self._add(f"{column} >= {{}}", low)
+        if high is not None:
+            self._add(f"{column} <= {{}}", high)
+
+    def _add_species(self, pokemondata: List[Species], predicate):
+        matched = [x for x in pokemondata if predicate(x)]
+        ids = {x.id for x in matched}
+        forms = {x.key for x in matched}
+        every_form = {x.key for x in pokemondata if x.id in ids}
+        if forms == every_form:
+            self._add_in("species_id", sorted(ids))
+            return
+        clauses = [
+            "(species_id = {} AND variant IS {} AND alias IS {})".format(
+                self._param(species_id), self._param(variant), self._param(alias)
+            )
+            for species_id, variant, alias in sorted(forms, key=lambda x: (x[0], str(x[1:])))
+        ]
+        self.clauses.append(f"({' OR '.join(clauses)})")
+
+    @property
+    def where(self) -> str:
+        return " AND ".join(self.clauses)
+
+    def count_query(self) -> str:
+        return f"SELECT COUNT(*) FROM pokemon WHERE {self.where}"
+
+    def page_query(self) -> str:
+        return (
+            "SELECT id, message_id, species_id, variant, alias, level, xp, gender, nickname, "
+            f"ivs, stats, position, version FROM pokemon WHERE {self.where} "
+            "ORDER BY position LIMIT :limit OFFSET :offset"
+        )
+
+    def page_values(self, limit: int, offset: int) -> dict:
+        return {**self.values, "limit": limit, "offset": offset}
@@ -33,11 +33,11 @@ class SettingsMixin(MixinMeta):
         if _type is None:
             _type = not await conf.silence()
         await conf.silence.set(_type)
+        self.usercache.update(ctx.author.id, silence=_type)
         if _type:
             await ctx.send(_("Your Fakemoncord levelling messages have been silenced."))
         else:
             await ctx.send(_("Your Fakemoncord levelling messages have been re-enabled!"))
-        await self.update_user_cache()
 
     @poke.command()
     @commands.guild_only()
@@ -52,8 +52,8 @@ class SettingsMixin(MixinMeta):
             return
         conf = await self.user_is_global(ctx.author)
         await conf.locale.set(LOCALES[locale.lower()])
+        self.usercache.update(ctx.author.id, locale=LOCALES[locale.lower()])
         await ctx.tick()
-        await self.update_user_cache()
 
     @poke.group(name="set")
     @commands.admin_or_permissions(manage_channels=True)
@@ -68,11 +68,11 @@ class SettingsMixin(MixinMeta):
         if _type is None:
             _type = not await self.config.guild(ctx.guild).toggle()
         await self.config.guild(ctx.guild).toggle.set(_type)
+        await self.update_guild_cache()
         if _type:
             await ctx.send(_("Fakemoncord has been toggled on!"))
             return
         await ctx.send(_("Fakemoncord has been toggled off!"))
-        await self.update_guild_cache()
 
     @fakemoncordset.command(usage="type")
     @commands.admin_or_permissions(manage_guild=True)
@@ -84,11 +84,11 @@ class SettingsMixin(MixinMeta):
         if _type is None:
             _type = not await self.config.guild(ctx.guild).levelup_messages()
         await self.config.guild(ctx.guild).levelup_messages.set(_type)
+        await self.update_guild_cache()
         if _type:
             await ctx.send(_("Pokémon levelup messages have been toggled on!"))
             return
         await ctx.send(_("Pokémon levelup messages have been toggled off!"))
-        await self.update_guild_cache()
 
     @fakemoncordset.command()
     @commands.admin_or_permissions(manage_channels=True)
@@ -170,17 +170,11 @@ class SettingsMixin(MixinMeta):
     @commands.is_owner()
     async def spawnloop(self, ctx, state: bool):
         """Turn the bot loop on or off."""
+        await self.config.spawnloop.set(state)
         if state:
-            await ctx.send(
-                _(
-                    "Random spawn loop has been enabled, please reload the cog for this change to take effect."
-                )
-            )
+            self.start_spawn_loop()
+            await ctx.send(_("Random spawn loop has been enabled."))
         else:
-            await ctx.send(
-                _(
-                    "Random spawn loop has been disabled, please reload the cog for this change to take effect."
-                )
-            )
-        await self.config.spawnloop.set(state)
+            self.stop_spawn_loop()
+            await ctx.send(_("Random spawn loop has been disabled."))
         await ctx.tick()
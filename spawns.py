@@ -0,0 +1,185 @@
+import heapq
+import itertools
+import random
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence, Set, Tuple
+
+from .catalog import Species
+
+
+class ActiveSpawn:
+    __slots__ = ("species", "expires")
+
+    def __init__(self, species: Species, expires: float):
+        self.species = species
+        self.expires = expires
+
+
+class SpawnTable:
+    """The Pokémon waiting to be caught, keyed by channel id.
+
+    This is the authoritative copy, Config only receives the changes
+    write-behind through `pending_writes` so spawns survive a restart.
+    Operations never await, so a claim can't interleave with another one.
+    Expiry times are wall clock timestamps as they are persisted."""
+
+    def __init__(self, ttl: int = 3600):
+        self.ttl = ttl
+        self._active: Dict[int, ActiveSpawn] = {}
+        self._heap: List[Tuple[float, int, int, ActiveSpawn]] = []
+        self._counter = itertools.count()
+        self._dirty: Set[int] = set()
+
+    def __len__(self):
+        return len(self._active)
+
+    def __contains__(self, channel_id: int):
+        return self.get(channel_id) is not None
+
+    def get(self, channel_id: int) -> Optional[Species]:
+        spawn = self._active.get(channel_id)
+        if spawn is None or spawn.expires <= time.time():
+            return None
+        return spawn.species
+
+    def put(
+        self, channel_id: int, species: Species, expires: float = None, *, persist: bool = True
+    ):
+        """Make a species catchable in a channel, replacing whatever was there."""
+        if expires is None:
+            expires = time.time() + self.ttl
+        spawn = self._active[channel_id] = ActiveSpawn(species, expires)
+        heapq.heappush(self._heap, (expires, next(self._counter), channel_id, spawn))
+        if persist:
+            self._dirty.add(channel_id)
+
+    def claim(self, channel_id: int, species: Species) -> bool:
+        """Remove the spawn if it is still `species`, only the first claim succeeds."""
+        spawn = self._active.get(channel_id)
+        if spawn is None or spawn.species is not species or spawn.expires <= time.time():
+            return False
+        del self._active[channel_id]
+        self._dirty.add(channel_id)
+        return True
+
+    def expire(self, now: float = None) -> int:
+        """Despawn everything past its expiry, returns how many were removed."""
+        now = time.time() if now is None else now
+        expired = 0
+        while self._heap and self._heap[0][0] <= now:
+            _, _, channel_id, spawn = heapq.heappop(self._heap)
+            if self._active.get(channel_id) is spawn:  # Not replaced or claimed since
+                del self._active[channel_id]
+                self._dirty.add(channel_id)
+                expired += 1
+        return expired
+
+    def pending_writes(self) -> Dict[int, Optional[ActiveSpawn]]:
+        """Channels changed since the last call, None where the spawn is gone."""
+        dirty, self._dirty = self._dirty, set()
+        return {channel_id: self._active.get(channel_id) for channel_id in dirty}
+
+
+class _GuildProgress:
+    __slots__ = ("messages", "threshold", "seen")
+
+    def __init__(self, threshold: int, now: float):
+        self.messages = 0
+        self.threshold = threshold
+        self.seen = now
+
+
+class _TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.updated = now
+
+
+class SpawnAccumulator:
+    """Counts the messages towards each guild's next spawn.
+
+    A message only counts if its author has a token left in that guild, each
+    trainer has a bucket per guild that refills at `rate` tokens a second up
+    to `burst`. Guilds idle for `idle_timeout` seconds and buckets that have
+    refilled are evicted, so memory follows active guilds and trainers only."""
+
+    def __init__(
+        self,
+        spawnchance: Sequence[int] = (20, 120),
+        *,
+        rate: float = 0.2,
+        burst: float = 1,
+        idle_timeout: int = 3600,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.spawnchance = spawnchance
+        self.rate = rate
+        self.burst = burst
+        self.idle_timeout = idle_timeout
+        self._clock = clock
+        self._guilds: "OrderedDict[int, _GuildProgress]" = OrderedDict()
+        self._buckets: "OrderedDict[Tuple[int, int], _TokenBucket]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._guilds) + len(self._buckets)
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """The number of tracked guilds and trainer buckets."""
+        return len(self._guilds), len(self._buckets)
+
+    def _take_token(self, key: Tuple[int, int], now: float) -> bool:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = _TokenBucket(self.burst, now)
+        else:
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+            self._buckets.move_to_end(key)
+        if bucket.tokens < 1:
+            return False
+        bucket.tokens -= 1
+        return True
+
+    def add(self, guild_id: int, user_id: int) -> bool:
+        """Count a message, returns True when the guild is due a spawn."""
+        now = self._clock()
+        if not self._take_token((guild_id, user_id), now):
+            return False
+        progress = self._guilds.get(guild_id)
+        if progress is None:
+            progress = self._guilds[guild_id] = _GuildProgress(
+                random.randint(*self.spawnchance), now
+            )
+        else:
+            progress.seen = now
+            self._guilds.move_to_end(guild_id)
+        progress.messages += 1
+        if progress.messages <= progress.threshold:
+            return False
+        del self._guilds[guild_id]
+        return True
+
+    def evict_idle(self) -> int:
+        """Drop idle guilds and refilled buckets, returns how many entries were removed."""
+        now = self._clock()
+        removed = 0
+        cutoff = now - self.idle_timeout
+        while self._guilds:
+            guild_id, progress = next(iter(self._guilds.items()))
+            if progress.seen > cutoff:
+                break
+            del self._guilds[guild_id]
+            removed += 1
+        # A bucket that would be full again is no different from a missing one.
+        cutoff = now - self.burst / self.rate
+        while self._buckets:
+            key, bucket = next(iter(self._buckets.items()))
+            if bucket.updated > cutoff:
+                break
+            del self._buckets[key]
+            removed += 1
+        return removed
@@ -6,27 +6,502 @@ CREATE TABLE IF NOT EXISTS users (
     PRIMARY KEY (user_id, message_id)
     );
 """
+POKECORD_CREATE_POKEMON_TABLE = """
+CREATE TABLE IF NOT EXISTS pokemon (
+    id INTEGER PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL UNIQUE,
+    species_id INTEGER NOT NULL,
+    variant TEXT,
+    alias TEXT,
+    level INTEGER NOT NULL DEFAULT 1,
+    xp INTEGER NOT NULL DEFAULT 0,
+    gender INTEGER NOT NULL DEFAULT 0,
+    nickname TEXT,
+    ivs INTEGER NOT NULL DEFAULT 0,
+    stats INTEGER NOT NULL DEFAULT 0
+    );
+"""
+POKECORD_CREATE_POKEMON_USER_INDEX = """
+CREATE INDEX IF NOT EXISTS pokemon_user_id ON pokemon (user_id, id);
+"""
+POKECORD_CREATE_POKEMON_SLOT_INDEX = """
+CREATE INDEX IF NOT EXISTS pokemon_slot ON pokemon (user_id, position);
+"""
+
+
+def _iv_total(column: str = "ivs") -> str:
+    """Sum of the six packed 5 bit IVs, shared by the index, search and leaderboard queries."""
+    return (
+        f"(({column} & 31) + (({column} >> 5) & 31) + (({column} >> 10) & 31)"
+        f" + (({column} >> 15) & 31) + (({column} >> 20) & 31) + (({column} >> 25) & 31))"
+    )
+
+
+IV_TOTAL = _iv_total()
+POKECORD_CREATE_POKEMON_LEVEL_INDEX = """
+CREATE INDEX IF NOT EXISTS pokemon_level ON pokemon (user_id, level);
+"""
+POKECORD_CREATE_POKEMON_SPECIES_INDEX = """
+CREATE INDEX IF NOT EXISTS pokemon_species ON pokemon (user_id, species_id);
+"""
+POKECORD_CREATE_POKEMON_IV_INDEX = f"""
+CREATE INDEX IF NOT EXISTS pokemon_iv_total ON pokemon (user_id, {IV_TOTAL});
+"""
+ALTER_POKEMON_ADD_POSITION = """
+ALTER TABLE pokemon ADD COLUMN position INTEGER NOT NULL DEFAULT 0;
+"""
+# Bumped by every update of a row, caches of anything rendered from a row key on it.
+ALTER_POKEMON_ADD_VERSION = """
+ALTER TABLE pokemon ADD COLUMN version INTEGER NOT NULL DEFAULT 0;
+"""
 PRAGMA_journal_mode = """
 PRAGMA journal_mode = wal;
 """
 PRAGMA_wal_autocheckpoint = """
 PRAGMA wal_autocheckpoint;
 """
-PRAGMA_read_uncommitted = """
-PRAGMA read_uncommitted = 1;
+PRAGMA_pokemon_table_info = """
+PRAGMA table_info(pokemon);
 """
 
 INSERT_POKEMON = """
-INSERT INTO users (user_id, message_id, pokemon)
-VALUES (:user_id, :message_id, :pokemon);
+INSERT INTO pokemon (
+    user_id, message_id, species_id, variant, alias, level, xp, gender, nickname, ivs, stats,
+    position
+)
+VALUES (
+    :user_id, :message_id, :species_id, :variant, :alias, :level, :xp, :gender, :nickname, :ivs,
+    :stats, (SELECT COALESCE(MAX(position), 0) + 1 FROM pokemon WHERE user_id = :user_id)
+);
 """
 
 SELECT_POKEMON = """
-SELECT pokemon, message_id from users where user_id = :user_id
+SELECT id, message_id, species_id, variant, alias, level, xp, gender, nickname, ivs, stats,
+    position, version
+FROM pokemon where user_id = :user_id
+ORDER BY position
+"""
+
+SELECT_POKEMON_SLOT = """
+SELECT id, message_id, species_id, variant, alias, level, xp, gender, nickname, ivs, stats,
+    position, version
+FROM pokemon where user_id = :user_id and position = :position
+"""
+
+SELECT_POKEMON_MESSAGE = """
+SELECT id, message_id, species_id, variant, alias, level, xp, gender, nickname, ivs, stats,
+    position, version
+FROM pokemon where user_id = :user_id and message_id = :message_id
+"""
+
+SELECT_POKEMON_PAGE = """
+SELECT id, message_id, species_id, variant, alias, level, xp, gender, nickname, ivs, stats,
+    position, version
+FROM pokemon where user_id = :user_id and position >= :position
+ORDER BY position
+LIMIT :limit
+"""
+
+SELECT_LEVELABLE_POKEMON = """
+SELECT id, message_id, species_id, variant, alias, level, xp, gender, nickname, ivs, stats,
+    position, version
+FROM pokemon where user_id = :user_id and level < 100
+ORDER BY position
+LIMIT 1
+"""
+
+# Slots are dense, so the highest slot is also the amount of Pokémon a trainer has.
+SELECT_POKEMON_COUNT = """
+SELECT COALESCE(MAX(position), 0) FROM pokemon where user_id = :user_id
 """
 
 UPDATE_POKEMON = """
-UPDATE users
-SET pokemon = :pokemon
+UPDATE pokemon
+SET species_id = :species_id,
+    variant = :variant,
+    alias = :alias,
+    level = :level,
+    xp = :xp,
+    gender = :gender,
+    nickname = :nickname,
+    ivs = :ivs,
+    stats = :stats,
+    version = version + 1
 where message_id = :message_id and user_id = :user_id;
 """
+
+DELETE_POKEMON = """
+DELETE FROM pokemon where message_id = :message_id
+"""
+
+SELECT_POKEMON_POSITION = """
+SELECT position FROM pokemon where user_id = :user_id and message_id = :message_id
+"""
+
+# Hands a Pokémon over in place, it keeps its row and key and joins the end of the buyer's slots.
+TRANSFER_POKEMON = """
+UPDATE pokemon
+SET user_id = :buyer_id,
+    position = (SELECT COALESCE(MAX(position), 0) + 1 FROM pokemon WHERE user_id = :buyer_id)
+where user_id = :seller_id and message_id = :message_id;
+"""
+
+SHIFT_POKEMON_SLOTS = """
+UPDATE pokemon
+SET position = position - 1
+where user_id = :user_id and position > :position;
+"""
+
+SELECT_POKEMON_OWNERS = """
+SELECT DISTINCT user_id FROM pokemon
+where user_id > :after
+ORDER BY user_id
+LIMIT :limit
+"""
+
+COUNT_POKEMON_OWNERS = """
+SELECT COUNT(DISTINCT user_id) FROM pokemon
+"""
+
+SELECT_POKEMON_IDS = """
+SELECT id, user_id FROM pokemon
+where user_id BETWEEN :first and :last
+ORDER BY user_id, id
+"""
+
+SET_POKEMON_POSITION = """
+UPDATE pokemon SET position = :position where id = :id;
+"""
+
+CREATE_DEX_COUNTS_TABLE = """
+CREATE TABLE IF NOT EXISTS dex_counts (
+    user_id INTEGER NOT NULL,
+    species_id INTEGER NOT NULL,
+    amount INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, species_id)
+) WITHOUT ROWID;
+"""
+
+INCREMENT_DEX_COUNT = """
+INSERT INTO dex_counts (user_id, species_id, amount)
+VALUES (:user_id, :species_id, :amount)
+ON CONFLICT (user_id, species_id) DO UPDATE
+SET amount = amount + excluded.amount;
+"""
+
+SELECT_DEX_COUNT = """
+SELECT amount FROM dex_counts where user_id = :user_id and species_id = :species_id
+"""
+
+SELECT_DEX_COUNTS = """
+SELECT species_id, amount FROM dex_counts
+where user_id = :user_id and species_id BETWEEN :first and :last
+"""
+
+SELECT_DEX_TOTAL = """
+SELECT COUNT(*) FROM dex_counts where user_id = :user_id and amount > 0
+"""
+
+SELECT_DEX_OWNERS = """
+SELECT user_id FROM pokemon where user_id > :after
+UNION
+SELECT user_id FROM dex_counts where user_id > :after
+ORDER BY user_id
+LIMIT :limit
+"""
+
+DELETE_DEX_COUNTS = """
+DELETE FROM dex_counts where user_id BETWEEN :first and :last
+"""
+
+REBUILD_DEX_COUNTS = """
+INSERT INTO dex_counts (user_id, species_id, amount)
+SELECT user_id, species_id, COUNT(*) FROM pokemon
+where user_id BETWEEN :first and :last
+GROUP BY user_id, species_id
+"""
+
+CREATE_TRAINER_STATS_TABLE = """
+CREATE TABLE IF NOT EXISTS trainer_stats (
+    user_id INTEGER PRIMARY KEY,
+    caught INTEGER NOT NULL DEFAULT 0,
+    species INTEGER NOT NULL DEFAULT 0,
+    best_iv INTEGER NOT NULL DEFAULT 0,
+    best_level INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+# A copy of trainer_stats per server a trainer played in, so server boards have their own index.
+CREATE_GUILD_STATS_TABLE = """
+CREATE TABLE IF NOT EXISTS guild_stats (
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    caught INTEGER NOT NULL DEFAULT 0,
+    species INTEGER NOT NULL DEFAULT 0,
+    best_iv INTEGER NOT NULL DEFAULT 0,
+    best_level INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (guild_id, user_id)
+) WITHOUT ROWID;
+"""
+
+# One top-N index per leaderboard, keyed by the column the board sorts on.
+LEADERBOARD_COLUMNS = ("caught", "species", "best_iv", "best_level")
+CREATE_LEADERBOARD_INDEXES = [
+    f"CREATE INDEX IF NOT EXISTS {table}_{column} ON {table} ({key}{column} DESC, user_id);"
+    for table, key in (("trainer_stats", ""), ("guild_stats", "guild_id, "))
+    for column in LEADERBOARD_COLUMNS
+] + ["CREATE INDEX IF NOT EXISTS guild_stats_user ON guild_stats (user_id);"]
+
+# The triggers keep trainer_stats up to date in the transaction of every write to
+# pokemon and dex_counts, so catches, releases, trades, level ups and evolutions
+# all count without the commands having to know about it.
+CREATE_TRAINER_STATS_TRIGGERS = [
+    f"""
+CREATE TRIGGER IF NOT EXISTS trainer_stats_insert AFTER INSERT ON pokemon
+BEGIN
+    INSERT INTO trainer_stats (user_id, caught, best_iv, best_level)
+    VALUES (new.user_id, 1, {_iv_total("new.ivs")}, new.level)
+    ON CONFLICT (user_id) DO UPDATE
+    SET caught = caught + 1,
+        best_iv = MAX(best_iv, excluded.best_iv),
+        best_level = MAX(best_level, excluded.best_level);
+END;
+""",
+    f"""
+CREATE TRIGGER IF NOT EXISTS trainer_stats_delete AFTER DELETE ON pokemon
+BEGIN
+    UPDATE trainer_stats
+    SET caught = caught - 1,
+        best_iv = CASE WHEN {_iv_total("old.ivs")} < best_iv THEN best_iv ELSE (
+            SELECT COALESCE(MAX({IV_TOTAL}), 0) FROM pokemon where user_id = old.user_id
+        ) END,
+        best_level = CASE WHEN old.level < best_level THEN best_level ELSE (
+            SELECT COALESCE(MAX(level), 0) FROM pokemon where user_id = old.user_id
+        ) END
+    where user_id = old.user_id;
+END;
+""",
+    f"""
+CREATE TRIGGER IF NOT EXISTS trainer_stats_update AFTER UPDATE OF level, ivs ON pokemon
+BEGIN
+    UPDATE trainer_stats
+    SET best_iv = CASE
+            WHEN {_iv_total("new.ivs")} >= best_iv THEN {_iv_total("new.ivs")}
+            WHEN {_iv_total("old.ivs")} < best_iv THEN best_iv
+            ELSE (SELECT COALESCE(MAX({IV_TOTAL}), 0) FROM pokemon where user_id = new.user_id)
+        END,
+        best_level = CASE
+            WHEN new.level >= best_level THEN new.level
+            WHEN old.level < best_level THEN best_level
+            ELSE (SELECT COALESCE(MAX(level), 0) FROM pokemon where user_id = new.user_id)
+        END
+    where user_id = new.user_id;
+END;
+""",
+    f"""
+CREATE TRIGGER IF NOT EXISTS trainer_stats_transfer AFTER UPDATE OF user_id ON pokemon
+WHEN old.user_id != new.user_id
+BEGIN
+    INSERT INTO trainer_stats (user_id, caught, best_iv, best_level)
+    VALUES (new.user_id, 1, {_iv_total("new.ivs")}, new.level)
+    ON CONFLICT (user_id) DO UPDATE
+    SET caught = caught + 1,
+        best_iv = MAX(best_iv, excluded.best_iv),
+        best_level = MAX(best_level, excluded.best_level);
+    UPDATE trainer_stats
+    SET caught = caught - 1,
+        best_iv = CASE WHEN {_iv_total("old.ivs")} < best_iv THEN best_iv ELSE (
+            SELECT COALESCE(MAX({IV_TOTAL}), 0) FROM pokemon where user_id = old.user_id
+        ) END,
+        best_level = CASE WHEN old.level < best_level THEN best_level ELSE (
+            SELECT COALESCE(MAX(level), 0) FROM pokemon where user_id = old.user_id
+        ) END
+    where user_id = old.user_id;
+END;
+""",
+    """
+CREATE TRIGGER IF NOT EXISTS trainer_stats_dex_insert AFTER INSERT ON dex_counts
+BEGIN
+    INSERT INTO trainer_stats (user_id, species) VALUES (new.user_id, 1)
+    ON CONFLICT (user_id) DO UPDATE SET species = species + 1;
+END;
+""",
+    """
+CREATE TRIGGER IF NOT EXISTS trainer_stats_dex_delete AFTER DELETE ON dex_counts
+BEGIN
+    UPDATE trainer_stats SET species = species - 1 where user_id = old.user_id;
+END;
+""",
+]
+
+_GUILD_STATS_COPY = """
+    SET caught = {row}.caught,
+        species = {row}.species,
+        best_iv = {row}.best_iv,
+        best_level = {row}.best_level
+    where user_id = {row}.user_id;
+"""
+# Every change of a trainer's stats is copied to their rows of the servers they play in.
+CREATE_GUILD_STATS_TRIGGERS = [
+    f"""
+CREATE TRIGGER IF NOT EXISTS guild_stats_insert AFTER INSERT ON trainer_stats
+BEGIN
+    UPDATE guild_stats{_GUILD_STATS_COPY.format(row="new")}END;
+""",
+    f"""
+CREATE TRIGGER IF NOT EXISTS guild_stats_update AFTER UPDATE ON trainer_stats
+BEGIN
+    UPDATE guild_stats{_GUILD_STATS_COPY.format(row="new")}END;
+""",
+    """
+CREATE TRIGGER IF NOT EXISTS guild_stats_delete AFTER DELETE ON trainer_stats
+BEGIN
+    UPDATE guild_stats SET caught = 0, species = 0, best_iv = 0, best_level = 0
+    where user_id = old.user_id;
+END;
+""",
+]
+
+ADD_GUILD_TRAINER = """
+INSERT OR IGNORE INTO guild_stats (guild_id, user_id, caught, species, best_iv, best_level)
+SELECT :guild_id, user_id, caught, species, best_iv, best_level FROM trainer_stats
+where user_id = :user_id
+"""
+
+DELETE_GUILD_TRAINER = """
+DELETE FROM guild_stats where guild_id = :guild_id and user_id = :user_id
+"""
+
+DELETE_GUILD_STATS = """
+DELETE FROM guild_stats where guild_id = :guild_id
+"""
+
+# Keyset paged, each page continues after the (value, user_id) the previous one ended on.
+SELECT_LEADERBOARD = """
+SELECT user_id, {column} FROM trainer_stats
+where {column} > 0 and ({column} < :value or ({column} = :value and user_id > :user_id))
+ORDER BY {column} DESC, user_id
+LIMIT :limit
+"""
+
+SELECT_GUILD_LEADERBOARD = """
+SELECT user_id, {column} FROM guild_stats
+where guild_id = :guild_id and {column} > 0
+    and ({column} < :value or ({column} = :value and user_id > :user_id))
+ORDER BY {column} DESC, user_id
+LIMIT :limit
+"""
+
+SELECT_TRAINER_STAT = """
+SELECT {column} FROM trainer_stats where user_id = :user_id
+"""
+
+# Ranks are counted on the board's index and capped, a rank past :limit isn't shown.
+SELECT_LEADERBOARD_RANK = """
+SELECT COUNT(*) FROM (SELECT 1 FROM trainer_stats where {column} > :value LIMIT :limit)
+"""
+
+SELECT_GUILD_LEADERBOARD_RANK = """
+SELECT COUNT(*) FROM (
+    SELECT 1 FROM guild_stats where guild_id = :guild_id and {column} > :value LIMIT :limit
+)
+"""
+
+DELETE_TRAINER_STATS = """
+DELETE FROM trainer_stats where user_id BETWEEN :first and :last
+"""
+
+REBUILD_TRAINER_STATS = f"""
+INSERT INTO trainer_stats (user_id, caught, species, best_iv, best_level)
+SELECT owners.user_id,
+    COUNT(pokemon.id),
+    (SELECT COUNT(*) FROM dex_counts where dex_counts.user_id = owners.user_id),
+    COALESCE(MAX({_iv_total("pokemon.ivs")}), 0),
+    COALESCE(MAX(pokemon.level), 0)
+FROM (
+    SELECT user_id FROM pokemon where user_id BETWEEN :first and :last
+    UNION
+    SELECT user_id FROM dex_counts where user_id BETWEEN :first and :last
+) AS owners
+LEFT JOIN pokemon ON pokemon.user_id = owners.user_id
+GROUP BY owners.user_id
+"""
+
+SELECT_LEGACY_TABLE = """
+SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'users'
+"""
+
+SELECT_LEGACY_POKEMON = """
+SELECT rowid, user_id, message_id, pokemon FROM users
+WHERE rowid > :last
+ORDER BY rowid
+LIMIT :limit
+"""
+
+MIGRATE_LEGACY_POKEMON = """
+INSERT OR IGNORE INTO pokemon (
+    id, user_id, message_id, species_id, variant, alias, level, xp, gender, nickname, ivs, stats
+)
+VALUES (
+    :id, :user_id, :message_id, :species_id, :variant, :alias, :level, :xp, :gender, :nickname,
+    :ivs, :stats
+);
+"""
+
+SELECT_LEGACY_COUNT = """
+SELECT COUNT(*) FROM users
+"""
+
+CREATE_MIGRATIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS migrations (
+    version INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    checkpoint INTEGER NOT NULL DEFAULT 0,
+    processed INTEGER NOT NULL DEFAULT 0,
+    done INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+SELECT_MIGRATIONS = """
+SELECT version, checkpoint, processed, done FROM migrations
+"""
+
+SAVE_MIGRATION = """
+INSERT INTO migrations (version, name, checkpoint, processed, done)
+VALUES (:version, :name, :checkpoint, :processed, :done)
+ON CONFLICT (version) DO UPDATE
+SET checkpoint = excluded.checkpoint,
+    processed = excluded.processed,
+    done = excluded.done;
+"""
+
+CREATE_TRADE_OFFERS_TABLE = """
+CREATE TABLE IF NOT EXISTS trade_offers (
+    id INTEGER PRIMARY KEY,
+    channel_id INTEGER NOT NULL,
+    seller_id INTEGER NOT NULL,
+    buyer_id INTEGER NOT NULL,
+    message_id INTEGER NOT NULL,
+    price INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+"""
+
+SAVE_TRADE_OFFER = """
+INSERT INTO trade_offers (id, channel_id, seller_id, buyer_id, message_id, price, state, expires)
+VALUES (:id, :channel_id, :seller_id, :buyer_id, :message_id, :price, :state, :expires)
+ON CONFLICT (id) DO UPDATE
+SET price = excluded.price,
+    state = excluded.state,
+    expires = excluded.expires;
+"""
+
+SELECT_TRADE_OFFERS = """
+SELECT id, channel_id, seller_id, buyer_id, message_id, price, state, expires FROM trade_offers
+"""
+
+DELETE_TRADE_OFFER = """
+DELETE FROM trade_offers where id = :id
+"""
@@ -0,0 +1,402 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import logging
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import apsw
+
+from .statements import PRAGMA_journal_mode, PRAGMA_wal_autocheckpoint
+
+log = logging.getLogger("red.flare.fakemoncord.storage")
+
+# How long a transaction may keep the writer waiting for its next statement.
+TRANSACTION_TIMEOUT = 30
+
+
+class Row(tuple):
+    """A result row, indexable by position and by column name."""
+
+    __slots__ = ()
+    _index: Dict[str, int] = {}
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return tuple.__getitem__(self, self._index[key])
+        return tuple.__getitem__(self, key)
+
+    def keys(self):
+        return self._index.keys()
+
+
+_row_classes: Dict[Tuple[str, ...], type] = {}
+
+
+def _row_class(columns: Tuple[str, ...]) -> type:
+    cls = _row_classes.get(columns)
+    if cls is None:
+        index = {name: i for i, name in enumerate(columns)}
+        cls = _row_classes[columns] = type("Row", (Row,), {"__slots__": (), "_index": index})
+    return cls
+
+
+def _fetch(connection: apsw.Connection, query: str, values: Optional[dict]) -> List[Row]:
+    cursor = connection.execute(query, values or {})
+    try:
+        description = cursor.getdescription()
+    except apsw.ExecutionCompleteError:
+        return []
+    cls = _row_class(tuple(column[0] for column in description))
+    return [cls(row) for row in cursor]
+
+
+def _execute(connection: apsw.Connection, query: str, values: Optional[dict]) -> int:
+    connection.execute(query, values or {})
+    return connection.last_insert_rowid()
+
+
+def _execute_many(connection: apsw.Connection, query: str, values: List[dict]):
+    if values:
+        connection.executemany(query, values)
+
+
+def _resolve(future: asyncio.Future, result=None, exc: BaseException = None):
+    if future.done():
+        return
+    if exc is not None:
+        future.set_exception(exc)
+    else:
+        future.set_result(result)
+
+
+class _Job:
+    __slots__ = ("func", "future")
+
+    def __init__(self, func: Callable[[apsw.Connection], Any], future: asyncio.Future):
+        self.func = func
+        self.future = future
+
+
+class _Rollback(Exception):
+    pass
+
+
+class _TransactionJob(_Job):
+    """Keeps the writer inside a transaction, running statements as they are sent.
+
+    Once it stops taking statements, because it finished, rolled back or
+    timed out, `send` refuses new ones and anything still queued fails."""
+
+    __slots__ = ("statements", "loop", "lock", "closed")
+
+    def __init__(self, future: asyncio.Future, loop: asyncio.AbstractEventLoop):
+        super().__init__(self._run, future)
+        self.statements: "queue.Queue[Optional[Tuple[Callable, Optional[asyncio.Future]]]]" = (
+            queue.Queue()
+        )
+        self.loop = loop
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def send(self, item: Optional[Tuple[Callable, Optional[asyncio.Future]]]) -> bool:
+        with self.lock:
+            if self.closed:
+                return False
+            self.statements.put(item)
+            return True
+
+    def _run(self, connection: apsw.Connection):
+        try:
+            return self._serve(connection)
+        finally:
+            self._close()
+
+    def _serve(self, connection: apsw.Connection):
+        while True:
+            try:
+                item = self.statements.get(timeout=TRANSACTION_TIMEOUT)
+            except queue.Empty:
+                raise TimeoutError("Transaction was left open, rolling it back")
+            if item is None:
+                raise _Rollback
+            func, future = item
+            if func is None:
+                return None
+            try:
+                result = func(connection)
+            except Exception as exc:
+                self.loop.call_soon_threadsafe(_resolve, future, None, exc)
+            else:
+                self.loop.call_soon_threadsafe(_resolve, future, result)
+
+    def _close(self):
+        with self.lock:
+            self.closed = True
+        while True:
+            try:
+                item = self.statements.get_nowait()
+            except queue.Empty:
+                return
+            if item is not None and item[1] is not None:
+                exc = RuntimeError("Transaction is no longer open")
+                self.loop.call_soon_threadsafe(_resolve, item[1], None, exc)
+
+
+class Transaction:
+    """Async context manager returned by `Storage.transaction`.
+
+    Statements issued inside it run on the writer connection in order and
+    see its uncommitted changes. Nested transactions become savepoints."""
+
+    def __init__(self, storage: "Storage"):
+        self.storage = storage
+        self._job: Optional[_TransactionJob] = None
+        self._token = None
+        self._savepoint: Optional[str] = None
+        self.closed = False
+
+    async def __aenter__(self):
+        parent = self.storage._transaction()
+        if parent is not None:
+            self._job = parent._job
+            self._savepoint = f"nested{id(self)}"
+            await self.storage._send(
+                self._job, lambda c: c.execute(f"SAVEPOINT {self._savepoint}")
+            )
+        else:
+            loop = asyncio.get_event_loop()
+            self._job = _TransactionJob(loop.create_future(), loop)
+            self.storage._submit(self._job)
+        self._token = self.storage._current.set(self)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.storage._current.reset(self._token)
+        self.closed = True
+        if self._savepoint is not None:
+            if exc_type is None:
+                statement = f"RELEASE {self._savepoint}"
+            else:
+                statement = f"ROLLBACK TO {self._savepoint}; RELEASE {self._savepoint}"
+            await self.storage._send(self._job, lambda c: c.execute(statement))
+            return False
+        if exc_type is None:
+            self._job.send((None, None))
+            await self._job.future
+        else:
+            self._job.send(None)
+            try:
+                await self._job.future
+            except _Rollback:
+                pass
+        return False
+
+
+class Storage:
+    """SQLite storage on apsw with a reader/writer split.
+
+    Writes are queued for a single writer connection on `executor`. Whatever
+    is queued when the writer gets to it is applied in one transaction, each
+    write in its own savepoint so a failing statement only fails its caller.
+    Callers are resolved once that transaction commits. Reads run on a small
+    pool of read-only WAL connections and never wait for the writer.
+
+    The methods mirror the `databases` API the cog was written against."""
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        executor: concurrent.futures.ThreadPoolExecutor,
+        readers: int = 3,
+        max_batch: int = 500,
+        statement_cache: int = 256,
+    ):
+        self.path = path
+        self.max_batch = max_batch
+        self.statement_cache = statement_cache
+        self._executor = executor
+        self._readers = readers
+        self._reader_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._local = threading.local()
+        self._reader_connections: List[apsw.Connection] = []
+        self._writer: Optional[apsw.Connection] = None
+        self._pending: List[_Job] = []
+        self._pending_lock = threading.Lock()
+        self._draining = False
+        self._current: contextvars.ContextVar[Optional[Transaction]] = contextvars.ContextVar(
+            f"fakemoncord_transaction_{id(self)}", default=None
+        )
+
+    async def connect(self):
+        loop = asyncio.get_event_loop()
+        self._writer = await loop.run_in_executor(self._executor, self._open_writer)
+        self._reader_executor = concurrent.futures.ThreadPoolExecutor(
+            self._readers, thread_name_prefix="fakemoncord-reader"
+        )
+
+    def _open_writer(self) -> apsw.Connection:
+        connection = apsw.Connection(self.path, statementcachesize=self.statement_cache)
+        connection.setbusytimeout(5000)
+        connection.execute(PRAGMA_journal_mode)
+        connection.execute(PRAGMA_wal_autocheckpoint)
+        return connection
+
+    def _reader(self) -> apsw.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = apsw.Connection(
+                self.path,
+                flags=apsw.SQLITE_OPEN_READONLY,
+                statementcachesize=self.statement_cache,
+            )
+            connection.setbusytimeout(5000)
+            self._reader_connections.append(connection)
+        return connection
+
+    async def disconnect(self):
+        await self._run_write(lambda c: None)
+        if self._reader_executor is not None:
+            self._reader_executor.shutdown(wait=False)
+            self._reader_executor = None
+        for connection in self._reader_connections:
+            connection.close()
+        self._reader_connections.clear()
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def transaction(self) -> Transaction:
+        return Transaction(self)
+
+    def _transaction(self) -> Optional[Transaction]:
+        # Tasks started inside a transaction inherit it, ignore it once it is over.
+        transaction = self._current.get()
+        if transaction is None or transaction.closed:
+            return None
+        return transaction
+
+    # Writer
+
+    def _submit(self, job: _Job):
+        with self._pending_lock:
+            self._pending.append(job)
+            if self._draining:
+                return
+            self._draining = True
+        asyncio.get_event_loop().run_in_executor(
+            self._executor, self._drain, job.future.get_loop()
+        )
+
+    def _drain(self, loop: asyncio.AbstractEventLoop):
+        try:
+            while True:
+                with self._pending_lock:
+                    batch = self._pending[: self.max_batch]
+                    del self._pending[: self.max_batch]
+                    if not batch:
+                        self._draining = False
+                        return
+                try:
+                    self._commit(batch, loop)
+                except Exception as exc:
+                    log.error("Write batch of %s jobs failed", len(batch), exc_info=exc)
+                    self._abort(batch, loop, exc)
+        finally:
+            with self._pending_lock:
+                self._draining = False
+
+    def _abort(self, batch: List[_Job], loop: asyncio.AbstractEventLoop, exc: BaseException):
+        """Roll back what is left of a failed batch and fail every caller still waiting."""
+        connection = self._writer
+        try:
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+        except apsw.Error:
+            log.exception("Rolling back a failed write batch failed")
+        self._fail(batch, loop, exc)
+
+    def _fail(self, batch: List[_Job], loop: asyncio.AbstractEventLoop, exc: BaseException):
+        for job in batch:
+            if isinstance(job, _TransactionJob):
+                # A transaction that never ran has statements waiting on it.
+                job._close()
+            loop.call_soon_threadsafe(_resolve, job.future, None, exc)
+
+    def _commit(self, batch: List[_Job], loop: asyncio.AbstractEventLoop):
+        connection = self._writer
+        results = []
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+        except apsw.Error as exc:
+            self._fail(batch, loop, exc)
+            return
+        for job in batch:
+            connection.execute("SAVEPOINT job")
+            try:
+                result = job.func(connection)
+            except BaseException as exc:
+                if not connection.in_transaction:
+                    # SQLite rolled the whole transaction back itself (FULL, IOERR, NOMEM),
+                    # the writes before this one went with it.
+                    raise
+                connection.execute("ROLLBACK TO job; RELEASE job")
+                results.append((job, None, exc))
+            else:
+                connection.execute("RELEASE job")
+                results.append((job, result, None))
+        try:
+            connection.execute("COMMIT")
+        except apsw.Error as exc:
+            log.error("Group commit of %s writes failed", len(batch), exc_info=exc)
+            if not connection.getautocommit():
+                connection.execute("ROLLBACK")
+            results = [(job, None, exc) for job, _, _ in results]
+        for job, result, exc in results:
+            loop.call_soon_threadsafe(_resolve, job.future, result, exc)
+
+    async def _run_write(self, func: Callable[[apsw.Connection], Any]):
+        transaction = self._transaction()
+        if transaction is not None:
+            return await self._send(transaction._job, func)
+        future = asyncio.get_event_loop().create_future()
+        self._submit(_Job(func, future))
+        return await future
+
+    async def _send(self, job: _TransactionJob, func: Callable[[apsw.Connection], Any]):
+        future = asyncio.get_event_loop().create_future()
+        if not job.send((func, future)):
+            raise RuntimeError("Transaction is no longer open")
+        return await future
+
+    # Reader
+
+    async def _run_read(self, func: Callable[[apsw.Connection], Any]):
+        transaction = self._transaction()
+        if transaction is not None:  # Reads inside a transaction see its changes
+            return await self._send(transaction._job, func)
+        return await asyncio.get_event_loop().run_in_executor(
+            self._reader_executor, lambda: func(self._reader())
+        )
+
+    # databases compatible API
+
+    async def fetch_all(self, query: str, values: dict = None) -> List[Row]:
+        return await self._run_read(lambda c: _fetch(c, query, values))
+
+    async def fetch_one(self, query: str, values: dict = None) -> Optional[Row]:
+        rows = await self.fetch_all(query, values)
+        return rows[0] if rows else None
+
+    async def fetch_val(self, query: str, values: dict = None, column: Any = 0):
+        row = await self.fetch_one(query, values)
+        return None if row is None else row[column]
+
+    async def execute(self, query: str, values: dict = None) -> int:
+        return await self._run_write(lambda c: _execute(c, query, values))
+
+    async def execute_many(self, query: str, values: Iterable[dict]):
+        values = list(values)
+        return await self._run_write(lambda c: _execute_many(c, query, values))
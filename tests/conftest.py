@@ -0,0 +1,13 @@
+import importlib.util
+import pathlib
+import sys
+
+# The cog is loaded by Red as a package named after its folder, import the checkout the same way.
+ROOT = pathlib.Path(__file__).resolve().parents[1]
+if "fakemoncord" not in sys.modules:
+    spec = importlib.util.spec_from_file_location(
+        "fakemoncord", ROOT / "__init__.py", submodule_search_locations=[str(ROOT)]
+    )
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["fakemoncord"] = module
+    spec.loader.exec_module(module)
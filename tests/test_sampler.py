@@ -0,0 +1,41 @@
+import math
+import random
+from collections import Counter
+from pathlib import Path
+
+from fakemoncord.catalog import build_catalog
+from fakemoncord.sampler import AliasSampler
+
+DATAPATH = Path(__file__).resolve().parents[1] / "data"
+DRAWS = 100_000
+
+
+def _chi_square(sampler: AliasSampler, draws: int, seed: int):
+    sampler._random = random.Random(seed).random
+    counts = Counter(sampler.sample(draws))
+    total = sum(sampler.weights)
+    statistic = 0.0
+    buckets = 0
+    for item, weight in zip(sampler.items, sampler.weights):
+        if weight == 0:
+            assert counts[item] == 0
+            continue
+        expected = weight / total * draws
+        statistic += (counts[item] - expected) ** 2 / expected
+        buckets += 1
+    return statistic, buckets - 1
+
+
+def test_spawn_distribution_matches_weights():
+    species = build_catalog(str(DATAPATH)).species
+    sampler = AliasSampler(species, [x.spawnchance for x in species])
+    statistic, freedom = _chi_square(sampler, DRAWS, seed=1234)
+    # Far beyond the 99.99th percentile of the chi-square distribution.
+    assert statistic < freedom + 6 * math.sqrt(2 * freedom)
+
+
+def test_skewed_weights():
+    weights = [0, 1, 2, 5, 10, 50, 100, 0.5, 1000, 3]
+    sampler = AliasSampler(range(len(weights)), weights)
+    statistic, freedom = _chi_square(sampler, DRAWS, seed=99)
+    assert statistic < freedom + 6 * math.sqrt(2 * freedom)
@@ -0,0 +1,84 @@
+import asyncio
+import concurrent.futures
+import threading
+from unittest import mock
+
+import pytest
+
+from fakemoncord import storage
+from fakemoncord.storage import Storage
+
+
+async def _open(tmp_path) -> Storage:
+    db = Storage(str(tmp_path / "test.db"), executor=concurrent.futures.ThreadPoolExecutor(1))
+    await db.connect()
+    await db.execute("CREATE TABLE t (x INTEGER)")
+    return db
+
+
+def _end_transaction(connection):
+    # What SQLite does by itself on SQLITE_FULL, SQLITE_IOERR or SQLITE_NOMEM.
+    connection.execute("ROLLBACK")
+    raise RuntimeError("disk full")
+
+
+async def _job_that_ends_the_transaction(tmp_path):
+    db = await _open(tmp_path)
+    results = await asyncio.gather(
+        db.execute("INSERT INTO t VALUES (1)"),
+        db._run_write(_end_transaction),
+        return_exceptions=True,
+    )
+    assert all(isinstance(result, Exception) for result in results)
+    await asyncio.wait_for(db.execute("INSERT INTO t VALUES (2)"), 5)
+    assert await db.fetch_all("SELECT x FROM t") == [(2,)]
+    await db.disconnect()
+
+
+async def _timed_out_transaction(tmp_path):
+    db = await _open(tmp_path)
+    with mock.patch.object(storage, "TRANSACTION_TIMEOUT", 0.1):
+        with pytest.raises(TimeoutError):
+            async with db.transaction():
+                await db.execute("INSERT INTO t VALUES (1)")
+                await asyncio.sleep(0.3)
+                with pytest.raises(RuntimeError):
+                    await asyncio.wait_for(db.execute("INSERT INTO t VALUES (2)"), 5)
+    await asyncio.wait_for(db.execute("INSERT INTO t VALUES (3)"), 5)
+    assert await db.fetch_all("SELECT x FROM t") == [(3,)]
+    await db.disconnect()
+
+
+async def _aborted_batch_with_open_transaction(tmp_path):
+    db = await _open(tmp_path)
+    release = threading.Event()
+    blocker = asyncio.ensure_future(db._run_write(lambda c: release.wait(5)))
+    await asyncio.sleep(0.1)
+
+    async def transfer():
+        async with db.transaction():
+            await db.execute("INSERT INTO t VALUES (1)")
+
+    # Both are queued behind the blocker, so they land in the same batch.
+    aborted = asyncio.ensure_future(db._run_write(_end_transaction))
+    queued = asyncio.ensure_future(transfer())
+    await asyncio.sleep(0)
+    release.set()
+    await blocker
+    results = await asyncio.wait_for(asyncio.gather(aborted, queued, return_exceptions=True), 5)
+    assert all(isinstance(result, Exception) for result in results)
+    await asyncio.wait_for(db.execute("INSERT INTO t VALUES (2)"), 5)
+    assert await db.fetch_all("SELECT x FROM t") == [(2,)]
+    await db.disconnect()
+
+
+def test_writer_recovers_when_a_job_ends_the_transaction(tmp_path):
+    asyncio.run(_job_that_ends_the_transaction(tmp_path))
+
+
+def test_statements_after_a_timed_out_transaction_fail(tmp_path):
+    asyncio.run(_timed_out_transaction(tmp_path))
+
+
+def test_transaction_in_an_aborted_batch_fails(tmp_path):
+    asyncio.run(_aborted_batch_with_open_transaction(tmp_path))
@@ -0,0 +1,76 @@
+import asyncio
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from fakemoncord import fakemoncord as cogmodule
+from fakemoncord import trading
+from fakemoncord.bench import FakeBot, FakeConfig, FakeGuild, FakeMember, seed
+from fakemoncord.statements import TRANSFER_POKEMON
+from fakemoncord.trades import ACCEPT, TradeOffer
+
+
+class FakeBank:
+    def __init__(self, balances: dict):
+        self.balances = balances
+
+    async def withdraw_credits(self, member, amount: int):
+        if self.balances[member.id] < amount:
+            raise ValueError("Insufficient funds")
+        self.balances[member.id] -= amount
+
+    async def deposit_credits(self, member, amount: int):
+        self.balances[member.id] += amount
+
+    async def get_currency_name(self, guild=None) -> str:
+        return "credits"
+
+
+async def _failed_transfer(tmp_path: Path):
+    bot = FakeBot()
+    with mock.patch.object(cogmodule, "Config", FakeConfig), mock.patch.object(
+        cogmodule, "cog_data_path", lambda *_args, **_kwargs: tmp_path
+    ):
+        cog = cogmodule.Fakemoncord(bot)
+    await cog.initalize()
+    try:
+        guild = FakeGuild(1)
+        seller, buyer = FakeMember(guild), FakeMember(guild)
+        members = {seller.id: seller, buyer.id: buyer}
+        guild.get_member = members.get
+        await seed(cog, [seller], 3)
+        pokemon = await cog.fetch_slot(seller.id, 2)
+        channel = guild.channels[0]
+        offer = TradeOffer(channel.id, seller.id, buyer.id, pokemon.message_id, price=40)
+        offer.state = ACCEPT
+        await cog.save_trade(offer)
+
+        execute = cog.cursor.execute
+
+        async def failing_execute(query, values=None):
+            if query == TRANSFER_POKEMON:
+                raise RuntimeError("disk I/O error")
+            return await execute(query=query, values=values)
+
+        bank = FakeBank({seller.id: 0, buyer.id: 100})
+        with mock.patch.object(trading, "bank", bank), mock.patch.object(
+            cog.cursor, "execute", failing_execute
+        ):
+            with pytest.raises(RuntimeError):
+                await cog.complete_trade(offer, channel)
+
+        assert bank.balances == {seller.id: 0, buyer.id: 100}
+        assert await cog.count_pokemon(seller.id) == 3
+        assert await cog.count_pokemon(buyer.id) == 0
+        assert (await cog.fetch_slot(seller.id, 2)).message_id == pokemon.message_id
+    finally:
+        cog.stop_spawn_loop()
+        cog.xp_flush_task.cancel()
+        cog.spawn_table_task.cancel()
+        cog.migrations.stop()
+        await cog.close()
+
+
+def test_failed_transfer_refunds_buyer(tmp_path):
+    asyncio.run(_failed_transfer(tmp_path))
@@ -0,0 +1,136 @@
+import time
+from typing import Dict, Optional, Tuple
+
+# Trade states, each waiting on one trainer's reply in the trade's channel.
+CONFIRM = "confirm"  # The seller confirms the Pokémon they picked
+PRICE = "price"  # The seller names their price
+ACCEPT = "accept"  # The buyer accepts or declines
+
+TIMEOUTS = {CONFIRM: 20, PRICE: 20, ACCEPT: 30}
+
+
+class TradeOffer:
+    __slots__ = (
+        "id",
+        "channel_id",
+        "seller_id",
+        "buyer_id",
+        "message_id",
+        "price",
+        "state",
+        "expires",
+        "timer",
+    )
+
+    def __init__(
+        self,
+        channel_id: int,
+        seller_id: int,
+        buyer_id: int,
+        message_id: int,
+        *,
+        id: int = None,
+        price: int = 0,
+        state: str = CONFIRM,
+        expires: float = None,
+    ):
+        self.id = id
+        self.channel_id = channel_id
+        self.seller_id = seller_id
+        self.buyer_id = buyer_id
+        self.message_id = message_id
+        self.price = price
+        self.state = state
+        self.expires = time.time() + TIMEOUTS[state] if expires is None else expires
+        self.timer = None
+
+    @classmethod
+    def from_row(cls, row) -> "TradeOffer":
+        return cls(
+            row["channel_id"],
+            row["seller_id"],
+            row["buyer_id"],
+            row["message_id"],
+            id=row["id"],
+            price=row["price"],
+            state=row["state"],
+            expires=row["expires"],
+        )
+
+    @property
+    def responder_id(self) -> int:
+        """The trainer whose reply the offer is waiting on."""
+        return self.buyer_id if self.state == ACCEPT else self.seller_id
+
+    @property
+    def key(self) -> Tuple[int, int]:
+        return self.channel_id, self.responder_id
+
+    def to_values(self) -> dict:
+        return {
+            "id": self.id,
+            "channel_id": self.channel_id,
+            "seller_id": self.seller_id,
+            "buyer_id": self.buyer_id,
+            "message_id": self.message_id,
+            "price": self.price,
+            "state": self.state,
+            "expires": self.expires,
+        }
+
+
+class TradeBook:
+    """Open trade offers, keyed by the channel and trainer they wait on.
+
+    A message is matched to its offer with a single dict lookup, so open
+    trades cost nothing for unrelated messages. A trainer can only be
+    asked one thing per channel at a time."""
+
+    def __init__(self):
+        self._offers: Dict[Tuple[int, int], TradeOffer] = {}
+
+    def __len__(self):
+        return len(self._offers)
+
+    def get(self, channel_id: int, user_id: int) -> Optional[TradeOffer]:
+        return self._offers.get((channel_id, user_id))
+
+    def busy(self, channel_id: int, *user_ids: int) -> bool:
+        """Whether any of the trainers already has a trade to answer in the channel."""
+        return any((channel_id, user_id) in self._offers for user_id in user_ids)
+
+    def add(self, offer: TradeOffer) -> bool:
+        if offer.key in self._offers:
+            return False
+        self._offers[offer.key] = offer
+        return True
+
+    def advance(self, offer: TradeOffer, state: str) -> bool:
+        """Move an offer to its next state and restart its expiry.
+
+        Fails, leaving the offer as it was, if the new responder is busy."""
+        old_key = offer.key
+        old_state = offer.state
+        offer.state = state
+        if offer.key != old_key and offer.key in self._offers:
+            offer.state = old_state
+            return False
+        del self._offers[old_key]
+        self._offers[offer.key] = offer
+        offer.expires = time.time() + TIMEOUTS[state]
+        return True
+
+    def clear(self):
+        """Forget every offer and stop their expiry timers, they stay persisted."""
+        for offer in self._offers.values():
+            if offer.timer is not None:
+                offer.timer.cancel()
+                offer.timer = None
+        self._offers.clear()
+
+    def remove(self, offer: TradeOffer):
+        if self._offers.get(offer.key) is offer:
+            del self._offers[offer.key]
+        if offer.timer is not None:
+            offer.timer.cancel()
+            offer.timer = None
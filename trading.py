@@ -1,144 +1,276 @@
-import asyncio
-import json
+import logging
+import time
+from typing import Optional
 
 import discord
 import tabulate
-from redbot.core import bank
+from redbot.core import bank, commands
 from redbot.core.errors import BalanceTooHigh
 from redbot.core.i18n import Translator
 from redbot.core.utils.chat_formatting import *
-from redbot.core.utils.predicates import MessagePredicate
 
 from .abc import MixinMeta
-from .pokemixin import poke
+from .catalog import Pokemon
+from .pokemixin import collection_ready, poke
 from .statements import *
+from .trades import ACCEPT, CONFIRM, PRICE, TradeOffer
+
+log = logging.getLogger("red.flare.fakemoncord.trading")
 
 _ = Translator("Fakemoncord", __file__)
 
 
+def _yes_or_no(content: str) -> Optional[bool]:
+    content = content.strip().lower()
+    if content in ("yes", "y"):
+        return True
+    if content in ("no", "n"):
+        return False
+    return None
+
+
 class TradeMixin(MixinMeta):
     """Fakemoncord Trading Commands"""
 
     @poke.command(usage="<user> <pokemon ID>")
+    @collection_ready()
     async def ftrade(self, ctx, user: discord.Member, *, id: int):
         """Fakemoncord Trading
 
         Currently a work in progress."""
         async with ctx.typing():
-            result = await self.cursor.fetch_all(
-                query="""SELECT pokemon, message_id from users where user_id = :user_id""",
-                values={"user_id": ctx.author.id},
-            )
-            pokemons = [None]
-            for data in result:
-                pokemons.append([json.loads(data[0]), data[1]])
+            pokemon = await self.fetch_slot(ctx.author.id, id)
 
-        if not pokemons:
-            return await ctx.send(_("You don't have any Pokémon, trainer!"))
-        if id >= len(pokemons):
+        if pokemon is None:
             return await ctx.send(_("You don't have a Pokémon at that slot."))
-        pokemon = pokemons[id]
-        name = self.get_name(pokemon[0]["name"], ctx.author)
+        name = self.get_name(pokemon.species, ctx.author)
 
+        offer = TradeOffer(ctx.channel.id, ctx.author.id, user.id, pokemon.message_id)
+        if self.trades.busy(ctx.channel.id, user.id) or not self.trades.add(offer):
+            return await ctx.send(
+                _("There's already a trade waiting on you or {user} in this channel.").format(
+                    user=user
+                )
+            )
+        await self.save_trade(offer)
         await ctx.send(
             _(
                 "You are about to trade {name}, if you wish to continue type `yes`, otherwise type `no`."
             ).format(name=name)
         )
-        try:
-            pred = MessagePredicate.yes_or_no(ctx, user=ctx.author)
-            await ctx.bot.wait_for("message", check=pred, timeout=20)
-        except asyncio.TimeoutError:
-            await ctx.send(_("Exiting operation."))
+
+    async def restore_trades(self):
+        """Reopen the trade offers that were waiting on a reply when the cog unloaded."""
+        for data in await self.cursor.fetch_all(SELECT_TRADE_OFFERS):
+            offer = TradeOffer.from_row(data)
+            if offer.expires <= time.time() or not self.trades.add(offer):
+                await self.cursor.execute(query=DELETE_TRADE_OFFER, values={"id": offer.id})
+                continue
+            self.schedule_trade_expiry(offer)
+
+    def schedule_trade_expiry(self, offer: TradeOffer):
+        if offer.timer is not None:
+            offer.timer.cancel()
+        offer.timer = self.bot.loop.call_later(
+            max(offer.expires - time.time(), 0),
+            lambda: self.bot.loop.create_task(self.expire_trade(offer)),
+        )
+
+    async def save_trade(self, offer: TradeOffer):
+        rowid = await self.cursor.execute(query=SAVE_TRADE_OFFER, values=offer.to_values())
+        if offer.id is None:
+            offer.id = rowid
+        self.schedule_trade_expiry(offer)
+
+    async def close_trade(self, offer: TradeOffer):
+        self.trades.remove(offer)
+        await self.cursor.execute(query=DELETE_TRADE_OFFER, values={"id": offer.id})
+
+    async def expire_trade(self, offer: TradeOffer):
+        offer.timer = None
+        if self.trades.get(*offer.key) is not offer:
+            return
+        await self.close_trade(offer)
+        channel = self.bot.get_channel(offer.channel_id)
+        if channel is not None:
+            await channel.send(_("Exiting operation."))
+
+    async def trade_pokemon(self, offer: TradeOffer) -> Optional[Pokemon]:
+        data = await self.cursor.fetch_one(
+            query=SELECT_POKEMON_MESSAGE,
+            values={"user_id": offer.seller_id, "message_id": offer.message_id},
+        )
+        return self.decode_pokemon(data) if data is not None else None
+
+    @commands.Cog.listener("on_message_without_command")
+    async def on_trade_reply(self, message):
+        if message.guild is None or message.author.bot:
+            return
+        offer = self.trades.get(message.channel.id, message.author.id)
+        if offer is None:
             return
+        try:
+            await self.advance_trade(offer, message)
+        except Exception:
+            await self.close_trade(offer)
+            raise
 
-        if pred.result:
-            await ctx.send(
-                _("How many credits would you like to recieve for {name}?").format(name=name)
+    async def advance_trade(self, offer: TradeOffer, message: discord.Message):
+        """Feed a reply from the trainer an offer waits on into its state machine."""
+        channel = message.channel
+        if offer.state == CONFIRM:
+            answer = _yes_or_no(message.content)
+            if answer is None:
+                return
+            if not answer:
+                await self.close_trade(offer)
+                return await channel.send(_("Trade cancelled."))
+            pokemon = await self.trade_pokemon(offer)
+            if pokemon is None:
+                await self.close_trade(offer)
+                return await channel.send(_("You don't have that Pokémon anymore."))
+            self.trades.advance(offer, PRICE)
+            await self.save_trade(offer)
+            await channel.send(
+                _("How many credits would you like to recieve for {name}?").format(
+                    name=self.get_name(pokemon.species, message.author)
+                )
             )
+
+        elif offer.state == PRICE:
             try:
-                amount = MessagePredicate.valid_int(ctx, user=ctx.author)
-                await ctx.bot.wait_for("message", check=amount, timeout=20)
-            except asyncio.TimeoutError:
-                await ctx.send(_("Exiting operation."))
+                price = int(message.content)
+            except ValueError:
+                return
+            if price < 0:
                 return
-            bal = amount.result
-            if not await bank.can_spend(user, amount.result):
-                await ctx.send(
+            buyer = message.guild.get_member(offer.buyer_id)
+            pokemon = await self.trade_pokemon(offer)
+            if buyer is None or pokemon is None:
+                await self.close_trade(offer)
+                return await channel.send(_("Trade cancelled."))
+            currency = await bank.get_currency_name(message.guild)
+            if not await bank.can_spend(buyer, price):
+                await self.close_trade(offer)
+                return await channel.send(
                     _("{user} does not have {amount} {currency} available.").format(
-                        user=user,
-                        amount=amount.result,
-                        currency=await bank.get_currency_name(ctx.guild or None),
+                        user=buyer, amount=price, currency=currency
                     )
                 )
-
-                return
-            await ctx.send(
+            offer.price = price
+            if not self.trades.advance(offer, ACCEPT):
+                await self.close_trade(offer)
+                return await channel.send(
+                    _("There's already a trade waiting on you or {user} in this channel.").format(
+                        user=buyer
+                    )
+                )
+            await self.save_trade(offer)
+            await channel.send(
                 _(
                     "{user}, {author} would like to trade their {pokemon} for {amount} {currency}. Type `yes` to accept, otherwise type `no`."
                 ).format(
-                    user=user.mention,
-                    author=ctx.author,
-                    pokemon=name,
-                    amount=bal,
-                    currency=await bank.get_currency_name(ctx.guild or None),
+                    user=buyer.mention,
+                    author=message.guild.get_member(offer.seller_id),
+                    pokemon=self.get_name(pokemon.species, message.author),
+                    amount=price,
+                    currency=currency,
                 )
             )
 
-            try:
-                authorconfirm = MessagePredicate.yes_or_no(ctx, user=user)
-                await ctx.bot.wait_for("message", check=authorconfirm, timeout=30)
-            except asyncio.TimeoutError:
-                await ctx.send(_("Exiting operation."))
+        elif offer.state == ACCEPT:
+            answer = _yes_or_no(message.content)
+            if answer is None:
                 return
-
-            if authorconfirm.result:
-                await self.cursor.execute(
-                    query="DELETE FROM users where message_id = :message_id",
-                    values={"message_id": pokemon[1]},
-                )
-                await self.cursor.execute(
-                    query=INSERT_POKEMON,
-                    values={
-                        "user_id": user.id,
-                        "message_id": ctx.message.id,
-                        "pokemon": json.dumps(pokemon[0]),
-                    },
+            self.trades.remove(offer)
+            if not answer:
+                await self.close_trade(offer)
+                return await channel.send(
+                    _("{user} has denied the trade request.").format(user=message.author)
                 )
-                userconf = await self.user_is_global(ctx.author)
-                pokeid = await userconf.pokeid()
-                msg = ""
-                if id < pokeid:
-                    msg += _(
-                        "{user}, your default Pokémon may have changed. I have tried to account for this change."
-                    ).format(user=ctx.author)
-                    await userconf.pokeid.set(pokeid - 1)
-                elif id == pokeid:
-                    msg += _(
-                        "{user}, You have traded your selected Pokémon. I have reset your selected Pokémon to your first Pokémon."
-                    ).format(user=user)
-                    await userconf.pokeid.set(1)
-
-                await bank.withdraw_credits(user, bal)
-                try:
-                    await bank.deposit_credits(ctx.author, bal)
-                except BalanceTooHigh as e:
-                    bal = e.max_balance - await bank.get_balance(ctx.author)
-                    bal = _("{balance} (balance too high)").format(balanace=bal)
-                    await bank.set_balance(ctx.author, e.max_balance)
-                lst = [
-                    ["-- {pokemon}".format(pokemon=name), bal],
-                    [_("++ {balance} credits").format(balance=bal), name],
-                ]
-                await ctx.send(
-                    box(tabulate.tabulate(lst, headers=[ctx.author, user]), lang="diff")
-                )
-                if msg:
-                    await ctx.send(msg)
+            await self.complete_trade(offer, channel)
 
-            else:
-                await ctx.send(_("{user} has denied the trade request.").format(user=user))
-                return
+    async def complete_trade(self, offer: TradeOffer, channel: discord.TextChannel):
+        """Charge the buyer, hand the Pokémon over and pay the seller."""
+        seller = channel.guild.get_member(offer.seller_id)
+        buyer = channel.guild.get_member(offer.buyer_id)
+        if seller is None or buyer is None:
+            await self.close_trade(offer)
+            return await channel.send(_("Trade cancelled."))
+        bal = offer.price
+        async with self.userlocks.many(seller.id, buyer.id):
+            try:
+                await bank.withdraw_credits(buyer, bal)
+            except ValueError:
+                await self.close_trade(offer)
+                return await channel.send(
+                    _("{user} does not have {amount} {currency} available.").format(
+                        user=buyer,
+                        amount=bal,
+                        currency=await bank.get_currency_name(channel.guild),
+                    )
+                )
+            # Moving the row, closing the seller's gap and closing the offer commit together.
+            # The credits live outside the database, so they go back if the transaction fails.
+            try:
+                async with self.cursor.transaction():
+                    data = await self.cursor.fetch_one(
+                        query=SELECT_POKEMON_MESSAGE,
+                        values={"user_id": seller.id, "message_id": offer.message_id},
+                    )
+                    if data is not None:
+                        await self.cursor.execute(
+                            query=TRANSFER_POKEMON,
+                            values={
+                                "buyer_id": buyer.id,
+                                "seller_id": seller.id,
+                                "message_id": offer.message_id,
+                            },
+                        )
+                        await self.cursor.execute(
+                            query=SHIFT_POKEMON_SLOTS,
+                            values={"user_id": seller.id, "position": data["position"]},
+                        )
+                        await self.cursor.execute(
+                            query=ADD_GUILD_TRAINER,
+                            values={"guild_id": channel.guild.id, "user_id": buyer.id},
+                        )
+                    await self.cursor.execute(query=DELETE_TRADE_OFFER, values={"id": offer.id})
+            except BaseException:
+                await bank.deposit_credits(buyer, bal)
+                raise
+            if data is None:
+                await bank.deposit_credits(buyer, bal)
+                return await channel.send(_("You don't have that Pokémon anymore."))
+            pokemon = self.decode_pokemon(data)
+            name = self.get_name(pokemon.species, seller)
+            id = pokemon.slot
+            userconf = await self.user_is_global(seller)
+            pokeid = await userconf.pokeid()
+            msg = ""
+            if id < pokeid:
+                msg += _(
+                    "{user}, your default Pokémon may have changed. I have tried to account for this change."
+                ).format(user=seller)
+                await userconf.pokeid.set(pokeid - 1)
+                self.usercache.update(seller.id, pokeid=pokeid - 1)
+            elif id == pokeid:
+                msg += _(
+                    "{user}, You have traded your selected Pokémon. I have reset your selected Pokémon to your first Pokémon."
+                ).format(user=buyer)
+                await userconf.pokeid.set(1)
+                self.usercache.update(seller.id, pokeid=1)
 
-        else:
-            await ctx.send(_("Trade cancelled."))
+        try:
+            await bank.deposit_credits(seller, bal)
+        except BalanceTooHigh as e:
+            bal = e.max_balance - await bank.get_balance(seller)
+            bal = _("{balance} (balance too high)").format(balance=bal)
+            await bank.set_balance(seller, e.max_balance)
+        lst = [
+            ["-- {pokemon}".format(pokemon=name), bal],
+            [_("++ {balance} credits").format(balance=bal), name],
+        ]
+        await channel.send(box(tabulate.tabulate(lst, headers=[seller, buyer]), lang="diff"))
+        if msg:
+            await channel.send(msg)
@@ -0,0 +1,53 @@
+from typing import Dict, Optional
+
+import discord
+
+
+class PendingExperience:
+    """Experience ticks earned by a single trainer since the last flush."""
+
+    __slots__ = ("user", "channel", "ticks")
+
+    def __init__(self, user: discord.Member, channel: discord.TextChannel):
+        self.user = user
+        self.channel = channel
+        self.ticks = 0
+
+
+class ExperienceBuffer:
+    """In-memory accumulator for message experience.
+
+    Feeding the buffer never awaits, the cog's flusher drains it periodically
+    and applies the accumulated ticks in bulk. The cooldown is tracked here
+    too, a trainer is forgotten once their cooldown is over."""
+
+    def __init__(self, cooldown: int = 10, max_pending: int = 500):
+        self.cooldown = cooldown
+        self.max_pending = max_pending
+        self._pending: Dict[int, PendingExperience] = {}
+        self._last: Dict[int, float] = {}
+
+    def __len__(self):
+        return len(self._pending)
+
+    @property
+    def full(self) -> bool:
+        return len(self._pending) >= self.max_pending
+
+    def add(self, user, channel, now: float) -> bool:
+        """Record a tick for a user, returns False while the user is on cooldown."""
+        if now - self._last.get(user.id, 0) < self.cooldown:
+            return False
+        self._last[user.id] = now
+        entry: Optional[PendingExperience] = self._pending.get(user.id)
+        if entry is None:
+            entry = self._pending[user.id] = PendingExperience(user, channel)
+        entry.channel = channel
+        entry.ticks += 1
+        return True
+
+    def drain(self, now: float) -> Dict[int, PendingExperience]:
+        pending, self._pending = self._pending, {}
+        cutoff = now - self.cooldown
+        self._last = {user_id: last for user_id, last in self._last.items() if last > cutoff}
+        return pending